@@ -1,8 +1,10 @@
 # src/Preprocessor.py
 
 import os
+import re
 import zipfile
 import requests
+import numpy as np
 import pandas as pd
 import joblib
 
@@ -12,6 +14,9 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import classification_report
 
+import feature_store
+from feature_store import GEO_COLUMNS
+
 # ─── 1) Download & extract ─────────────────────────────────────────────────────
 data_dir    = "data"
 zip_path    = os.path.join(data_dir, "gpx-hike-tracks.zip")
@@ -20,10 +25,11 @@ download_url = "https://www.kaggle.com/api/v1/datasets/download/roccoli/gpx-hike
 os.makedirs(data_dir, exist_ok=True)
 if not os.path.exists(zip_path):
     print("Downloading dataset...")
-    r = requests.get(download_url, allow_redirects=True)
-    r.raise_for_status()
-    with open(zip_path, "wb") as f:
-        f.write(r.content)
+    with requests.get(download_url, allow_redirects=True, stream=True) as r:
+        r.raise_for_status()
+        with open(zip_path, "wb") as f:
+            for block in r.iter_content(chunk_size=1024 * 1024):
+                f.write(block)
     print("Download complete.")
 
 print("Extracting files...")
@@ -33,47 +39,18 @@ print("Extraction complete.")
 
 csv_path = os.path.join(data_dir, "gpx-tracks-from-hikr.org.csv")
 
-# ─── 2) Load & clean ────────────────────────────────────────────────────────────
-df = pd.read_csv(csv_path)
-
-# Basic dropna on essential timestamp columns
-df = df.dropna(subset=["start_time", "end_time"])
-
-# Remove zero-length or zero-duration tracks
-df = df[df["start_time"] != df["end_time"]]
-df = df[df["length_3d"]  != 0]
-df = df[df["moving_time"] != 0]
-
-# Parse times
-df["start_time"] = pd.to_datetime(df["start_time"], errors="coerce")
-df["end_time"]   = pd.to_datetime(df["end_time"],   errors="coerce")
-
-# Compute derived columns
-df["duration"]   = df["moving_time"]  # seconds moving
-df["break_time"] = (df["end_time"] - df["start_time"]).dt.total_seconds() - df["moving_time"]
-df["speed"]      = df["length_3d"] / df["duration"]
-
-# Filter outliers
-df = df[df["break_time"] >= 0]
-df = df[df["break_time"] < 1.5 * df["duration"]]
-df = df[df["speed"] < 5]
-
-# ─── 3) Select features + keep 'name' metadata ─────────────────────────────────
-# Ensure your CSV has a 'name' column; if not, derive it here.
-# e.g. df["name"] = df["filename"].str.replace(".gpx","").str.replace("_"," ").str.title()
-selected = df[[
-    "name",           # preserve for later lookup
-    "duration",
-    "length_3d",
-    "min_elevation",
-    "max_elevation",
-    "uphill",
-    "downhill",
-    "break_time"
-]]
-
-# ─── 4) Drop rows with any missing numeric data ────────────────────────────────
-selected = selected.dropna(subset=[
+# ─── 2) Stream, clean & filter chunk by chunk ──────────────────────────────────
+# The CSV is never loaded whole: it is read CHUNK_ROWS rows at a time with
+# compact dtypes, every filter runs on the chunk, the scaler is fitted
+# incrementally and the surviving rows are appended to a feature store table,
+# one record batch per chunk (see feature_store.py). The raw 'gpx' column is
+# only read to take each track's start point and bounding box and is dropped
+# right after, which is why chunks are smaller than the numeric columns alone
+# would need.
+CHUNK_ROWS    = 20_000
+FEATURES_PATH = os.path.join(data_dir, "features.arrow")
+
+FEATURE_COLS = [
     "duration",
     "length_3d",
     "min_elevation",
@@ -81,41 +58,147 @@ selected = selected.dropna(subset=[
     "uphill",
     "downhill",
     "break_time"
-])
+]
+
+CSV_DTYPES = {
+    "name":          "string",
+    "start_time":    "string",
+    "end_time":      "string",
+    "length_3d":     "float32",
+    "moving_time":   "float32",
+    "min_elevation": "float32",
+    "max_elevation": "float32",
+    "uphill":        "float32",
+    "downhill":      "float32",
+    "difficulty":    "category",
+    "gpx":           "string",
+}
+
+STORE_DTYPES = {
+    "name": "string",
+    **{c: "float32" for c in FEATURE_COLS},
+    "difficulty": "int8",
+    **{c: "float64" for c in GEO_COLUMNS},
+}
+
+# lat="..." / lon="..." of every track (or route) point, in either order
+POINT_LAT = re.compile(r'<(?:trkpt|rtept)\b[^>]*?\blat="([^"]+)"')
+POINT_LON = re.compile(r'<(?:trkpt|rtept)\b[^>]*?\blon="([^"]+)"')
+
+
+def track_geometry(gpx):
+    """Start point and bounding box (GEO_COLUMNS order) of a GPX document; NaN if it has no points."""
+    if not isinstance(gpx, str):
+        return [np.nan] * len(GEO_COLUMNS)
+    lat = np.array(POINT_LAT.findall(gpx), dtype=np.float64)
+    lon = np.array(POINT_LON.findall(gpx), dtype=np.float64)
+    if lat.size == 0 or lat.size != lon.size:
+        return [np.nan] * len(GEO_COLUMNS)
+    return [lat[0], lon[0], lat.min(), lon.min(), lat.max(), lon.max()]
+
+
+def clean_chunk(df):
+    """Apply the cleaning and outlier filters to one chunk of the CSV."""
+    # Basic dropna on essential timestamp columns
+    df = df.dropna(subset=["start_time", "end_time"])
+
+    # Remove zero-length or zero-duration tracks
+    df = df[
+        (df["start_time"] != df["end_time"])
+        & (df["length_3d"] != 0)
+        & (df["moving_time"] != 0)
+    ]
+
+    # Parse times
+    start = pd.to_datetime(df["start_time"], errors="coerce")
+    end   = pd.to_datetime(df["end_time"],   errors="coerce")
+
+    # Compute derived columns
+    df = df.assign(
+        duration=df["moving_time"],  # seconds moving
+        break_time=((end - start).dt.total_seconds() - df["moving_time"]).astype("float32"),
+    )
+    speed = df["length_3d"] / df["duration"]
+
+    # Filter outliers
+    df = df[
+        (df["break_time"] >= 0)
+        & (df["break_time"] < 1.5 * df["duration"])
+        & (speed < 5)
+    ]
+
+    # ─── 3) Drop rows with any missing numeric data ────────────────────────────
+    df = df.dropna(subset=FEATURE_COLS)
+
+    # ─── 4) Label: difficulty "T<n> - ..." -> n ─────────────────────────────────
+    df = df.assign(difficulty=df["difficulty"].astype(str).str[1].astype("int8"))
+
+    # ─── 5) Where the hike is; the raw GPX itself is not kept ──────────────────
+    geometry = pd.DataFrame(
+        [track_geometry(gpx) for gpx in df["gpx"].tolist()], columns=GEO_COLUMNS, index=df.index
+    )
+    return pd.concat([df.drop(columns="gpx"), geometry], axis=1)
 
-# ─── 5) Prepare X, y for training (drop 'name') ────────────────────────────────
-X = selected.drop(columns=["name"])
-y = df.loc[selected.index, "difficulty"].str[1].astype(int)
 
-# ─── 6) Scale & split ──────────────────────────────────────────────────────────
 scaler = MinMaxScaler()
-X_scaled = scaler.fit_transform(X)
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X_scaled, y,
+with feature_store.TableWriter(FEATURES_PATH, parquet=False) as store:
+    for chunk in pd.read_csv(csv_path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES,
+                             chunksize=CHUNK_ROWS):
+        chunk = clean_chunk(chunk)
+        if chunk.empty:
+            continue
+        scaler.partial_fit(chunk[FEATURE_COLS].astype("float64"))
+        store.append(chunk[list(STORE_DTYPES)].astype(STORE_DTYPES))
+print(f"Cleaned {store.rows} rows into {FEATURES_PATH}")
+
+# ─── 6) Prepare y and split ('name' stays in the store) ───────────────────────
+y = feature_store.read_columns(FEATURES_PATH, ["difficulty"])["difficulty"]
+
+train_idx, test_idx = train_test_split(
+    np.arange(store.rows),
     test_size=0.2,
     random_state=42,
     stratify=y
 )
-
-# ─── 7) Train model ─────────────────────────────────────────────────────────────
+train_idx, test_idx = np.sort(train_idx), np.sort(test_idx)
+
+
+# ─── 7) Scale only the rows each side needs, gathered chunk by chunk ──────────
+def gather_scaled(rows):
+    """Scaled FEATURE_COLS of the (sorted) store rows, read one stored chunk at a time."""
+    out = np.empty((rows.size, len(FEATURE_COLS)), dtype=np.float32)
+    for first, columns in feature_store.iter_chunks(FEATURES_PATH, FEATURE_COLS):
+        start, stop = np.searchsorted(rows, [first, first + len(columns[FEATURE_COLS[0]])])
+        if start == stop:
+            continue
+        # The CSV's values are float32, which the float64 store holds exactly
+        block = pd.DataFrame({
+            c: columns[c][rows[start:stop] - first].astype(np.float32) for c in FEATURE_COLS
+        })
+        out[start:stop] = scaler.transform(block)
+    return out
+
+
+# ─── 8) Train model ─────────────────────────────────────────────────────────────
 model = AdaBoostClassifier(
     estimator=DecisionTreeClassifier(max_depth=1),
     n_estimators=50,
     random_state=42
 )
-model.fit(X_train, y_train)
+model.fit(gather_scaled(train_idx), y[train_idx])
 
 # Evaluate
-y_pred = model.predict(X_test)
-print(classification_report(y_test, y_pred))
+y_pred = model.predict(gather_scaled(test_idx))
+print(classification_report(y[test_idx], y_pred))
 
-# ─── 8) Persist artifacts ──────────────────────────────────────────────────────
+# ─── 9) Persist artifacts ──────────────────────────────────────────────────────
 os.makedirs("model", exist_ok=True)
 joblib.dump(model,    "model/difficulty_nn.pkl")
 joblib.dump(scaler,   "model/difficulty_scaler.pkl")
 
-# Save the full DataFrame (with 'name') for lookup in your API pipeline
-joblib.dump(selected, "model/df_raw.pkl")
-
+# The cleaned table (with 'name' and the GEO_COLUMNS) lives in data/features.arrow,
+# readable with feature_store.read_columns / read_frame instead of a pickled
+# DataFrame; `python src/feature_store.py data/features.arrow` publishes it as
+# the Arrow/Parquet hike table. model/df_raw.pkl is no longer written: nothing
+# loads it (the backend's hike names come from the catalogue's 'name' column)
 print("Preprocessing complete and artifacts saved to /model.")
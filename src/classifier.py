@@ -5,31 +5,24 @@ from sklearn.cluster import KMeans
 from sklearn.neighbors import NearestNeighbors
 import joblib
 
+import feature_store
+
 # ------------------------------------------------------------------
 # CONFIGURATION
 # ------------------------------------------------------------------
-CSV_PATH = os.path.join("data", "output.csv")
+CSV_PATH = feature_store.CSV_PATH
 ARTIFACT_DIR = "model"
 os.makedirs(ARTIFACT_DIR, exist_ok=True)
 
-# If you ever change the column order inside output.csv,
-# update this list to match it exactly.
-FEATURES = [
-    "length_3d",
-    "min_elevation",
-    "max_elevation",
-    "uphill",
-    "downhill",
-    "break_time",
-    "duration"
-]
+# Column order is fixed by the feature store (see feature_store.py)
+FEATURES = feature_store.FEATURES
 
 # Paths for serialized difficulty artifacts
 DIFF_SCALER_PATH = os.path.join(ARTIFACT_DIR, "difficulty_scaler.pkl")
 DIFF_KMEANS_PATH = os.path.join(ARTIFACT_DIR, "difficulty_kmeans.pkl")
 DIFF_MAP_PATH    = os.path.join(ARTIFACT_DIR, "difficulty_cluster_map.pkl")
 DIFF_NN_PATH     = os.path.join(ARTIFACT_DIR, "difficulty_nn.pkl")
-DIFF_DF_RAW_PATH = os.path.join(ARTIFACT_DIR, "difficulty_df_raw.pkl")
+DIFF_CATALOGUE_PATH = os.path.join(ARTIFACT_DIR, "difficulty_catalogue.arrow")
 
 
 def train_model(csv_path: str = CSV_PATH, n_clusters: int = 3):
@@ -37,8 +30,12 @@ def train_model(csv_path: str = CSV_PATH, n_clusters: int = 3):
     Train KMeans clustering and a 5-NN model on hike features,
     then serialize all artifacts to disk.
     """
-    # Load data
-    df = pd.read_csv(csv_path)
+    # Load only the feature columns (plus the hike names and where each
+    # hike is, if the store has them, so the catalogue can name its hikes
+    # and answer "near me" queries) from the store
+    store = feature_store.ensure_store(csv_path)
+    extras = [c for c in ["name", *feature_store.GEO_COLUMNS] if c in feature_store.column_names(store)]
+    df = feature_store.read_frame(store, FEATURES + extras)
 
     # Fit scaler
     scaler = MinMaxScaler()
@@ -63,14 +60,14 @@ def train_model(csv_path: str = CSV_PATH, n_clusters: int = 3):
     joblib.dump(kmeans, DIFF_KMEANS_PATH)
     joblib.dump(cluster_map, DIFF_MAP_PATH)
     joblib.dump(nn, DIFF_NN_PATH)
-    joblib.dump(df.reset_index(drop=True), DIFF_DF_RAW_PATH)
+    feature_store.write_table(df, DIFF_CATALOGUE_PATH, parquet=False)
 
     print("Saved difficulty artifacts to model folder:")
     print(f"  Scaler -> {DIFF_SCALER_PATH}")
     print(f"  KMeans -> {DIFF_KMEANS_PATH}")
     print(f"  Map    -> {DIFF_MAP_PATH}")
     print(f"  5NN    -> {DIFF_NN_PATH}")
-    print(f"  RawDF  -> {DIFF_DF_RAW_PATH}")
+    print(f"  Hikes  -> {DIFF_CATALOGUE_PATH}")
 
     return {
         "scaler":      scaler,
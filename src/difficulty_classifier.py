@@ -4,13 +4,14 @@ from sklearn.preprocessing import MinMaxScaler
 from sklearn.cluster import KMeans
 import joblib
 
+import feature_store
+
 # ------------------------------------------------------------------
 # CONFIGURATION
 # ------------------------------------------------------------------
-CSV_PATH = os.path.join("data", "output.csv")
+CSV_PATH = feature_store.CSV_PATH
 
-# If you ever change the column order inside output.csv,
-# update this list to match it exactly.
+# Order the scaler is fitted in; the store projects the columns for us
 FEATURES = [
     "duration",
     "length_3d",
@@ -24,7 +25,7 @@ FEATURES = [
 from sklearn.neighbors import NearestNeighbors     # NEW import
 
 def train_model(csv_path: str = CSV_PATH, n_clusters: int = 3):
-    df = pd.read_csv(csv_path)
+    df = feature_store.read_frame(feature_store.ensure_store(csv_path), FEATURES)
     scaler = MinMaxScaler()
     X_scaled = scaler.fit_transform(df[FEATURES])
 
@@ -0,0 +1,320 @@
+# src/feature_store.py
+
+"""
+Columnar feature store for the cleaned hike table.
+
+The table is written with a fixed column order (FEATURES, as float64,
+optionally followed by 'name', 'cluster' and other extras), as:
+
+  <name>.arrow    Arrow IPC / Feather v2, uncompressed. Read through a
+                  memory map, so projected numeric columns become NumPy
+                  arrays without copying or parsing anything.
+  <name>.parquet  compressed copy for other tools and long-term storage.
+
+write_table() writes a whole table as one record batch. TableWriter streams
+one chunk at a time (a record batch and a Parquet row group per chunk),
+which is how Preprocessor.py cleans the raw dataset without holding it.
+append_rows() never rewrites what is there: the new rows become a fragment,
+<name>.NNNNN.arrow (and .parquet) next to the table, with the table's
+schema. Readers see the table followed by its fragments. compact() folds
+the fragments back into a single file, and so does any full rewrite.
+
+Training scripts and the backend load only the columns they need from here
+instead of re-parsing data/output.csv or unpickling whole DataFrames.
+
+The training scripts call ensure_store(), which imports data/output.csv on
+first use. To build it explicitly, from the CSV or from the table
+Preprocessor.py writes:
+
+  python src/feature_store.py data/output.csv
+  python src/feature_store.py data/features.arrow
+"""
+
+import argparse
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+STORE_DIR  = "data"
+CSV_PATH   = os.path.join(STORE_DIR, "output.csv")
+HIKES_PATH = os.path.join(STORE_DIR, "hikes.arrow")
+
+# Canonical column order (DIFF_FEATURES in the backend)
+FEATURES = [
+    "length_3d",
+    "min_elevation",
+    "max_elevation",
+    "uphill",
+    "downhill",
+    "break_time",
+    "duration"
+]
+
+# Inputs of the duration model in timeRegression.py
+TIME_FEATURES = FEATURES[:5]
+
+# Where a hike is (degrees, WGS84): start point and bounding box of the
+# track, kept by Preprocessor.py when the source data has the raw GPX
+GEO_COLUMNS = [
+    "start_lat",
+    "start_lon",
+    "min_lat",
+    "min_lon",
+    "max_lat",
+    "max_lon"
+]
+
+
+def _normalize(df):
+    """FEATURES first (as float64), then any extra columns in their existing order."""
+    missing = [c for c in FEATURES if c not in df.columns]
+    if missing:
+        raise ValueError(f"Table is missing feature columns {missing}")
+
+    extras = [c for c in df.columns if c not in FEATURES]
+    df = df[FEATURES + extras].reset_index(drop=True)
+    return df.astype({c: np.float64 for c in FEATURES})
+
+
+def _sibling(path, ext):
+    return os.path.splitext(path)[0] + ext
+
+
+def fragment_paths(path=HIKES_PATH):
+    """The appended fragments of a table, in append order."""
+    stem = os.path.splitext(path)[0]
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r"\.\d{5}\.arrow$")
+    return sorted(
+        f for f in glob.glob(glob.escape(stem) + ".*.arrow")
+        if pattern.match(os.path.basename(f))
+    )
+
+
+def table_files(path=HIKES_PATH):
+    """The Arrow files making up a table: the table itself, then its fragments."""
+    return [path, *fragment_paths(path)]
+
+
+def _write_arrow(table, path):
+    # Written aside and renamed into place: readers that memory-mapped the
+    # old file keep a valid mapping, new readers see the complete new one
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+
+def _write_parquet(table, path):
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _drop_fragments(path):
+    for fragment in fragment_paths(path):
+        os.remove(fragment)
+        if os.path.exists(_sibling(fragment, ".parquet")):
+            os.remove(_sibling(fragment, ".parquet"))
+
+
+def write_table(df, path=HIKES_PATH, parquet=True):
+    """
+    Write a whole hike table, replacing the old one and its fragments.
+    Returns the path of the .arrow file.
+    """
+    table = pa.Table.from_pandas(_normalize(df), preserve_index=False).combine_chunks()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _write_arrow(table, path)
+    if parquet:
+        _write_parquet(table, _sibling(path, ".parquet"))
+    _drop_fragments(path)
+    return path
+
+
+class TableWriter:
+    """
+    Write a hike table chunk by chunk without holding it in memory. The
+    first chunk fixes the columns and types; every chunk becomes one
+    record batch (and one Parquet row group). The files appear, replacing
+    the old table and its fragments, on close().
+    """
+
+    def __init__(self, path=HIKES_PATH, parquet=True):
+        self.path    = path
+        self.parquet = parquet
+        self.rows    = 0
+        self.schema  = None
+        self._arrow = self._parquet = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def append(self, df):
+        table = pa.Table.from_pandas(_normalize(df), schema=self.schema, preserve_index=False)
+        if self.schema is None:
+            self.schema = table.schema
+            self._arrow = pa.ipc.new_file(self.path + ".tmp", self.schema)
+            if self.parquet:
+                self._parquet = pq.ParquetWriter(_sibling(self.path, ".parquet") + ".tmp", self.schema)
+        for batch in table.to_batches():
+            self._arrow.write_batch(batch)
+        if self._parquet is not None:
+            self._parquet.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self.schema is None:
+            raise ValueError(f"No rows were written to {self.path}")
+        self._arrow.close()
+        os.replace(self.path + ".tmp", self.path)
+        if self._parquet is not None:
+            self._parquet.close()
+            parquet_path = _sibling(self.path, ".parquet")
+            os.replace(parquet_path + ".tmp", parquet_path)
+        _drop_fragments(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+            return
+        # Leave the old table as it was
+        for writer, tmp in ((self._arrow, self.path), (self._parquet, _sibling(self.path, ".parquet"))):
+            if writer is not None:
+                writer.close()
+                os.remove(tmp + ".tmp")
+
+
+def open_table(path=HIKES_PATH, columns=None):
+    """
+    Memory-map the table and its fragments and return them as one
+    pyarrow.Table (projected), each file's record batches as chunks.
+    """
+    tables = [feather.read_table(f, columns=columns, memory_map=True) for f in table_files(path)]
+    return tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+
+
+def _is_numeric(col):
+    return pa.types.is_floating(col.type) or pa.types.is_integer(col.type)
+
+
+def _to_numpy(col):
+    """A column as NumPy: a zero-copy view when it is one null-free numeric chunk."""
+    if isinstance(col, pa.ChunkedArray):
+        if col.num_chunks != 1:
+            return col.to_numpy()
+        col = col.chunk(0)
+    return col.to_numpy(zero_copy_only=_is_numeric(col) and col.null_count == 0)
+
+
+def read_columns(path=HIKES_PATH, columns=None):
+    """
+    {column: np.ndarray} for the requested columns (default: FEATURES).
+    Numeric columns of a single-batch table without fragments are
+    zero-copy, read-only views of the memory-mapped file.
+    """
+    columns = columns or FEATURES
+    table = open_table(path, columns)
+    return {name: _to_numpy(table.column(name)) for name in columns}
+
+
+def iter_chunks(path=HIKES_PATH, columns=None):
+    """
+    (first row, {column: np.ndarray}) for every record batch of the table
+    and its fragments, in order; numeric columns are zero-copy views.
+    """
+    columns = columns or FEATURES
+    first = 0
+    for batch in open_table(path, columns).to_batches():
+        yield first, {name: _to_numpy(batch.column(name)) for name in columns}
+        first += batch.num_rows
+
+
+def read_matrix(path=HIKES_PATH, columns=None):
+    """The requested numeric columns stacked into an (n, k) float64 matrix."""
+    cols = read_columns(path, columns or FEATURES)
+    return np.column_stack([cols[c] for c in (columns or FEATURES)])
+
+
+def read_frame(path=HIKES_PATH, columns=None):
+    """The requested columns as a pandas DataFrame, in the requested order."""
+    columns = columns or FEATURES
+    return open_table(path, columns).to_pandas()[columns]
+
+
+def column_names(path=HIKES_PATH):
+    return feather.read_table(path, memory_map=True).schema.names
+
+
+def num_rows(path=HIKES_PATH):
+    return open_table(path, [FEATURES[0]]).num_rows
+
+
+def append_rows(df, path=HIKES_PATH, parquet=True):
+    """
+    Append rows to a table (creating it if missing) as a new fragment,
+    leaving the existing files untouched. Columns the table has but df
+    lacks are filled with nulls, columns it doesn't have are dropped;
+    returns the new row count.
+    """
+    if not os.path.exists(path):
+        write_table(df, path, parquet)
+        return len(df)
+
+    schema = feather.read_table(path, memory_map=True).schema
+    df = _normalize(df).reindex(columns=schema.names)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+    fragments = fragment_paths(path)
+    number = int(fragments[-1].rsplit(".", 2)[1]) + 1 if fragments else 1
+    fragment = f"{os.path.splitext(path)[0]}.{number:05d}.arrow"
+    # Parquet first: the .arrow file is what makes the fragment visible
+    if parquet:
+        _write_parquet(table, _sibling(fragment, ".parquet"))
+    _write_arrow(table, fragment)
+    return num_rows(path)
+
+
+def compact(path=HIKES_PATH, parquet=True):
+    """Rewrite a table and its fragments as a single file; returns the row count."""
+    if fragment_paths(path):
+        write_table(open_table(path).to_pandas(), path, parquet)
+    return num_rows(path)
+
+
+def build_from_csv(csv_path, path=HIKES_PATH):
+    """Import a cleaned CSV (e.g. data/output.csv) into the store."""
+    return write_table(pd.read_csv(csv_path), path)
+
+
+def ensure_store(csv_path=CSV_PATH, path=HIKES_PATH):
+    """
+    Return the store path, (re)building it from csv_path first if it is
+    missing or older than the CSV, so the CSV is parsed once, not per script.
+    """
+    if os.path.exists(path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)
+    ):
+        return path
+    return build_from_csv(csv_path, path)
+
+
+def build_from_table(table_path, path=HIKES_PATH):
+    """Publish another store table (e.g. Preprocessor.py's data/features.arrow) as the hike table."""
+    return write_table(open_table(table_path).to_pandas(), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the hike feature store.")
+    parser.add_argument("source", help="cleaned CSV, or an .arrow table such as data/features.arrow")
+    parser.add_argument("--out", default=HIKES_PATH)
+    args = parser.parse_args()
+
+    if args.source.endswith(".arrow"):
+        out = build_from_table(args.source, args.out)
+    else:
+        out = build_from_csv(args.source, args.out)
+    print(f"Wrote {num_rows(out)} hikes -> {out}")
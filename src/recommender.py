@@ -1,70 +1,135 @@
-import pandas as pd
+# src/recommender.py
+
+"""
+Similar-hike lookup over the feature store: StandardScaler + KMeans(k=3)
+clusters and a Euclidean NearestNeighbors index on the scaled features.
+
+Nothing is loaded or fitted on import. Build a Recommender explicitly and
+ask it for many neighbour sets at once:
+
+  rec = Recommender().fit(df)                  # df: FEATURES columns, any index
+  res = rec.neighbors_of([12, 40, 97])         # catalogue rows, themselves excluded
+  res = rec.neighbors_for(feature_matrix)      # new hikes, raw feature rows
+  rec.to_frame(res)                            # one row per (query, neighbour)
+
+Every call runs a single kneighbors() over the whole batch and gathers the
+neighbours' labels, clusters and features with NumPy fancy indexing, so
+the cost per query is the index lookup and nothing else.
+
+  python src/recommender.py                    # the random-sample example
+"""
+
 import numpy as np
-from sklearn.preprocessing import StandardScaler
+import pandas as pd
 from sklearn.cluster import KMeans
 from sklearn.neighbors import NearestNeighbors
-import os
+from sklearn.preprocessing import StandardScaler
+
+import feature_store
+
+# Feature columns only, in the store's fixed order
+numeric_cols = feature_store.FEATURES
 
-file_path = os.path.join("data", "output.csv")
-df = pd.read_csv(file_path)
 
-# Detect numeric columns
-numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+class Recommender:
+    """Batch nearest-hike queries over a fitted hike table."""
 
-# Prepare numeric data: assume cleaned, no NaNs
-df_numeric = df[numeric_cols]
+    def __init__(self, n_neighbors=5, n_clusters=3, random_state=42):
+        self.n_neighbors  = n_neighbors
+        self.n_clusters   = n_clusters
+        self.random_state = random_state
 
-# Scale features
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(df_numeric)
+    def fit(self, df):
+        """Scale, cluster and index df[numeric_cols] (assumed cleaned, no NaNs)."""
+        self.index_    = df.index
+        self.features_ = df[numeric_cols].to_numpy(np.float64)
 
-# Apply KMeans with k=3
-k = 3
-kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-df['cluster'] = kmeans.fit_predict(X_scaled)
+        self.scaler_ = StandardScaler()
+        self.X_ = self.scaler_.fit_transform(self.features_)
 
-# Fit NearestNeighbors on the scaled data
-nn = NearestNeighbors(n_neighbors=5, metric='euclidean')
-nn.fit(X_scaled)
+        self.kmeans_ = KMeans(n_clusters=self.n_clusters, random_state=self.random_state, n_init=10)
+        self.cluster_ = self.kmeans_.fit_predict(self.X_)
 
-def find_5_nearest(gpx_idx):
- 
+        self.nn_ = NearestNeighbors(n_neighbors=self.n_neighbors, metric="euclidean")
+        self.nn_.fit(self.X_)
+        return self
+
+    def _lookup(self, X, n_neighbors, self_pos=None):
+        """
+        One kneighbors() call for every row of the scaled matrix X. With
+        self_pos (each query's own catalogue row), one extra neighbour is
+        fetched and the query itself dropped from its row, or the furthest
+        neighbour where the query did not come back (e.g. exact duplicates).
+        """
+        k = min(n_neighbors or self.n_neighbors, self.X_.shape[0] - (self_pos is not None))
+        dist, pos = self.nn_.kneighbors(X, n_neighbors=k + (self_pos is not None))
+
+        if self_pos is not None:
+            is_self = pos == self_pos[:, None]
+            drop = np.where(is_self.any(axis=1), is_self.argmax(axis=1), k)
+            keep = np.ones(pos.shape, dtype=bool)
+            keep[np.arange(pos.shape[0]), drop] = False
+            dist = dist[keep].reshape(-1, k)
+            pos  = pos[keep].reshape(-1, k)
+
+        return {
+            "position": pos,
+            "index":    np.asarray(self.index_)[pos],
+            "distance": dist,
+            "cluster":  self.cluster_[pos],
+            "features": self.features_[pos],      # (queries, k, len(numeric_cols))
+        }
+
+    def neighbors_of(self, labels, n_neighbors=None):
+        """Nearest hikes to catalogue rows (by index label), excluding each row itself."""
+        positions = self.index_.get_indexer(pd.Index(np.atleast_1d(labels)))
+        if (positions < 0).any():
+            missing = np.atleast_1d(labels)[positions < 0]
+            raise KeyError(f"Indices not found in the hike table: {missing.tolist()}")
+        return self._lookup(self.X_[positions], n_neighbors, self_pos=positions)
+
+    def neighbors_for(self, features, n_neighbors=None):
+        """Nearest hikes to new hikes, given as raw rows in numeric_cols order."""
+        X = self.scaler_.transform(np.atleast_2d(np.asarray(features, dtype=np.float64)))
+        return self._lookup(X, n_neighbors)
+
+    def to_frame(self, result):
+        """A neighbours result as a long DataFrame, nearest first per query."""
+        n_queries, k = result["position"].shape
+        frame = pd.DataFrame(result["features"].reshape(-1, len(numeric_cols)), columns=numeric_cols)
+        frame.insert(0, "query", np.repeat(np.arange(n_queries), k))
+        frame.insert(1, "neighbor_index", result["index"].ravel())
+        frame.insert(2, "cluster", result["cluster"].ravel())
+        frame.insert(3, "distance", result["distance"].ravel())
+        return frame
+
+
+def find_5_nearest(rec, df, gpx_idx):
+    """Print the query row and its 5 nearest neighbours (the original report)."""
     if gpx_idx not in df.index:
         print(f"Index {gpx_idx} not found in DataFrame.")
         return
-    pos = df.index.get_loc(gpx_idx)
-    dist_arr, idx_arr = nn.kneighbors(X_scaled[pos].reshape(1, -1))
-    dist_arr = dist_arr.flatten()
-    idx_arr = idx_arr.flatten()
-    neighbors = []
-    for dist, pos_i in zip(dist_arr, idx_arr):
-        idx_i = df.index[pos_i]
-        if idx_i == gpx_idx:
-            continue
-        neighbors.append((idx_i, dist, df.at[idx_i, 'cluster']))
-        if len(neighbors) >= 5:
-            break
-    print(f"\nQuery index: {gpx_idx}, Cluster: {df.at[gpx_idx, 'cluster']}")
+    neigh_df = rec.to_frame(rec.neighbors_of([gpx_idx], 5)).drop(columns="query")
+    print(f"\nQuery index: {gpx_idx}, Cluster: {rec.cluster_[df.index.get_loc(gpx_idx)]}")
     print("Query feature values:")
     print(df.loc[gpx_idx, numeric_cols].to_string())
-    if neighbors:
-        neigh_rows = []
-        for neigh_idx, dist, cluster in neighbors:
-            row_vals = {col: df.at[neigh_idx, col] for col in numeric_cols}
-            row_vals.update({
-                'neighbor_index': neigh_idx,
-                'distance': dist,
-                'cluster': cluster
-            })
-            neigh_rows.append(row_vals)
-        neigh_df = pd.DataFrame(neigh_rows)
-        cols = ['neighbor_index', 'cluster', 'distance'] + numeric_cols
+    if len(neigh_df):
         print("\n5 Nearest Neighbors:")
-        print(neigh_df[cols].sort_values('distance').to_string(index=False))
+        print(neigh_df.to_string(index=False))
     else:
         print("No neighbors found (data may have fewer rows).")
 
-# Example: take a random row from df as input
-sample_index = df.sample(n=1, random_state=42).index[0]
-print(f"\nUsing random sample index from df: {sample_index}")
-find_5_nearest(sample_index)
\ No newline at end of file
+
+def main():
+    df = feature_store.read_frame(feature_store.ensure_store(), numeric_cols)
+    rec = Recommender().fit(df)
+    df["cluster"] = rec.cluster_
+
+    # Example: take a random row from df as input
+    sample_index = df.sample(n=1, random_state=42).index[0]
+    print(f"\nUsing random sample index from df: {sample_index}")
+    find_5_nearest(rec, df, sample_index)
+
+
+if __name__ == "__main__":
+    main()
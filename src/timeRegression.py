@@ -8,16 +8,18 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.ensemble import RandomForestRegressor
+
+import feature_store
 # from xgboost import XGBRegressor
 # from sklearn.linear_model import Ridge
 
 SCALER_PATH = os.path.join("data", "scaler.pkl")
 MODEL_PATH = os.path.join("data", "model.pkl")
 
-def load_and_preprocess_data(csv_path):
-    df = pd.read_csv(csv_path)
-    feature_cols = [col for col in df.columns if col not in 
-                    ['duration', 'break_time']]
+def load_and_preprocess_data(csv_path=feature_store.CSV_PATH):
+    feature_cols = feature_store.TIME_FEATURES
+    store = feature_store.ensure_store(csv_path)
+    df = feature_store.read_frame(store, feature_cols + ['duration'])
     scaler = MinMaxScaler()
     X_scaled = scaler.fit_transform(df[feature_cols])
     df_scaled = pd.DataFrame(X_scaled, columns=feature_cols)
@@ -110,10 +112,10 @@ def predict_from_input(model, user_input_dict):
     return prediction
 
 def main():
-    base_csv = os.path.join("data", "output.csv")
-    df_scaled, _ = load_and_preprocess_data(base_csv)
+    df_scaled, _ = load_and_preprocess_data()
     X_train, X_test, y_train, y_test = split_data(df_scaled)
 
+    # Other models and settings are compared by src/tuning.py, which saves its winner to MODEL_PATH
     model = RandomForestRegressor(
         n_estimators=200,        # More trees = better averaging
         max_depth=15,            # Limit tree depth to reduce overfitting
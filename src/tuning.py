@@ -0,0 +1,329 @@
+# src/tuning.py
+
+"""
+Hyperparameter search for the duration model of timeRegression.py.
+
+Every candidate (a model family from CANDIDATES with one point of its grid)
+is scored by k-fold cross-validation on the feature store's TIME_FEATURES,
+MinMax-scaled exactly like timeRegression.py does. Folds run in parallel on
+a process pool: workers memory-map the store themselves and only receive
+(candidate, fold, budget) and send back a few numbers, and at most
+2 x workers folds are in flight, so memory stays bounded by the pool size.
+
+Successive halving: the first rung fits every candidate on 1/eta^(r-1) of
+each training fold, then only the best 1/eta (by mean CV MAE) move on to
+a rung with eta times more rows, up to full folds. HistGradientBoosting
+also stops early on its own validation split.
+
+Fold results are cached as JSON under <out>/cache, keyed by a hash of the
+data, the model, its parameters, the fold layout and the budget, so a
+repeated or extended search only fits what it has not seen before.
+
+The leaderboard (CV error against fit and predict time) is written to
+<out>/leaderboard.csv and the winner is refit on all rows and saved as
+data/model.pkl (with data/scaler.pkl), where timeRegression.py puts it.
+
+  python src/tuning.py                          # all model families
+  python src/tuning.py --models random_forest ridge --folds 3 --no-save
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid
+from sklearn.preprocessing import MinMaxScaler
+
+import feature_store
+
+try:
+    from xgboost import XGBRegressor
+except ImportError:
+    XGBRegressor = None
+
+TUNING_DIR  = os.path.join(feature_store.STORE_DIR, "tuning")
+MODEL_PATH  = os.path.join(feature_store.STORE_DIR, "model.pkl")     # as in timeRegression.py
+SCALER_PATH = os.path.join(feature_store.STORE_DIR, "scaler.pkl")
+
+# name: (estimator class, fixed parameters, grid searched on top of them).
+# random_forest's fixed parameters are timeRegression.py's configuration.
+CANDIDATES = {
+    "random_forest": (
+        RandomForestRegressor,
+        {"n_estimators": 200, "max_depth": 15, "min_samples_split": 5, "min_samples_leaf": 2,
+         "max_features": "sqrt", "bootstrap": True, "random_state": 42, "n_jobs": -1},
+        {"n_estimators": [100, 200, 400], "max_depth": [10, 15, None],
+         "min_samples_leaf": [1, 2, 5], "max_features": ["sqrt", 1.0]},
+    ),
+    "extra_trees": (
+        ExtraTreesRegressor,
+        {"n_estimators": 200, "min_samples_split": 5, "random_state": 42, "n_jobs": -1},
+        {"max_depth": [15, None], "min_samples_leaf": [1, 2, 5], "max_features": ["sqrt", 1.0]},
+    ),
+    "hist_gradient_boosting": (
+        HistGradientBoostingRegressor,
+        {"max_iter": 1000, "early_stopping": True, "validation_fraction": 0.1,
+         "n_iter_no_change": 20, "random_state": 42},
+        {"learning_rate": [0.03, 0.1], "max_leaf_nodes": [15, 31, 63], "l2_regularization": [0.0, 1.0]},
+    ),
+    "ridge": (
+        Ridge,
+        {},
+        {"alpha": [0.1, 1.0, 10.0]},
+    ),
+}
+if XGBRegressor is not None:
+    CANDIDATES["xgboost"] = (
+        XGBRegressor,
+        {"n_estimators": 300, "subsample": 0.8, "colsample_bytree": 0.8, "gamma": 0.1,
+         "reg_alpha": 0.1, "reg_lambda": 1.0, "random_state": 42, "n_jobs": -1},
+        {"learning_rate": [0.05, 0.1], "max_depth": [3, 5, 7]},
+    )
+
+# Rows per single-row latency measurement
+SINGLE_ROW_REPEATS = 20
+
+
+# ─── Data ────────────────────────────────────────────────────────────────────
+
+def load_xy(store):
+    """MinMax-scaled TIME_FEATURES matrix and duration target from the store."""
+    cols = feature_store.read_columns(store, feature_store.TIME_FEATURES + ["duration"])
+    X = np.column_stack([cols[c] for c in feature_store.TIME_FEATURES])
+    return MinMaxScaler().fit_transform(X), np.asarray(cols["duration"], dtype=np.float64)
+
+
+def data_hash(X, y):
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(X).tobytes())
+    h.update(np.ascontiguousarray(y).tobytes())
+    return h.hexdigest()[:16]
+
+
+def candidate_grid(names):
+    """[(model name, params)] for every grid point of the requested families."""
+    out = []
+    for name in names:
+        _, _, grid = CANDIDATES[name]
+        out.extend((name, dict(params)) for params in ParameterGrid(grid))
+    return out
+
+
+def make_model(name, params, n_jobs=None):
+    cls, fixed, _ = CANDIDATES[name]
+    model = cls(**{**fixed, **params})
+    if n_jobs is not None and "n_jobs" in model.get_params():
+        model.set_params(n_jobs=n_jobs)
+    return model
+
+
+# ─── Fold workers ────────────────────────────────────────────────────────────
+
+_X = _y = _folds = None
+
+
+def _init_worker(store, n_folds, seed):
+    global _X, _y, _folds
+    _X, _y = load_xy(store)
+    _folds = list(KFold(n_folds, shuffle=True, random_state=seed).split(_X))
+
+
+def _fit_fold(name, params, fold, fraction, seed):
+    """Fit one candidate on (a fraction of) one training fold; metrics only."""
+    train, valid = _folds[fold]
+    if fraction < 1.0:
+        keep = np.random.default_rng(seed + fold).permutation(train.size)[:max(2, int(train.size * fraction))]
+        train = np.sort(train[keep])
+
+    # The pool provides the parallelism; one thread per model avoids oversubscription
+    model = make_model(name, params, n_jobs=1)
+    start = time.perf_counter()
+    model.fit(_X[train], _y[train])
+    fit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pred = model.predict(_X[valid])
+    predict_s = time.perf_counter() - start
+
+    row = _X[valid[:1]]
+    start = time.perf_counter()
+    for _ in range(SINGLE_ROW_REPEATS):
+        model.predict(row)
+    single_s = (time.perf_counter() - start) / SINGLE_ROW_REPEATS
+
+    y_valid = _y[valid]
+    return {
+        "mae":               float(mean_absolute_error(y_valid, pred)),
+        "rmse":              float(mean_squared_error(y_valid, pred) ** 0.5),
+        "r2":                float(r2_score(y_valid, pred)),
+        "fit_s":             fit_s,
+        "predict_us_row":    predict_s / valid.size * 1e6,
+        "predict_ms_single": single_s * 1000,
+    }
+
+
+# ─── Search ──────────────────────────────────────────────────────────────────
+
+class FoldCache:
+    """One JSON file of fold metrics per (data, model, params, folds, budget)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, data_key, name, params, fold, fraction):
+        raw = json.dumps([data_key, name, params, fold, round(fraction, 6)], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.directory, key + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, key, result):
+        path = os.path.join(self.directory, key + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(result, f)
+        os.replace(path + ".tmp", path)
+
+
+def run_folds(pool, jobs, cache, max_in_flight):
+    """
+    Run (cache key, args) fold jobs, skipping cached ones, with at most
+    max_in_flight submitted at a time. Returns {cache key: metrics}.
+    """
+    results, pending = {}, {}
+    todo = []
+    for key, args in jobs:
+        cached = cache.get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            todo.append((key, args))
+
+    todo.reverse()
+    while todo or pending:
+        while todo and len(pending) < max_in_flight:
+            key, args = todo.pop()
+            pending[pool.submit(_fit_fold, *args)] = key
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = pending.pop(future)
+            results[key] = future.result()
+            cache.put(key, results[key])
+    return results
+
+
+def summarize(name, params, fold_results, fraction):
+    frame = pd.DataFrame(fold_results)
+    return {
+        "model":             name,
+        "params":            json.dumps(params, sort_keys=True, default=str),
+        "fraction":          round(fraction, 4),
+        "cv_mae":            frame["mae"].mean(),
+        "cv_mae_std":        frame["mae"].std(ddof=0),
+        "cv_rmse":           frame["rmse"].mean(),
+        "cv_r2":             frame["r2"].mean(),
+        "fit_s":             frame["fit_s"].mean(),
+        "predict_us_row":    frame["predict_us_row"].mean(),
+        "predict_ms_single": frame["predict_ms_single"].mean(),
+    }
+
+
+def search(store, names, n_folds=5, eta=3, rungs=3, workers=None, out_dir=TUNING_DIR, seed=42):
+    """
+    Successive-halving cross-validated search. Returns the leaderboard
+    DataFrame (best first, one row per candidate at the highest rung it
+    reached).
+    """
+    X, y = load_xy(store)
+    data_key = [data_hash(X, y), n_folds, seed]
+    del X, y
+
+    cache = FoldCache(os.path.join(out_dir, "cache"))
+    workers = workers or os.cpu_count() or 1
+    candidates = candidate_grid(names)
+    final = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(store, n_folds, seed)) as pool:
+        for rung in range(rungs):
+            fraction = float(eta) ** (rung - rungs + 1)
+            jobs = [
+                (cache.key(data_key, name, params, fold, fraction), (name, params, fold, fraction, seed))
+                for name, params in candidates for fold in range(n_folds)
+            ]
+            start = time.perf_counter()
+            results = run_folds(pool, jobs, cache, max_in_flight=2 * workers)
+            rows = [
+                summarize(name, params, [results[jobs[i * n_folds + f][0]] for f in range(n_folds)], fraction)
+                for i, (name, params) in enumerate(candidates)
+            ]
+            for (name, params), row in zip(candidates, rows):
+                final[(name, row["params"])] = row
+            print(f"Rung {rung + 1}/{rungs}: {len(candidates)} candidates x {n_folds} folds "
+                  f"on {fraction:.0%} of each training fold in {time.perf_counter() - start:.1f}s")
+
+            if rung < rungs - 1:
+                order = np.argsort([row["cv_mae"] for row in rows], kind="stable")
+                candidates = [candidates[i] for i in order[:max(1, len(candidates) // eta)]]
+
+    board = pd.DataFrame(final.values())
+    # Candidates that reached full folds first, then by error
+    board = board.sort_values(["fraction", "cv_mae"], ascending=[False, True]).reset_index(drop=True)
+    return board
+
+
+def save_winner(store, board, model_path=MODEL_PATH, scaler_path=SCALER_PATH):
+    """Refit the top candidate on every row and save it with its scaler."""
+    best = board.iloc[0]
+    cols = feature_store.read_columns(store, feature_store.TIME_FEATURES + ["duration"])
+    X = pd.DataFrame({c: cols[c] for c in feature_store.TIME_FEATURES})
+    scaler = MinMaxScaler()
+    X_scaled = pd.DataFrame(scaler.fit_transform(X), columns=feature_store.TIME_FEATURES)
+
+    model = make_model(best["model"], json.loads(best["params"]))
+    model.fit(X_scaled, cols["duration"])
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    joblib.dump(scaler, scaler_path)
+    joblib.dump(model, model_path)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validated search for the duration model.")
+    parser.add_argument("--csv", default=feature_store.CSV_PATH)
+    parser.add_argument("--store", default=feature_store.HIKES_PATH)
+    parser.add_argument("--models", nargs="*", default=list(CANDIDATES), choices=list(CANDIDATES))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--eta", type=int, default=3, help="halving factor between rungs")
+    parser.add_argument("--rungs", type=int, default=3, help="1 = plain grid search on full folds")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=TUNING_DIR)
+    parser.add_argument("--no-save", action="store_true", help="only write the leaderboard")
+    args = parser.parse_args()
+
+    store = feature_store.ensure_store(args.csv, args.store)
+    board = search(store, args.models, args.folds, args.eta, args.rungs, args.workers, args.out)
+
+    os.makedirs(args.out, exist_ok=True)
+    board_path = os.path.join(args.out, "leaderboard.csv")
+    board.to_csv(board_path, index=False)
+    with pd.option_context("display.max_colwidth", 60, "display.width", 200):
+        print(board.head(10).round(3).to_string())
+    print(f"Leaderboard -> {board_path}")
+
+    if not args.no_save:
+        save_winner(store, board)
+        print(f"Best: {board.iloc[0]['model']} {board.iloc[0]['params']} -> {MODEL_PATH}")
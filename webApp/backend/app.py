@@ -1,10 +1,40 @@
-from flask import Flask, request, jsonify
+import json
+import os
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from gpx_pipeline import analyze_gpx_stream
+from artifacts import WATCH_SECONDS, registry
+from geo_index import GEO_RADIUS_KM, nearby_from_bytes
+from gpx_batch import analyze_batch, detach_upload, iter_gpx_uploads
+from gpx_pipeline import (
+    catalogue_memory, parse_recommend_request, recommend, score_features, similar_hikes,
+    track_features,
+)
+from gpx_stream import STREAMING_THRESHOLD_BYTES, upload_size
+from inference_scheduler import scheduler
+from instrumentation import (
+    collect_breakdown, profiler, render_prometheus, server_timing, stage,
+)
+from multi_track import analyze_tracks
+from online_update import ONLINE_UPDATES, WATCH_SECONDS as ONLINE_WATCH_SECONDS, updater
+from result_cache import cache, hash_stream
+from segment_pace import WINDOW_M, analyze_segments, check_window
 
 app = Flask(__name__)
 CORS(app)
 
+# Request header asking for the per-stage breakdown
+STAGE_TIMING_HEADER = 'X-Stage-Timing'
+
+# Load models up front (before gunicorn --preload forks) instead of lazily
+if os.environ.get("GPX_PRELOAD_ARTIFACTS") == "1":
+    registry.preload()
+
+# Swap replaced model files in from a background thread (see artifacts.py);
+# online updates replace them while serving, so those always watch
+if WATCH_SECONDS > 0 or ONLINE_UPDATES:
+    registry.watch(WATCH_SECONDS or ONLINE_WATCH_SECONDS)
+
 
 @app.route('/api/health', methods=['GET'])
 def health():
@@ -14,25 +44,217 @@ def health():
     return jsonify({'status': 'healthy'}), 200
 
 
+@app.route('/api/artifacts', methods=['GET'])
+def artifacts():
+    """
+    Per-artifact load time and resident size of the model registry.
+    """
+    return jsonify(registry.stats()), 200
+
+
+@app.route('/api/catalogue', methods=['GET'])
+def catalogue():
+    """
+    Per-worker memory footprint of the served hike catalogue and
+    neighbour index, split into shared (memory-mapped) and private bytes.
+    """
+    return jsonify(catalogue_memory()), 200
+
+
+@app.route('/api/inference', methods=['GET'])
+def inference():
+    """
+    Micro-batching metrics: batch sizes and queueing delay of model calls.
+    """
+    return jsonify(scheduler.stats()), 200
+
+
+@app.route('/api/online-updates', methods=['GET'])
+def online_updates():
+    """
+    Online model updates from uploads: rows pending, applied and failed.
+    """
+    return jsonify(updater.stats()), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    Per-stage latency histograms and inference scheduler gauges, in the
+    Prometheus text format.
+    """
+    gauges = {f"gpx_inference_{k}": v for k, v in scheduler.stats().items()}
+    return Response(render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/process-gpx', methods=['POST'])
 def process_gpx():
     """
     Accepts a multipart/form-data upload with the field 'file' containing a GPX.
-    Parses, analyzes, and returns a JSON of trail stats.
+    Parses, analyzes, and returns a JSON of trail stats. Uploads above
+    STREAMING_THRESHOLD_BYTES are parsed incrementally in constant memory.
+    Results are cached by upload content and model version; the X-Cache
+    header says whether this one was a HIT (X-Cache-Tier: memory/disk) or
+    a MISS. Send 'X-Stage-Timing: 1' to get the per-stage breakdown back
+    in a Server-Timing header.
     """
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
 
     gpx_file = request.files['file']
+    with profiler.maybe_profile("process-gpx") as profiling, collect_breakdown() as timings:
+        with stage("total"):
+            response, status = _process_upload(gpx_file, timings, inline=profiling)
+    if request.headers.get(STAGE_TIMING_HEADER) == '1':
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response, status
+
+
+def _process_upload(gpx_file, timings, inline=False):
+    """(response, status) for one uploaded GPX, as described in process_gpx."""
     try:
-        # Delegate to the shared pipeline function:
-        stats = analyze_gpx_stream(gpx_file.stream)
-        return jsonify(stats), 200
+        # Same bytes under the same artifacts -> same answer
+        with stage("hash"):
+            content_hash = hash_stream(gpx_file.stream)
+            key = cache.key(content_hash)
+        with stage("cache"):
+            stats, tier = cache.get(key)
+        if stats is not None:
+            response = jsonify(stats)
+            response.headers['X-Cache'] = 'HIT'
+            response.headers['X-Cache-Tier'] = tier
+            return response, 200
+
+        # Extract on this thread, then score in a micro-batch with whatever
+        # other requests are waiting (see inference_scheduler.py)
+        size = upload_size(gpx_file.stream)
+        streaming = size is None or size > STREAMING_THRESHOLD_BYTES
+        with stage("extract"):
+            feats = track_features(gpx_file.stream, streaming=streaming)
+        if inline:
+            # Profiled requests score on this thread so the models show up
+            with stage("score"):
+                stats = score_features([feats])[0]
+        else:
+            stats = scheduler.score(feats, timings=timings)
+        cache.put(key, stats)
+        if ONLINE_UPDATES:
+            updater.observe(feats, content_hash)
+        response = jsonify(stats)
+        response.headers['X-Cache'] = 'MISS'
+        return response, 200
     except Exception as e:
         # Return any parsing or analysis error as a 400 response
         return jsonify({'error': str(e)}), 400
 
 
+@app.route('/api/process-gpx/segments', methods=['POST'])
+def process_gpx_segments():
+    """
+    Accepts a GPX upload like /api/process-gpx (field 'file') and an
+    optional 'window_m' (form or query, default GPX_SEGMENT_WINDOW_M,
+    10 m to 10 km; 400 outside that).
+    Returns per-window distance, elevation change, grade and predicted
+    time with cumulative ETA checkpoints along the route.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        window_m = check_window(float(request.values.get('window_m', WINDOW_M)))
+        return jsonify(analyze_segments(request.files['file'].stream, window_m)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/process-gpx/nearby', methods=['POST'])
+def process_gpx_nearby():
+    """
+    Accepts a GPX upload like /api/process-gpx (field 'file') and returns
+    the most similar catalogue hikes starting within 'radius_km' (form or
+    query, default GPX_GEO_RADIUS_KM) of the upload's start, with optional
+    'k' and 'difficulty' as for /api/recommend.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        radius_km = float(request.values.get('radius_km', GEO_RADIUS_KM))
+        feats, (lat, lon) = nearby_from_bytes(request.files['file'].stream.read())
+        result = recommend(
+            feats, int(request.values.get('k', 5)), request.values.get('difficulty'),
+            near=(lat, lon, radius_km),
+        )
+        return jsonify({'start': [lat, lon], 'radius_km': radius_km, **result}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/process-gpx/tracks', methods=['POST'])
+def process_gpx_tracks():
+    """
+    Accepts a GPX upload like /api/process-gpx (field 'file') and returns
+    one result per <trk>, or per <trkseg> with 'mode=segment' (form or
+    query), instead of merging them into one hike. Parts that cannot be
+    analysed carry an 'error' instead of stats.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        mode = request.values.get('mode', 'track')
+        return jsonify(analyze_tracks(request.files['file'].stream.read(), mode)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/recommend', methods=['POST'])
+def recommend_hikes():
+    """
+    Nearest catalogue hikes to a feature dict, optionally restricted to a
+    difficulty ('Easy'/'Medium'/'Hard', or 'same'/'harder'/'easier' than
+    the hike itself), to raw-unit ranges of any feature and to hikes
+    starting within a radius of a point (see parse_recommend_request for
+    the JSON body).
+    """
+    try:
+        return jsonify(recommend(*parse_recommend_request(request.get_json(silent=True) or {}))), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/similar/<int:hike_id>', methods=['GET'])
+def similar(hike_id):
+    """
+    The ?k= (default 5) most similar catalogue hikes to catalogue hike
+    `hike_id`, served from the precomputed similarity graph.
+    """
+    try:
+        return jsonify(similar_hikes(hike_id, int(request.args.get('k', 5)))), 200
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/process-gpx/batch', methods=['POST'])
+def process_gpx_batch():
+    """
+    Accepts a multipart/form-data upload with any number of 'files' fields,
+    each a GPX or a zip archive of GPX files. Streams back one JSON object
+    per line (NDJSON): {"file", "stats"} on success, {"file", "error"} on
+    failure, in the order the files finished processing.
+    """
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    uploads = [detach_upload(f) for f in files]
+
+    def generate():
+        for result in analyze_batch(iter_gpx_uploads(uploads)):
+            yield json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
 if __name__ == '__main__':
     # Starts Flask in debug mode on port 5000
     app.run(debug=True, port=5000)
@@ -0,0 +1,280 @@
+# backend/artifacts.py
+
+"""
+Lazy registry for the pickled model artifacts.
+
+Nothing is read at import time: each artifact is joblib-loaded the first
+time it is requested, with NumPy payloads memory-mapped read-only
+(mmap_mode='r') so the pages come from the OS page cache and are shared
+between processes instead of being copied into every worker. Call
+registry.preload() before forking (e.g. gunicorn --preload with
+GPX_PRELOAD_ARTIFACTS=1) to let forked workers share everything
+copy-on-write.
+"""
+
+import gc
+import glob
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import joblib
+
+from flat_forest import FlatForest
+
+# feature_store.py is shared with the training scripts in src/
+SRC_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+import feature_store
+
+try:
+    import psutil
+except ImportError:  # optional, only used to report resident sizes
+    psutil = None
+
+ARTIFACT_DIR = os.environ.get("GPX_MODEL_DIR", "model")
+
+# Seconds between checks for replaced artifact files (0: check per request)
+WATCH_SECONDS = float(os.environ.get("GPX_ARTIFACT_WATCH_S", 0))
+
+MODEL_PATH       = os.path.join(ARTIFACT_DIR, "model.pkl")
+MODEL_FLAT_PATH  = os.path.join(ARTIFACT_DIR, "model_flat.npz")
+SCALER_PATH      = os.path.join(ARTIFACT_DIR, "scaler.pkl")
+DIFF_SCALER_PATH = os.path.join(ARTIFACT_DIR, "difficulty_scaler.pkl")
+DIFF_KMEANS_PATH = os.path.join(ARTIFACT_DIR, "difficulty_kmeans.pkl")
+DIFF_MAP_PATH    = os.path.join(ARTIFACT_DIR, "difficulty_cluster_map.pkl")
+DIFF_NN_PATH     = os.path.join(ARTIFACT_DIR, "difficulty_nn.pkl")
+DIFF_INDEX_PATH  = os.path.join(ARTIFACT_DIR, "difficulty_index.pkl")
+DIFF_PARTITIONS_PATH = os.path.join(ARTIFACT_DIR, "difficulty_partitions.pkl")
+DIFF_GRAPH_PATH  = os.path.join(ARTIFACT_DIR, "difficulty_graph.pkl")
+DIFF_GEO_PATH    = os.path.join(ARTIFACT_DIR, "difficulty_geo.pkl")
+DIFF_DF_RAW_PATH = os.path.join(ARTIFACT_DIR, "difficulty_df_raw.pkl")
+DIFF_CATALOGUE_PATH = os.path.join(ARTIFACT_DIR, "difficulty_catalogue.arrow")
+DIFF_COMPACT_PATH = os.path.join(ARTIFACT_DIR, "difficulty_compact.pkl")
+NAMES_DF_PATH    = os.path.join(ARTIFACT_DIR, "df_raw_copy.pkl")
+
+
+def _read_geometry(path):
+    """
+    The catalogue's GEO_COLUMNS (start point and bounding box of every
+    hike), or None for a catalogue built without them.
+    """
+    if not set(feature_store.GEO_COLUMNS) <= set(feature_store.column_names(path)):
+        return None
+    return feature_store.read_columns(path, feature_store.GEO_COLUMNS)
+
+
+# Artifacts not stored as joblib pickles, with their loader
+ARTIFACT_LOADERS = {
+    "model_flat":     FlatForest.load,
+    "diff_catalogue": feature_store.read_columns,
+    "diff_geometry":  _read_geometry,
+}
+
+ARTIFACT_PATHS = {
+    "model":            MODEL_PATH,
+    "model_flat":       MODEL_FLAT_PATH,
+    "scaler":           SCALER_PATH,
+    "diff_scaler":      DIFF_SCALER_PATH,
+    "diff_kmeans":      DIFF_KMEANS_PATH,
+    "diff_cluster_map": DIFF_MAP_PATH,
+    "diff_nn":          DIFF_NN_PATH,
+    "diff_index":       DIFF_INDEX_PATH,
+    "diff_partitions":  DIFF_PARTITIONS_PATH,
+    "diff_graph":       DIFF_GRAPH_PATH,
+    "diff_geo":         DIFF_GEO_PATH,
+    "diff_df_raw":      DIFF_DF_RAW_PATH,
+    "diff_catalogue":   DIFF_CATALOGUE_PATH,
+    "diff_geometry":    DIFF_CATALOGUE_PATH,
+    "diff_compact":     DIFF_COMPACT_PATH,
+    "names_df":         NAMES_DF_PATH,
+}
+
+
+def _file_version(path):
+    """
+    (size, mtime_ns) of a file, or None if it doesn't exist. An Arrow table
+    also changes version when rows are appended to it as a new fragment.
+    """
+    try:
+        if path.endswith(".arrow"):
+            return tuple(
+                (st.st_size, st.st_mtime_ns)
+                for st in map(os.stat, feature_store.table_files(path))
+            )
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None without psutil."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class ArtifactRegistry:
+    """Loads named artifacts on first use and records what each one cost."""
+
+    def __init__(self, paths, loaders=None, mmap_mode="r"):
+        self.paths     = dict(paths)
+        self.loaders   = dict(loaders or {})
+        self.mmap_mode = mmap_mode
+        self._loaded   = {}
+        self._stats    = {}
+        self._versions = {}
+        self._lock     = threading.Lock()
+        self._watcher  = None
+        self._watch_interval     = 0
+        self._served_fingerprint = None
+
+    def available(self, name):
+        """True if artifact `name` is loaded or present on disk."""
+        return name in self._loaded or os.path.exists(self.paths[name])
+
+    def get(self, name):
+        """Return artifact `name`, loading it on first access."""
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._loaded:
+                self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def _load(self, name):
+        path = self.paths[name]
+        self._versions[name] = _file_version(path)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        if name in self.loaders:
+            obj = self.loaders[name](path)
+        else:
+            obj = joblib.load(path, mmap_mode=self.mmap_mode)
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        self._stats[name] = {
+            "path":           path,
+            "file_bytes":     os.path.getsize(path),
+            "load_seconds":   round(elapsed, 4),
+            "resident_bytes": None if rss_before is None else max(0, rss_after - rss_before),
+        }
+        return obj
+
+    def fingerprint(self):
+        """
+        Short hash of every artifact file in the model directories (size and
+        mtime), changing whenever any model/*.pkl, *.npz or *.arrow is replaced.
+        """
+        dirs = sorted({os.path.dirname(p) for p in self.paths.values()})
+        files = sorted(
+            f for d in dirs for pattern in ("*.pkl", "*.npz", "*.arrow")
+            for f in glob.glob(os.path.join(d, pattern))
+        )
+        digest = hashlib.sha1()
+        for f in files:
+            digest.update(f"{f}:{_file_version(f)}".encode())
+        return digest.hexdigest()[:16]
+
+    def _changed(self):
+        return [
+            name for name in list(self._loaded)
+            if _file_version(self.paths[name]) != self._versions.get(name)
+        ]
+
+    def refresh(self, reload=False):
+        """
+        Pick up artifact files that changed since they were loaded and
+        return fingerprint(). By default the stale objects are forgotten and
+        the next get() loads the new version; with reload=True the new
+        versions are loaded first and then swapped in together, so requests
+        keep being served by the old ones meanwhile.
+
+        While watch() runs, plain refresh() calls change nothing and return
+        the fingerprint of what is being served, which the watcher updates.
+        """
+        if self._watch_interval and not reload:
+            self._ensure_watching()
+            return self._served_fingerprint
+        if not reload:
+            with self._lock:
+                for name in self._changed():
+                    del self._loaded[name]
+                    self._stats.pop(name, None)
+            return self.fingerprint()
+
+        fingerprint = self.fingerprint()
+        fresh = {name: self._load(name) for name in self._changed()}
+        with self._lock:
+            self._loaded.update(fresh)
+            self._served_fingerprint = fingerprint
+        return fingerprint
+
+    def watch(self, interval):
+        """
+        Poll the artifact files every `interval` seconds on a background
+        thread and hot-swap changed ones (refresh(reload=True)), so new
+        models go live in every worker without a restart and without a
+        request paying for the load.
+        """
+        self._served_fingerprint = self.fingerprint()
+        self._watch_interval = interval
+        self._ensure_watching()
+
+    def _ensure_watching(self):
+        # Threads don't survive a pre-fork, so each worker restarts its own
+        if self._watcher is None or not self._watcher.is_alive():
+            with self._lock:
+                if self._watcher is None or not self._watcher.is_alive():
+                    self._watcher = threading.Thread(
+                        target=self._watch, name="gpx-artifact-watch", daemon=True
+                    )
+                    self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self._watch_interval)
+            try:
+                self.refresh(reload=True)
+            except Exception:
+                # A half-written or unreadable file: keep serving, retry next tick
+                pass
+
+    def preload(self, names=None):
+        """
+        Load every artifact now (e.g. in the master process before workers
+        fork) and move them out of the garbage collector's tracked set so
+        refcount/GC bookkeeping doesn't dirty the shared pages.
+        """
+        for name in names or self.paths:
+            if self.available(name):
+                self.get(name)
+        gc.freeze()
+
+    def stats(self):
+        """Per-artifact load time and resident size; unloaded ones show loaded=False."""
+        return {
+            name: {"loaded": name in self._loaded, **self._stats.get(name, {"path": path})}
+            for name, path in self.paths.items()
+        }
+
+
+registry = ArtifactRegistry(ARTIFACT_PATHS, ARTIFACT_LOADERS)
+
+
+def clustering():
+    """
+    (kmeans, cluster map) of the difficulty clustering as one pair: the map
+    online_update.py stores on the kmeans it writes (cluster_map_), else
+    classifier.py's diff_cluster_map.
+    """
+    kmeans = registry.get("diff_kmeans")
+    cluster_map = getattr(kmeans, "cluster_map_", None)
+    return kmeans, registry.get("diff_cluster_map") if cluster_map is None else cluster_map
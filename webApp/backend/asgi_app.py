@@ -0,0 +1,354 @@
+# backend/asgi_app.py
+
+"""
+Asynchronous (ASGI) serving mode for the GPX API.
+
+Same /api/health, /api/artifacts and /api/process-gpx contracts as app.py,
+but uploads are received on an asyncio event loop and the CPU-bound work
+never runs on it: GPX parsing and feature extraction go to the shared
+process pool (gpx_batch.get_pool) and the models run on the micro-batching
+scheduler's thread (inference_scheduler.py), so one slow parse doesn't hold
+up health checks, cache hits or other uploads.
+
+Admission is bounded: once GPX_ASYNC_MAX_IN_FLIGHT analyses are queued or
+running, new uploads to any /api/process-gpx endpoint get 429 with the
+current queue depth (and a Retry-After header) instead of piling up behind
+the pool. Blocking I/O (reading spooled uploads, hashing them, the result
+cache's SQLite tier) runs on worker threads, never on the event loop.
+Uploads above GPX_STREAMING_THRESHOLD are not read into memory: they are
+copied to a temp file whose path goes to the pool, and the worker parses
+it with the bounded-memory streaming parser (gpx_stream.py) like app.py.
+
+Stage timers and /api/metrics work as in app.py; the GPX_PROFILE_EVERY
+hooks are only wired into app.py, where one request runs on one thread.
+
+Run with any ASGI server, e.g.:
+
+  uvicorn asgi_app:app --port 5000
+"""
+
+import asyncio
+import functools
+import os
+import shutil
+import tempfile
+
+from quart import Quart, jsonify, request
+from quart_cors import cors
+
+from artifacts import WATCH_SECONDS, registry
+from geo_index import GEO_RADIUS_KM, nearby_from_bytes
+from gpx_batch import (
+    IN_FLIGHT_PER_WORKER, MAX_WORKERS, extract_from_bytes, extract_from_path, get_pool, recovering,
+)
+from gpx_pipeline import catalogue_memory, parse_recommend_request, recommend, similar_hikes
+from gpx_stream import STREAMING_THRESHOLD_BYTES, upload_size
+from inference_scheduler import scheduler
+from instrumentation import collect_breakdown, render_prometheus, server_timing, stage
+from multi_track import check_mode, fan_out, score_parts, split_tracks, track_parts
+from online_update import ONLINE_UPDATES, WATCH_SECONDS as ONLINE_WATCH_SECONDS, updater
+from result_cache import cache, hash_stream
+from segment_pace import WINDOW_M, check_window, predict_segments, segments_from_bytes
+
+MAX_IN_FLIGHT = int(os.environ.get("GPX_ASYNC_MAX_IN_FLIGHT", MAX_WORKERS * IN_FLIGHT_PER_WORKER))
+RETRY_AFTER_SECONDS = 1
+STAGE_TIMING_HEADER = 'X-Stage-Timing'
+
+app = cors(Quart(__name__))
+# Flask doesn't cap uploads; Quart defaults to 16 MB, which would cut off
+# the big tracks gpx_stream.py exists for
+app.config["MAX_CONTENT_LENGTH"] = None
+
+_queue = {"in_flight": 0, "rejected": 0, "completed": 0}
+
+if os.environ.get("GPX_PRELOAD_ARTIFACTS") == "1":
+    registry.preload()
+
+if WATCH_SECONDS > 0 or ONLINE_UPDATES:
+    registry.watch(WATCH_SECONDS or ONLINE_WATCH_SECONDS)
+
+
+def queue_depth():
+    """Analyses currently admitted (queued or running) and the admission limit."""
+    return {"in_flight": _queue["in_flight"], "max_in_flight": MAX_IN_FLIGHT}
+
+
+async def on_thread(fn, *args):
+    """fn(*args) on the default thread pool, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def read_upload(upload):
+    """The bytes of an uploaded file, which may be spooled to disk."""
+    return await on_thread(upload.stream.read)
+
+
+def admitted(handler):
+    """
+    Run an upload handler under the shared admission limit: once
+    MAX_IN_FLIGHT analyses are in flight, answer 429 with the queue depth
+    and a Retry-After header, before the body is read.
+    """
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        if _queue["in_flight"] >= MAX_IN_FLIGHT:
+            _queue["rejected"] += 1
+            response = jsonify({'error': 'Server busy, retry later', **queue_depth()})
+            response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+            return response, 429
+
+        _queue["in_flight"] += 1
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            _queue["in_flight"] -= 1
+            _queue["completed"] += 1
+    return wrapper
+
+
+async def on_pool(fn, *args):
+    """fn(*args) on the shared process pool, which is replaced if a worker dies."""
+    pool = get_pool()
+    with recovering(pool):
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+def spool_upload(upload):
+    """Copy an upload into a named temp file a pool worker can open; returns its path."""
+    with tempfile.NamedTemporaryFile(suffix=".gpx", delete=False) as f:
+        upload.stream.seek(0)
+        shutil.copyfileobj(upload.stream, f)
+    return f.name
+
+
+async def analyze_upload(upload, timings):
+    """
+    Extract features on the process pool, from the bytes of a small upload
+    or from a temp file copy of a large one, then score them in a
+    micro-batch. Returns (features, stats).
+    """
+    size = await on_thread(upload_size, upload.stream)
+    with stage("extract"):
+        if size is not None and size <= STREAMING_THRESHOLD_BYTES:
+            feats = await on_pool(extract_from_bytes, await read_upload(upload))
+        else:
+            path = await on_thread(spool_upload, upload)
+            try:
+                feats = await on_pool(extract_from_path, path)
+            finally:
+                await on_thread(os.remove, path)
+    future = scheduler.submit(feats)
+    stats = await asyncio.wrap_future(future)
+    timings.update(future.stage_times)
+    return feats, stats
+
+
+@app.route('/api/health', methods=['GET'])
+async def health():
+    """
+    Simple health-check endpoint.
+    """
+    return jsonify({'status': 'healthy'}), 200
+
+
+@app.route('/api/artifacts', methods=['GET'])
+async def artifacts():
+    """
+    Per-artifact load time and resident size of the model registry.
+    """
+    return jsonify(registry.stats()), 200
+
+
+@app.route('/api/catalogue', methods=['GET'])
+async def catalogue():
+    """
+    Memory footprint of the served catalogue, as app.catalogue.
+    """
+    return jsonify(catalogue_memory()), 200
+
+
+@app.route('/api/queue', methods=['GET'])
+async def queue():
+    """
+    Admission state: analyses in flight, the limit, and how many uploads
+    were rejected or completed since start-up.
+    """
+    return jsonify({**_queue, "max_in_flight": MAX_IN_FLIGHT}), 200
+
+
+@app.route('/api/inference', methods=['GET'])
+async def inference():
+    """
+    Micro-batching metrics: batch sizes and queueing delay of model calls.
+    """
+    return jsonify(scheduler.stats()), 200
+
+
+@app.route('/api/online-updates', methods=['GET'])
+async def online_updates():
+    """
+    Online model updates from uploads: rows pending, applied and failed.
+    """
+    return jsonify(updater.stats()), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    """
+    Stage histograms plus scheduler and admission gauges, Prometheus format.
+    Extraction sub-stages run in the process pool and appear only as extract.
+    """
+    gauges = {f"gpx_inference_{k}": v for k, v in scheduler.stats().items()}
+    gauges.update({f"gpx_async_{k}": v for k, v in _queue.items()})
+    gauges["gpx_async_max_in_flight"] = MAX_IN_FLIGHT
+    return render_prometheus(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+@app.route('/api/process-gpx', methods=['POST'])
+@admitted
+async def process_gpx():
+    """
+    Same contract as app.process_gpx (multipart field 'file', JSON trail
+    stats, X-Cache headers, 400 on errors, Server-Timing breakdown on
+    'X-Stage-Timing: 1'), plus 429 when saturated.
+    """
+    with collect_breakdown() as timings:
+        with stage("total"):
+            response, status = await _process_upload(timings)
+    if request.headers.get(STAGE_TIMING_HEADER) == '1':
+        response.headers['Server-Timing'] = server_timing(timings)
+    return response, status
+
+
+@app.route('/api/process-gpx/segments', methods=['POST'])
+@admitted
+async def process_gpx_segments():
+    """
+    Same contract as app.process_gpx_segments (plus 429 when saturated):
+    per-window pace and ETA checkpoints. The windows are computed on the
+    process pool.
+    """
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        window_m = check_window(float((await request.values).get('window_m', WINDOW_M)))
+        feats, table = await on_pool(segments_from_bytes, await read_upload(files['file']), window_m)
+        result = await on_thread(predict_segments, feats, table, window_m)
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/process-gpx/nearby', methods=['POST'])
+@admitted
+async def process_gpx_nearby():
+    """
+    Same contract as app.process_gpx_nearby (plus 429 when saturated):
+    similar hikes starting near the upload. Parsing runs on the process
+    pool, the lookup on a thread.
+    """
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        values = await request.values
+        radius_km = float(values.get('radius_km', GEO_RADIUS_KM))
+        feats, (lat, lon) = await on_pool(nearby_from_bytes, await read_upload(files['file']))
+        result = await on_thread(
+            recommend, feats, int(values.get('k', 5)), values.get('difficulty'),
+            None, (lat, lon, radius_km),
+        )
+        return jsonify({'start': [lat, lon], 'radius_km': radius_km, **result}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/process-gpx/tracks', methods=['POST'])
+@admitted
+async def process_gpx_tracks():
+    """
+    Same contract as app.process_gpx_tracks (plus 429 when saturated): one
+    result per track or segment. Large multi-track files are parsed track by track on the
+    process pool, small ones on a worker thread; scoring runs once on a
+    thread.
+    """
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        mode = check_mode((await request.values).get('mode', 'track'))
+        data = await read_upload(files['file'])
+        loop = asyncio.get_running_loop()
+        docs = await on_thread(split_tracks, data)
+        executor = get_pool() if fan_out(data, docs) else None
+        with recovering(executor):
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, track_parts, doc, mode) for doc in docs
+            ))
+        return jsonify(await on_thread(score_parts, results)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/recommend', methods=['POST'])
+async def recommend_hikes():
+    """
+    Same contract as app.recommend_hikes: filtered nearest hikes for a
+    feature dict. The lookup runs on a worker thread.
+    """
+    body = await request.get_json(silent=True) or {}
+    try:
+        args = parse_recommend_request(body)
+        result = await on_thread(recommend, *args)
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/similar/<int:hike_id>', methods=['GET'])
+async def similar(hike_id):
+    """
+    Same contract as app.similar; a graph lookup is cheap enough to run
+    on the event loop.
+    """
+    try:
+        return jsonify(similar_hikes(hike_id, int(request.args.get('k', 5)))), 200
+    except IndexError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+async def _process_upload(timings):
+    """(response, status) for the request's upload, as in process_gpx."""
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    gpx_file = files['file']
+    try:
+        # Same bytes under the same artifacts -> same answer. Hashing, the
+        # artifact fingerprint and the SQLite tier all touch the disk
+        with stage("hash"):
+            content_hash = await on_thread(hash_stream, gpx_file.stream)
+            key = await on_thread(cache.key, content_hash)
+        with stage("cache"):
+            stats, tier = await on_thread(cache.get, key)
+        if stats is not None:
+            response = jsonify(stats)
+            response.headers['X-Cache'] = 'HIT'
+            response.headers['X-Cache-Tier'] = tier
+            return response, 200
+
+        # Large uploads are streamed inside the worker (extract_from_path)
+        feats, stats = await analyze_upload(gpx_file, timings)
+        await on_thread(cache.put, key, stats)
+        if ONLINE_UPDATES:
+            updater.observe(feats, content_hash)
+        response = jsonify(stats)
+        response.headers['X-Cache'] = 'MISS'
+        return response, 200
+    except Exception as e:
+        # Return any parsing or analysis error as a 400 response
+        return jsonify({'error': str(e)}), 400
@@ -0,0 +1,2 @@
+# Benchmarks for the backend hot paths; run from webApp/backend with
+# `python -m benchmarks.<name>`.
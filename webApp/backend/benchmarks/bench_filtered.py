@@ -0,0 +1,82 @@
+# backend/benchmarks/bench_filtered.py
+
+"""
+Filtered similar-hike queries: filtered_index.PartitionedIndex against
+brute force over the rows that pass the filter (the mask-then-scan a
+pandas post-filter amounts to), at growing catalogue sizes. Reports
+build time, per-query latency of both and whether the results agree.
+
+Usage:  python -m benchmarks.bench_filtered [--scales 10000 100000 1000000] [--queries 200]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from artifacts import clustering, registry
+from benchmarks.bench_index import scaled_catalogue
+from filtered_index import PartitionedIndex, difficulty_levels
+from gpx_pipeline import DIFF_FEATURES, catalogue_columns, scale_matrix
+
+# (description, difficulty levels, {column: (lo, hi)})
+QUERIES = [
+    ("unfiltered",          None, {}),
+    ("Hard",                [2],  {}),
+    ("Medium, under 4h",    [1],  {"duration": (None, 4 * 3600)}),
+    ("any, 800-1500 m max", None, {"max_elevation": (800, 1500)}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="*", default=[0, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    catalogue = catalogue_columns()
+    raw0 = np.column_stack([catalogue[c] for c in DIFF_FEATURES]).astype(np.float64)
+    scaler = registry.get("diff_scaler")
+    kmeans, cluster_map = clustering()
+
+    print(f"{'rows':>9} {'build s':>8} {'query':>22} {'index ms':>9} {'brute ms':>9} {'exact':>6}")
+    for scale in args.scales:
+        # Jitter in raw units (relative), then scale and label like the server does
+        raw = scaled_catalogue(raw0, scale, rng)
+        if raw.shape[0] > raw0.shape[0]:
+            raw[raw0.shape[0]:] *= rng.normal(1, 0.02, (raw.shape[0] - raw0.shape[0], 1))
+        X = scale_matrix(scaler, raw)
+        levels = difficulty_levels(kmeans.predict(X), cluster_map)
+
+        start = time.perf_counter()
+        index = PartitionedIndex().fit(X, raw, levels, DIFF_FEATURES)
+        build_s = time.perf_counter() - start
+        # New hikes drawn like the catalogue: catalogue rows with 2% jitter
+        picks = raw[rng.integers(0, raw.shape[0], args.queries)]
+        queries = scale_matrix(scaler, picks * rng.normal(1, 0.02, (args.queries, 1)))
+
+        for name, want, ranges in QUERIES:
+            lo, hi = index._bounds(ranges)
+            mask = np.all((raw >= lo) & (raw <= hi), axis=1)
+            if want is not None:
+                mask &= np.isin(levels, want)
+
+            start = time.perf_counter()
+            found = [index.kneighbors(q, args.k, want, ranges)[0] for q in queries]
+            index_ms = (time.perf_counter() - start) / args.queries * 1000
+
+            start = time.perf_counter()
+            truth = []
+            for q in queries:
+                d = np.sqrt(((X[mask] - q) ** 2).sum(1))
+                truth.append(np.sort(d)[:args.k])
+            brute_ms = (time.perf_counter() - start) / args.queries * 1000
+
+            exact = all(np.allclose(f, t) for f, t in zip(found, truth))
+            print(f"{X.shape[0]:>9} {build_s:>8.2f} {name:>22} {index_ms:>9.3f} {brute_ms:>9.3f} {str(exact):>6}")
+
+
+if __name__ == "__main__":
+    main()
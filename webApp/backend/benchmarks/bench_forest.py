@@ -0,0 +1,53 @@
+# backend/benchmarks/bench_forest.py
+
+"""
+Latency of the flattened forest (flat_forest.py) against the pickled
+RandomForestRegressor, for a single row and a 10k-row batch, plus a
+bit-for-bit comparison of their predictions.
+
+Usage:  python -m benchmarks.bench_forest [model.pkl] [model_flat.npz]
+"""
+
+import sys
+import time
+
+import joblib
+import numpy as np
+
+from artifacts import MODEL_FLAT_PATH, MODEL_PATH
+from flat_forest import FlatForest, export_forest
+
+
+def best_of(fn, repeat):
+    """Best wall time of `repeat` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(model_path=MODEL_PATH, flat_path=MODEL_FLAT_PATH):
+    model = joblib.load(model_path)
+    try:
+        flat = FlatForest.load(flat_path)
+    except FileNotFoundError:
+        flat = export_forest(model)
+
+    rng = np.random.default_rng(42)
+    X = rng.random((10_000, model.n_features_in_))
+
+    identical = np.array_equal(model.predict(X), flat.predict(X))
+    print(f"Predictions bit-identical on 10k rows: {identical}")
+
+    print(f"{'rows':>6} {'sklearn':>12} {'flat':>12} {'speedup':>8}")
+    for rows, repeat in ((1, 200), (10_000, 5)):
+        batch = X[:rows]
+        t_sk   = best_of(lambda: model.predict(batch), repeat)
+        t_flat = best_of(lambda: flat.predict(batch), repeat)
+        print(f"{rows:>6} {t_sk * 1e3:>10.3f}ms {t_flat * 1e3:>10.3f}ms {t_sk / t_flat:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,72 @@
+# backend/benchmarks/bench_index.py
+
+"""
+Recall@k and queries per second of every hike_index backend against the
+brute-force NearestNeighbors baseline, on the scaled FEATURES matrix of the
+catalogue. --scale grows the catalogue with jittered copies of its rows to
+see how each backend behaves at larger sizes.
+
+Usage:  python -m benchmarks.bench_index [--scale 1000000] [--queries 1000] [-k 3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from hike_index import INDEX_KINDS, build_index, catalogue_matrix
+
+
+def scaled_catalogue(X, n_rows, rng):
+    """Tile X up to n_rows rows, jittering the copies so they stay distinct."""
+    if n_rows <= X.shape[0]:
+        return X
+    picks = rng.integers(0, X.shape[0], n_rows - X.shape[0])
+    extra = X[picks] + rng.normal(0, 0.01, (picks.size, X.shape[1]))
+    return np.vstack([X, extra])
+
+
+def recall_at_k(found_dist, true_dist):
+    """
+    Fraction of returned neighbours that are among the true k nearest,
+    judged by distance so that ties between duplicate hikes don't count
+    as misses.
+    """
+    kth = true_dist[:, -1:] * (1 + 1e-9) + 1e-12
+    return float((found_dist <= kth).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=0, help="catalogue rows (default: as is)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--n-lists", type=int, default=0, help="ivf lists (default: ~sqrt(rows))")
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = scaled_catalogue(catalogue_matrix(), args.scale, rng)
+    queries = X[rng.integers(0, X.shape[0], args.queries)] + rng.normal(0, 0.02, (args.queries, X.shape[1]))
+    n_lists = args.n_lists or int(np.sqrt(X.shape[0]))
+    print(f"Catalogue {X.shape[0]} x {X.shape[1]}, {args.queries} queries, k={args.k}")
+
+    truth = None
+    print(f"{'index':>10} {'build s':>9} {'recall@k':>9} {'QPS':>10}")
+    for kind in INDEX_KINDS:
+        params = {"n_lists": n_lists, "n_probe": args.n_probe} if kind == "ivf" else {}
+        start = time.perf_counter()
+        index = build_index(X, kind, **params)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found, _ = index.kneighbors(queries, n_neighbors=args.k)
+        qps = args.queries / (time.perf_counter() - start)
+
+        if truth is None:       # brute force comes first and is the reference
+            truth = found
+        print(f"{kind:>10} {build_s:>9.2f} {recall_at_k(found, truth):>9.3f} {qps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# backend/benchmarks/bench_simplify.py
+
+"""
+What each gpx_simplify spec costs and buys: points kept, extraction time
+(parse + simplify + features) against the unsimplified path, the drift of
+every derived feature, and the drift of the predicted duration and
+difficulty cluster, over the bundled GPX files plus a synthetic 1 Hz track.
+
+Usage:  python -m benchmarks.bench_simplify [--specs rdp:2,time:5 ...] [--synthetic 50000]
+"""
+
+import argparse
+import glob
+import io
+import os
+import time
+import warnings
+
+import numpy as np
+
+from artifacts import registry
+from benchmarks.synthetic import synthetic_gpx
+from gpx_features import compute_features, read_track_arrays
+from gpx_pipeline import DIFF_FEATURES, TIME_FEATURES, feature_matrix, scale_matrix, time_model
+from gpx_simplify import extract_features, simplify
+
+DEFAULT_SPECS = [
+    "rdp:0.5", "rdp:2", "rdp:5",
+    "time:5", "time:15",
+    "distance:10", "distance:25",
+    "smooth:5", "smooth:5,rdp:2",
+]
+
+GPX_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+
+
+def best_time(fn, repeat):
+    """Fastest of `repeat` calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def predictions(feature_rows):
+    """Predicted duration (s) and difficulty cluster id for each feature dict."""
+    X = feature_matrix(feature_rows)
+    seconds  = time_model(len(X)).predict(scale_matrix(registry.get("scaler"), X[:, :len(TIME_FEATURES)]))
+    clusters = registry.get("diff_kmeans").predict(scale_matrix(registry.get("diff_scaler"), X))
+    return seconds, clusters
+
+
+def drift(new, old):
+    return 0.0 if old == new else (new - old) / abs(old) * 100 if old else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--specs", nargs="*", default=DEFAULT_SPECS)
+    parser.add_argument("--synthetic", type=int, default=50_000, help="points (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    tracks = {}
+    for path in sorted(glob.glob(os.path.join(GPX_DIR, "*.gpx"))):
+        with open(path, "rb") as f:
+            tracks[os.path.basename(path)] = f.read()
+    if args.synthetic:
+        tracks[f"synthetic-{args.synthetic}"] = synthetic_gpx(args.synthetic)
+
+    print("drift columns are % of the unsimplified value; 'cluster' counts difficulty changes")
+    print(f"{'track':>30} {'spec':>16} {'points':>13} {'extract ms':>16} {'speedup':>8} "
+          + " ".join(f"{c[:9]:>9}" for c in DIFF_FEATURES) + f" {'pred':>7} {'cluster':>7}")
+
+    for name, data in tracks.items():
+        track = read_track_arrays(io.BytesIO(data))
+        base  = compute_features(track)
+        base_s = best_time(lambda: extract_features(io.BytesIO(data), spec=""), args.repeat)
+        base_pred, base_cluster = predictions([base])
+
+        for spec in args.specs:
+            simplified = simplify(track, spec)
+            feats = compute_features(simplified)
+            spec_s = best_time(lambda: extract_features(io.BytesIO(data), spec=spec), args.repeat)
+            pred, cluster = predictions([feats])
+
+            feature_drift = " ".join(f"{drift(feats[c], base[c]):>+9.2f}" for c in DIFF_FEATURES)
+            print(f"{name[:30]:>30} {spec:>16} "
+                  f"{track.lat.size:>6}>{simplified.lat.size:>6} "
+                  f"{base_s * 1000:>7.1f}>{spec_s * 1000:>7.1f} {base_s / spec_s:>7.2f}x "
+                  f"{feature_drift} {drift(pred[0], base_pred[0]):>+7.2f} "
+                  f"{int(np.sum(cluster != base_cluster)):>7}")
+
+
+if __name__ == "__main__":
+    main()
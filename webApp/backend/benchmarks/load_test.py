@@ -0,0 +1,124 @@
+# backend/benchmarks/load_test.py
+
+"""
+Concurrent upload load test against a running GPX API (app.py under Flask
+or asgi_app.py under an ASGI server), reporting throughput, status counts
+and p50/p99 latency of the uploads and of /api/health probes sent while the
+uploads are running.
+
+Every upload gets a unique trailing XML comment so it misses the result
+cache; pass --cached to replay the files as-is.
+
+Usage:
+  python -m benchmarks.load_test --url http://127.0.0.1:5000 \
+      --concurrency 16 --requests 200 [files.gpx ...]
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BUNDLED_GPX = os.path.join(os.path.dirname(__file__), "..", "..", "..", "*.gpx")
+
+
+def multipart(field, filename, data):
+    """(body, content type) of a multipart/form-data upload of one file."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/gpx+xml\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def timed_request(req):
+    """(HTTP status, seconds) of one request; status 0 on connection errors."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def upload(url, name, data, unique):
+    if unique:
+        data = data + f"\n<!-- {uuid.uuid4().hex} -->\n".encode()
+    body, ctype = multipart("file", name, data)
+    req = urllib.request.Request(f"{url}/api/process-gpx", data=body, method="POST",
+                                 headers={"Content-Type": ctype})
+    return timed_request(req)
+
+
+def probe_health(url, stop, latencies, interval=0.05):
+    """Hit /api/health every `interval` seconds until `stop` is set."""
+    while not stop.is_set():
+        status, seconds = timed_request(urllib.request.Request(f"{url}/api/health"))
+        if status == 200:
+            latencies.append(seconds)
+        stop.wait(interval)
+
+
+def percentiles(seconds):
+    if not seconds:
+        return "n/a"
+    p50, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 99])
+    return f"p50 {p50:8.1f} ms   p99 {p99:8.1f} ms   (n={len(seconds)})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent upload load test.")
+    parser.add_argument("files", nargs="*", help="GPX files to upload (default: bundled tracks)")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--cached", action="store_true", help="don't make uploads unique")
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(BUNDLED_GPX))
+    tracks = [(os.path.basename(p), open(p, "rb").read()) for p in paths]
+
+    stop, health = threading.Event(), []
+    prober = threading.Thread(target=probe_health, args=(args.url, stop, health), daemon=True)
+    prober.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(upload, args.url, *tracks[i % len(tracks)], not args.cached)
+            for i in range(args.requests)
+        ]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [s for status, s in results if status == 200]
+
+    print(f"{args.requests} uploads, concurrency {args.concurrency}, {elapsed:.2f} s "
+          f"({len(ok) / elapsed:.1f} ok/s)")
+    print(f"status counts: {dict(sorted(statuses.items()))}")
+    print(f"uploads (200): {percentiles(ok)}")
+    print(f"all uploads:   {percentiles([s for _, s in results])}")
+    print(f"/api/health:   {percentiles(health)}")
+
+
+if __name__ == "__main__":
+    main()
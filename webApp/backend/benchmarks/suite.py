@@ -0,0 +1,346 @@
+# backend/benchmarks/suite.py
+
+"""
+Reproducible benchmark suite for the GPX analysis and inference hot paths.
+
+Cases (see CASES):
+  analyze/<track>     analyze_gpx_stream on the bundled tracks and on
+                      synthetic 1k-1M point tracks (benchmarks/synthetic.py)
+  stream/<track>      the same through the chunked streaming extractor
+  forest/<rows>       the duration model (timeRegression.py forest) as served
+  classifier/<rows>   difficulty KMeans + nearest-hike lookup (classifier.py)
+  score/<rows>        every model stage together (score_features)
+  endpoint/<track>    POST /api/process-gpx end to end through Flask's test
+                      client, with cache-busting uploads
+
+Each case runs in a fresh process (so peak RSS is its own), is warmed up
+once and then repeated for at least --min-time seconds; the run reports
+latency percentiles, throughput and peak RSS and is saved as JSON.
+
+Usage:
+  python -m benchmarks.suite run [--quick] [--only analyze/] [--out run.json]
+                                 [--baseline old.json] [--threshold 0.1]
+  python -m benchmarks.suite compare old.json new.json [--threshold 0.1]
+
+With a baseline (or in compare), the exit status is 1 if any case's p50
+latency got slower, or its peak RSS grew, by more than the threshold.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_GPX = sorted(glob.glob(os.path.join(BACKEND_DIR, "..", "..", "*.gpx")))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+SYNTHETIC_SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# Cases skipped by --quick
+SLOW_CASES = ("analyze/synthetic-1M", "stream/synthetic-1M")
+
+
+# ─── Cases ───────────────────────────────────────────────────────────────────
+# Each factory does its (untimed) setup and returns (fn, units per call, unit)
+
+def track_path(track):
+    """
+    File of a bundled or synthetic track. Synthetic ones are generated once
+    into the temp dir (by prepare_tracks, in the parent) so that building
+    them never counts towards a case's time or peak RSS.
+    """
+    if track.startswith("synthetic-"):
+        return os.path.join(tempfile.gettempdir(), f"gpx-bench-{track}-seed42.gpx")
+    return next(p for p in BUNDLED_GPX if os.path.basename(p) == track)
+
+
+def prepare_tracks(names):
+    """Write the synthetic tracks the given cases need, if not there yet."""
+    from benchmarks.synthetic import synthetic_gpx
+
+    for name in names:
+        track = CASES[name][1]
+        path = track_path(track) if track.startswith("synthetic-") else None
+        if path and not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f:
+                f.write(synthetic_gpx(SYNTHETIC_SIZES[track.split("-", 1)[1]], seed=42))
+            os.replace(path + ".tmp", path)
+
+
+def _track_bytes(track):
+    with open(track_path(track), "rb") as f:
+        return f.read()
+
+
+def _points(data):
+    return data.count(b"<trkpt")
+
+
+def case_analyze(track):
+    from gpx_pipeline import analyze_gpx_stream
+
+    data = _track_bytes(track)
+    return (lambda: analyze_gpx_stream(io.BytesIO(data))), _points(data), "points"
+
+
+def case_stream(track):
+    """Streaming extractor reading straight from disk, as for spooled uploads."""
+    from gpx_pipeline import analyze_gpx_stream
+
+    path = track_path(track)
+
+    def run():
+        with open(path, "rb") as f:
+            analyze_gpx_stream(f, streaming=True)
+    return run, _points(_track_bytes(track)), "points"
+
+
+def _feature_rows(n_rows):
+    """Realistic feature dicts: catalogue rows, repeated to n_rows."""
+    from gpx_pipeline import DIFF_FEATURES, catalogue_columns
+
+    cols = catalogue_columns()
+    picks = np.random.default_rng(42).integers(0, cols[DIFF_FEATURES[0]].size, n_rows)
+    return [{c: float(cols[c][i]) for c in DIFF_FEATURES} for i in picks]
+
+
+def case_forest(rows):
+    from artifacts import registry
+    from gpx_pipeline import TIME_FEATURES, feature_matrix, scale_matrix, time_model
+
+    n = int(rows)
+    X = scale_matrix(registry.get("scaler"), feature_matrix(_feature_rows(n))[:, :len(TIME_FEATURES)])
+    model = time_model(n)
+    return (lambda: model.predict(X)), n, "rows"
+
+
+def case_classifier(rows):
+    from artifacts import registry
+    from gpx_pipeline import feature_matrix, neighbor_index, scale_matrix
+
+    n = int(rows)
+    Xd = scale_matrix(registry.get("diff_scaler"), feature_matrix(_feature_rows(n)))
+    kmeans, index = registry.get("diff_kmeans"), neighbor_index()
+
+    def run():
+        kmeans.predict(Xd)
+        index.kneighbors(Xd, n_neighbors=3)
+    return run, n, "rows"
+
+
+def case_score(rows):
+    from gpx_pipeline import score_features
+
+    feature_rows = _feature_rows(int(rows))
+    return (lambda: score_features(feature_rows)), int(rows), "rows"
+
+
+def case_endpoint(track):
+    os.environ["GPX_CACHE_DIR"] = tempfile.mkdtemp(prefix="gpx-bench-cache-")
+    from app import app
+
+    client = app.test_client()
+    data = _track_bytes(track)
+    counter = iter(range(10 ** 9))
+
+    def run():
+        # A unique trailing comment per upload, so every call misses the cache
+        body = data + f"<!-- {next(counter)} -->".encode()
+        response = client.post("/api/process-gpx", data={"file": (io.BytesIO(body), track)})
+        if response.status_code != 200:
+            raise RuntimeError(f"endpoint returned {response.status_code}: {response.get_data(as_text=True)}")
+    return run, _points(data), "points"
+
+
+CASES = {}
+for _p in BUNDLED_GPX:
+    CASES[f"analyze/{os.path.basename(_p)}"] = (case_analyze, os.path.basename(_p))
+for _size in SYNTHETIC_SIZES:
+    CASES[f"analyze/synthetic-{_size}"] = (case_analyze, f"synthetic-{_size}")
+CASES["stream/synthetic-100k"] = (case_stream, "synthetic-100k")
+CASES["stream/synthetic-1M"]   = (case_stream, "synthetic-1M")
+for _rows in ("1", "1000"):
+    CASES[f"forest/{_rows}"]     = (case_forest, _rows)
+    CASES[f"classifier/{_rows}"] = (case_classifier, _rows)
+    CASES[f"score/{_rows}"]      = (case_score, _rows)
+CASES["endpoint/test.gpx"]        = (case_endpoint, "test.gpx")
+CASES["endpoint/synthetic-10k"]   = (case_endpoint, "synthetic-10k")
+
+
+# ─── Measurement ─────────────────────────────────────────────────────────────
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(name, min_time=1.0, min_runs=5, max_runs=10_000):
+    """Run one case in this process and return its result dict."""
+    warnings.filterwarnings("ignore")
+    os.chdir(BACKEND_DIR)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    factory, arg = CASES[name]
+    fn, units, unit = factory(arg)
+    fn()  # warm-up: lazy artifact loads, imports, caches
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "runs":           len(latencies),
+        "mean_ms":        round(float(ms.mean()), 4),
+        "p50_ms":         round(float(np.percentile(ms, 50)), 4),
+        "p90_ms":         round(float(np.percentile(ms, 90)), 4),
+        "p99_ms":         round(float(np.percentile(ms, 99)), 4),
+        "throughput":     round(units / float(ms.mean() / 1000), 2),
+        "unit":           f"{unit}/s",
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def environment():
+    """Versions and machine details recorded alongside the results."""
+    import sklearn
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev":   rev,
+        "python":    platform.python_version(),
+        "numpy":     np.__version__,
+        "sklearn":   sklearn.__version__,
+        "platform":  platform.platform(),
+        "cpus":      os.cpu_count(),
+    }
+
+
+def run_suite(names, min_time):
+    """Run each case in its own fresh process; returns {case: result}."""
+    # Generate synthetic tracks in a throwaway process: ru_maxrss carries over
+    # from parent to child on fork/exec, so the parent has to stay small
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        pool.submit(prepare_tracks, names).result()
+    results = {}
+    print(f"{'case':<40} {'p50 ms':>10} {'p99 ms':>10} {'throughput':>22} {'peak RSS':>10}")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            try:
+                result = pool.submit(run_case, name, min_time).result()
+            except Exception as e:
+                result = {"error": str(e)}
+        results[name] = result
+        if "error" in result:
+            print(f"{name:<40} ERROR {result['error']}")
+        else:
+            print(f"{name:<40} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+                  f"{result['throughput']:>14,.0f} {result['unit']:<7} "
+                  f"{result['peak_rss_bytes'] / 2 ** 20:>8.0f}MB")
+    return results
+
+
+# ─── Comparison ──────────────────────────────────────────────────────────────
+
+def compare(base, new, threshold=0.10, rss_threshold=None):
+    """
+    Print per-case p50 and peak RSS ratios (new / base) and return the list
+    of cases that regressed by more than the thresholds.
+    """
+    rss_threshold = threshold if rss_threshold is None else rss_threshold
+    regressions = []
+    print(f"{'case':<40} {'base p50':>10} {'new p50':>10} {'ratio':>7} {'RSS ratio':>10}")
+    for name in sorted(set(base["cases"]) | set(new["cases"])):
+        b, n = base["cases"].get(name), new["cases"].get(name)
+        if not b or not n or "error" in b or "error" in n:
+            print(f"{name:<40} {'(missing or failed in one run)':>40}")
+            continue
+        ratio     = n["p50_ms"] / b["p50_ms"]
+        rss_ratio = n["peak_rss_bytes"] / b["peak_rss_bytes"]
+        flags = []
+        if ratio > 1 + threshold:
+            flags.append("SLOWER")
+        if rss_ratio > 1 + rss_threshold:
+            flags.append("MORE RSS")
+        if flags:
+            regressions.append(name)
+        print(f"{name:<40} {b['p50_ms']:>10.3f} {n['p50_ms']:>10.3f} {ratio:>7.2f} "
+              f"{rss_ratio:>10.2f}  {' '.join(flags)}")
+    return regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPX analysis and inference benchmark suite.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="run the suite and save the results as JSON")
+    run_p.add_argument("--only", action="append", default=[], help="case name prefix (repeatable)")
+    run_p.add_argument("--quick", action="store_true", help="skip 1M-point cases, shorter timing")
+    run_p.add_argument("--min-time", type=float, default=None, help="seconds per case (default 1, quick 0.2)")
+    run_p.add_argument("--out", default=None, help=f"results file (default {RESULTS_DIR}/<time>.json)")
+    run_p.add_argument("--baseline", default=None, help="results JSON to compare against")
+    run_p.add_argument("--threshold", type=float, default=0.10)
+    run_p.add_argument("--rss-threshold", type=float, default=None)
+
+    cmp_p = sub.add_parser("compare", help="diff two results files")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--threshold", type=float, default=0.10)
+    cmp_p.add_argument("--rss-threshold", type=float, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        regressions = compare(_load(args.base), _load(args.new), args.threshold, args.rss_threshold)
+    else:
+        names = [n for n in CASES if not args.only or any(n.startswith(p) for p in args.only)]
+        if args.quick:
+            names = [n for n in names if n not in SLOW_CASES]
+        min_time = args.min_time if args.min_time is not None else (0.2 if args.quick else 1.0)
+
+        run = {"environment": environment(), "min_time": min_time,
+               "cases": run_suite(names, min_time)}
+        out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved {out}")
+
+        regressions = []
+        if args.baseline:
+            regressions = compare(_load(args.baseline), run, args.threshold, args.rss_threshold)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# backend/benchmarks/synthetic.py
+
+"""
+Reproducible synthetic GPX tracks of any size for benchmarks: a seeded
+random walk over hilly terrain with 1 s sampling, a few breaks and a
+second track segment, shaped like the bundled recordings.
+"""
+
+import numpy as np
+
+_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="benchmarks.synthetic" '
+    'xmlns="http://www.topografix.com/GPX/1/1">\n<trk><name>synthetic</name>\n'
+)
+
+
+def synthetic_gpx(n_points, seed=0, segments=2):
+    """GPX document (bytes) with n_points trackpoints split over `segments`."""
+    rng = np.random.default_rng(seed)
+
+    # ~1.2 m/s walk with a slowly turning heading
+    heading = np.cumsum(rng.normal(0, 0.05, n_points))
+    step_m  = np.abs(rng.normal(1.2, 0.3, n_points))
+    lat = 47.0 + np.cumsum(step_m * np.cos(heading)) / 111_320
+    lon = 11.0 + np.cumsum(step_m * np.sin(heading)) / (111_320 * np.cos(np.radians(47.0)))
+    ele = 800 + 300 * np.sin(np.arange(n_points) / 2000) + np.cumsum(rng.normal(0, 0.05, n_points))
+
+    # 1 s sampling with a handful of multi-minute pauses and a half-hour
+    # break between segments
+    bounds = np.linspace(0, n_points, segments + 1).astype(int)
+    dt = np.ones(n_points, dtype=np.int64)
+    dt[rng.integers(1, n_points, max(1, n_points // 5000))] = rng.integers(120, 900)
+    dt[bounds[1:-1]] = 1800
+    times = np.datetime64("2024-06-01T08:00:00", "s") + np.cumsum(dt).astype("timedelta64[s]")
+    stamps = np.datetime_as_string(times, unit="s")
+
+    parts = [_HEADER]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        parts.append("<trkseg>\n")
+        parts.extend(
+            f'<trkpt lat="{la:.7f}" lon="{lo_:.7f}"><ele>{el:.1f}</ele><time>{t}Z</time></trkpt>\n'
+            for la, lo_, el, t in zip(lat[lo:hi].tolist(), lon[lo:hi].tolist(),
+                                      ele[lo:hi].tolist(), stamps[lo:hi].tolist())
+        )
+        parts.append("</trkseg>\n")
+    parts.append("</trk>\n</gpx>\n")
+    return "".join(parts).encode()
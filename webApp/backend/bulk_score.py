@@ -0,0 +1,316 @@
+# backend/bulk_score.py
+
+"""
+Offline bulk scoring of GPX archives: the analyze_gpx_stream results of
+every .gpx under some directories and/or inside some zip files, written
+to Parquet or CSV.
+
+Files are read one at a time, hashed (SHA-256 of the content) and handed
+to gpx_batch.extract_batch, which parses them and computes features on the
+process pool with a bounded number in flight. Every --batch-size files,
+the successful rows are scored together (gpx_pipeline.score_features).
+The batch, failures included, is then written atomically to the output
+directory as part-NNNNN.parquet (or .csv):
+
+  file     path of the file (archive.zip/member.gpx inside zips)
+  sha256   content hash
+  model    artifact fingerprint (artifacts.registry) the row was scored with
+  error    why the file could not be analysed, else empty
+  ...      the stats fields of /api/process-gpx, nearest_hikes as JSON
+
+The part files are the checkpoint. On start, the (sha256, model) pairs of
+every part already in the output directory are read back. Files whose
+content was already scored with the current models are skipped, and so are
+duplicate files within a run. An interrupted run therefore resumes where
+its last written batch ended, and re-running after a model update re-scores
+everything. Failures count as done unless --retry-failed is given. Rows
+are only ever appended, so readers keep the last row of each sha256 when
+a directory holds several runs.
+
+A progress line (files/s, failures, skipped) goes to stderr, with a
+summary on exit.
+
+  python bulk_score.py archive/ more.zip --out scores/ [--format csv]
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+
+from gpx_batch import MAX_WORKERS, extract_batch, get_pool, read_member
+
+BATCH_SIZE = int(os.environ.get("GPX_BULK_BATCH_SIZE", 2000))
+
+# Seconds between progress line updates
+PROGRESS_INTERVAL = 1.0
+
+FORMATS = ("parquet", "csv")
+
+KEY_COLUMNS = ["file", "sha256", "model", "error"]
+
+# Columns of a scored row after the key columns, in /api/process-gpx order
+STATS_COLUMNS = [
+    "length_3d_m",
+    "uphill_m",
+    "downhill_m",
+    "min_elevation_m",
+    "max_elevation_m",
+    "break_time_sec",
+    "observed_duration_hm",
+    "predicted_duration_hm",
+    "predicted_difficulty",
+    "nearest_hikes"
+]
+
+COLUMNS = KEY_COLUMNS + STATS_COLUMNS
+
+_NUMERIC = set(STATS_COLUMNS[:6])
+
+
+# ─── Inputs ─────────────────────────────────────────────────────────────────
+
+def _is_gpx(path):
+    base = os.path.basename(path)
+    return base.lower().endswith(".gpx") and not base.startswith(".")
+
+
+def iter_gpx_files(paths):
+    """
+    Yield (name, bytes) for every GPX file in `paths`: .gpx files,
+    directories (walked recursively, in sorted order) and zip archives
+    (their .gpx members, named archive/member). Files that can't be read,
+    corrupt archives and members read_member refuses are yielded with the
+    exception instead of bytes, so they fail on their own.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    full = os.path.join(root, f)
+                    if _is_gpx(f) or f.lower().endswith(".zip"):
+                        yield from iter_gpx_files([full])
+        elif path.lower().endswith(".zip") or zipfile.is_zipfile(path):
+            try:
+                archive = zipfile.ZipFile(path)
+            except (zipfile.BadZipFile, OSError) as e:
+                yield path, e
+                continue
+            with archive:
+                for member in archive.infolist():
+                    if member.is_dir() or not _is_gpx(member.filename):
+                        continue
+                    try:
+                        data = read_member(archive, member)
+                    except (ValueError, zipfile.BadZipFile, OSError) as e:
+                        data = e
+                    yield os.path.join(path, member.filename), data
+        else:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                data = e
+            yield path, data
+
+
+# ─── Checkpoint (the part files) ────────────────────────────────────────────
+
+def part_paths(out_dir, fmt):
+    return sorted(glob.glob(os.path.join(out_dir, f"part-*.{fmt}")))
+
+
+def _read_keys(path, fmt):
+    """(sha256, model, error) of every row of one part file."""
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, columns=["sha256", "model", "error"]).to_pydict()
+        return zip(table["sha256"], table["model"], table["error"])
+    with open(path, newline="") as f:
+        return [(row["sha256"], row["model"], row["error"]) for row in csv.DictReader(f)]
+
+
+def load_done(out_dir, fmt, model, retry_failed=False):
+    """Content hashes already scored with `model` in the output directory."""
+    done = set()
+    for path in part_paths(out_dir, fmt):
+        for sha, row_model, error in _read_keys(path, fmt):
+            if row_model == model and not (retry_failed and error):
+                done.add(sha)
+    return done
+
+
+# ─── Output ─────────────────────────────────────────────────────────────────
+
+def result_row(name, sha, model, stats=None, error=None):
+    """One output row: the key columns and the flattened stats."""
+    row = {"file": name, "sha256": sha, "model": model, "error": error or ""}
+    for c in STATS_COLUMNS:
+        row[c] = None if stats is None else stats[c]
+    if stats is not None:
+        row["nearest_hikes"] = json.dumps(stats["nearest_hikes"])
+    return row
+
+
+def write_part(rows, path, fmt):
+    """Write one batch of rows atomically (the rename marks it as done)."""
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(c, pa.float64() if c in _NUMERIC else pa.string()) for c in COLUMNS])
+        table = pa.Table.from_pylist(rows, schema=schema)
+        pq.write_table(table, path + ".tmp")
+    else:
+        with open(path + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(path + ".tmp", path)
+
+
+class PartWriter:
+    """Numbered part files, continuing after the ones already there."""
+
+    def __init__(self, out_dir, fmt):
+        self.out_dir = out_dir
+        self.fmt     = fmt
+        existing = part_paths(out_dir, fmt)
+        self.next_part = int(os.path.basename(existing[-1])[5:10]) + 1 if existing else 0
+
+    def write(self, rows):
+        path = os.path.join(self.out_dir, f"part-{self.next_part:05d}.{self.fmt}")
+        write_part(rows, path, self.fmt)
+        self.next_part += 1
+        return path
+
+
+# ─── Run ────────────────────────────────────────────────────────────────────
+
+class Progress:
+    """Counters and a throttled one-line progress display on stderr."""
+
+    def __init__(self, stream=sys.stderr, interval=PROGRESS_INTERVAL):
+        self.stream   = stream
+        self.interval = interval
+        self.scored = self.failed = self.skipped = 0
+        self.started = self._shown = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return (self.scored + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def line(self):
+        return (f"{self.scored + self.failed} files ({self.rate:.1f} files/s), "
+                f"{self.failed} failed, {self.skipped} skipped")
+
+    def update(self, force=False):
+        now = time.perf_counter()
+        if force or now - self._shown >= self.interval:
+            self._shown = now
+            end = "\r" if self.stream.isatty() and not force else "\n"
+            self.stream.write(self.line() + end)
+            self.stream.flush()
+
+
+def _new_files(files, done, progress):
+    """
+    (key, bytes) of files not yet done, key being (name, sha256). Files
+    that were not read have no hash and are passed on to fail every run.
+    """
+    for name, data in files:
+        if isinstance(data, Exception):
+            yield (name, ""), data
+            continue
+        sha = hashlib.sha256(data).hexdigest()
+        if sha in done:
+            progress.skipped += 1
+            progress.update()
+            continue
+        done.add(sha)
+        yield (name, sha), data
+
+
+def score_batch(batch, model):
+    """Output rows of extract_batch results: score the successes together."""
+    from gpx_pipeline import score_features
+
+    ok = [(key, feats) for key, feats, error in batch if error is None]
+    stats = iter(score_features([feats for _, feats in ok])) if ok else iter(())
+    rows = []
+    for (name, sha), feats, error in batch:
+        if error is None:
+            rows.append(result_row(name, sha, model, stats=next(stats)))
+        else:
+            rows.append(result_row(name, sha, model, error=error))
+    return rows
+
+
+def bulk_score(paths, out_dir, fmt="parquet", batch_size=BATCH_SIZE, pool=None,
+               retry_failed=False, progress=None):
+    """
+    Score every new GPX file under `paths` into part files in `out_dir`.
+    Returns the Progress counters.
+    """
+    from artifacts import registry
+
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    model    = registry.refresh()
+    done     = load_done(out_dir, fmt, model, retry_failed)
+    writer   = PartWriter(out_dir, fmt)
+    progress = progress or Progress()
+
+    batch = []
+    uploads = _new_files(iter_gpx_files(paths), done, progress)
+    for key, feats, error in extract_batch(uploads, pool):
+        batch.append((key, feats, error))
+        if error is None:
+            progress.scored += 1
+        else:
+            progress.failed += 1
+        if len(batch) >= batch_size:
+            writer.write(score_batch(batch, model))
+            batch = []
+        progress.update()
+    if batch:
+        writer.write(score_batch(batch, model))
+    progress.update(force=True)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score GPX directories and zip archives in bulk.")
+    parser.add_argument("paths", nargs="+", help=".gpx files, directories or .zip archives")
+    parser.add_argument("--out", required=True, help="output directory (part files and checkpoint)")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="files per output part")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--retry-failed", action="store_true", help="re-analyse files that failed before")
+    args = parser.parse_args()
+
+    # The shared pool, so a worker crash only fails the files in flight
+    get_pool(args.workers)
+    try:
+        progress = bulk_score(args.paths, args.out, args.format, args.batch_size,
+                              retry_failed=args.retry_failed)
+    except KeyboardInterrupt:
+        sys.stderr.write("\nInterrupted; the next run resumes after the last written part\n")
+        raise SystemExit(130)
+
+    elapsed = time.perf_counter() - progress.started
+    print(f"Scored {progress.scored} files, {progress.failed} failed, {progress.skipped} skipped "
+          f"in {elapsed:.1f}s ({progress.rate:.1f} files/s) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# backend/compact_catalogue.py
+
+"""
+Compact in-memory form of the hike catalogue: one float32 feature matrix
+that is both the catalogue and its nearest-neighbour index.
+
+Without it a worker holds the catalogue twice: the Arrow table's float64
+columns and diff_nn's float64 copy of the scaled matrix. CompactCatalogue
+keeps the raw DIFF_FEATURES once, as an (n, 7) float32 matrix, and folds
+the difficulty scaler into the distance instead of storing its output:
+both supported scalers are a per-column affine map (x * scale + offset),
+so scaled rows are computed on the fly from whatever rows a query reads.
+That map is stored with the catalogue, and the pipeline only serves a
+catalogue whose map matches the served diff_scaler (fits()): after
+retraining classifier.py, rebuild it.
+
+kneighbors() is exact, with the NearestNeighbors interface. Small
+catalogues are scanned in row blocks with a running top-k (the winners
+re-measured exactly, like similarity_graph.py does). From PRUNE_MIN_ROWS
+rows on, the rows are also grouped into k-means lists of ~ROWS_PER_LIST
+hikes, kept as int32 row ids so the matrix stays in catalogue order; a
+query visits the lists by their lower bound (distance to the centroid
+minus the list's radius) and stops once no unvisited list can beat its
+k-th neighbour.
+
+Hike names are interned: each distinct name is stored once in a single
+UTF-8 buffer, addressed through an offsets array, and every row holds the
+int32 code of its name (-1 for unnamed rows such as online updates).
+
+Tolerance against the float64 catalogue and diff_nn: catalogue values are
+rounded to float32 (relative error below 6e-8, under 1 mm on a 10 km hike
+and under 0.01 s on a 24 h one), distances agree to ~1e-6, and the
+neighbour lists are the same except among hikes whose distances to the
+query differ by less than that (exact ties are broken by row). Difficulty
+labels of uploads do not change (the clustering only sees the query); the
+in-memory filtered and geo indexes could relabel a catalogue hike lying
+within 1e-7 of a cluster boundary.
+
+8-bit or product quantization is not offered: neighbour lengths and
+durations are returned verbatim, and 256 levels per column would move
+them by minutes and hundreds of meters.
+
+Build (writes model/difficulty_compact.pkl, which the pipeline then
+serves as the catalogue and, without a hike_index.py index, as the
+neighbour index):
+
+  python compact_catalogue.py
+"""
+
+import argparse
+import mmap
+import os
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+# Distance entries (queries x rows) computed per block, ~32 MB as float64
+BLOCK_ENTRIES = 4 * 1024 * 1024
+
+# Catalogues this large get pruning lists, of about this many rows each
+PRUNE_MIN_ROWS = 65_536
+ROWS_PER_LIST  = 256
+
+
+def scaler_affine(scaler):
+    """(scale, offset) with scaler.transform(X) == X * scale + offset."""
+    if hasattr(scaler, "min_"):          # MinMaxScaler
+        return np.asarray(scaler.scale_, dtype=np.float64), np.asarray(scaler.min_, dtype=np.float64)
+    if hasattr(scaler, "mean_"):         # StandardScaler
+        std = np.ones_like(scaler.mean_) if scaler.scale_ is None else scaler.scale_
+        mean = scaler.mean_ if scaler.with_mean else np.zeros_like(scaler.mean_)
+        return 1.0 / np.asarray(std, dtype=np.float64), -np.asarray(mean / std, dtype=np.float64)
+    raise TypeError(f"Cannot fold a {type(scaler).__name__} into the catalogue")
+
+
+def _is_mapped(a):
+    """True if the array's memory comes from a file mapping (shared between workers)."""
+    while a is not None:
+        if isinstance(a, (np.memmap, mmap.mmap)) or type(a).__module__.startswith("pyarrow"):
+            return True
+        a = getattr(a, "base", None)
+    return False
+
+
+def array_footprint(arrays):
+    """
+    {name: {"bytes", "shared"}} of some arrays plus totals: shared bytes are
+    file-backed pages every worker maps once, private ones are per worker.
+    """
+    report = {name: {"bytes": int(a.nbytes), "shared": _is_mapped(a)} for name, a in arrays.items()}
+    total  = sum(r["bytes"] for r in report.values())
+    shared = sum(r["bytes"] for r in report.values() if r["shared"])
+    return {"arrays": report, "total_bytes": total, "shared_bytes": shared, "private_bytes": total - shared}
+
+
+class CompactCatalogue:
+    """float32 catalogue matrix with the scaler folded in, plus interned names."""
+
+    def __init__(self, n_lists=None, random_state=42):
+        self.n_lists      = n_lists
+        self.random_state = random_state
+
+    def fit(self, raw, scaler, columns, names=None):
+        """
+        raw: (n, len(columns)) unscaled features; scaler: the fitted
+        difficulty scaler for those columns; names: one str (or None) per
+        row, optional. n_lists None picks n // ROWS_PER_LIST lists from
+        PRUNE_MIN_ROWS rows on and none below; 0 always scans. The scaler's
+        affine map (scale_, offset_) is kept to check it against later.
+        """
+        self.columns_ = list(columns)
+        self.matrix_  = np.ascontiguousarray(np.asarray(raw, dtype=np.float32))
+        self.scale_, self.offset_ = scaler_affine(scaler)
+        self.name_buffer_  = np.empty(0, dtype=np.uint8)
+        self.name_offsets_ = np.zeros(1, dtype=np.int64)
+        self.name_codes_   = np.empty(0, dtype=np.int32)
+        self._intern([None] * len(self.matrix_) if names is None else names)
+
+        n = self.n_samples_fit_
+        n_lists = self.n_lists
+        if n_lists is None:
+            n_lists = n // ROWS_PER_LIST if n >= PRUNE_MIN_ROWS else 0
+        self.centroids_ = None
+        if min(n_lists, n) > 1:
+            S = self.scaled(slice(None))
+            quantizer = MiniBatchKMeans(
+                n_clusters=min(n_lists, n), random_state=self.random_state, n_init=1, batch_size=4096,
+            ).fit(S)
+            self.centroids_ = quantizer.cluster_centers_
+            self._set_lists(quantizer.labels_, S, np.zeros(len(self.centroids_)))
+        return self
+
+    def add(self, raw, names=None):
+        """
+        Append rows (catalogue ids continue from n_samples_fit_); new rows
+        join the lists of their nearest centroids, which are not retrained.
+        """
+        raw = np.atleast_2d(np.asarray(raw, dtype=np.float32))
+        start = self.n_samples_fit_
+        self.matrix_ = np.vstack([self.matrix_, raw])
+        self._intern([None] * len(raw) if names is None else names)
+        self._columns = None
+        if self.centroids_ is not None:
+            labels = np.empty(start, dtype=np.int64)
+            labels[self.list_rows_] = np.repeat(np.arange(len(self.centroids_)), np.diff(self.list_offsets_))
+            S = self.scaled(slice(start, None))
+            new = ((S[:, None, :] - self.centroids_[None]) ** 2).sum(2).argmin(1)
+            radius = np.array(self.list_radius_)
+            self._set_lists(np.r_[labels, new], S, radius, start)
+        return self
+
+    def _intern(self, names):
+        """Append the codes of `names`, adding unseen names to the buffer."""
+        buffer, offsets = self.name_buffer_, self.name_offsets_
+        known = {
+            bytes(buffer[offsets[c]:offsets[c + 1]]).decode("utf-8"): c for c in range(offsets.size - 1)
+        }
+        first_new = len(known)
+        codes = [known.setdefault(name, len(known)) if isinstance(name, str) else -1 for name in names]
+        encoded = [name.encode("utf-8") for name in list(known)[first_new:]]
+        self.name_codes_   = np.r_[self.name_codes_, np.asarray(codes, dtype=np.int32)].astype(np.int32)
+        self.name_offsets_ = np.r_[offsets, offsets[-1] + np.cumsum([len(e) for e in encoded], dtype=np.int64)]
+        self.name_buffer_  = np.r_[buffer, np.frombuffer(b"".join(encoded), dtype=np.uint8)]
+
+    def _set_lists(self, labels, S, radius, first_row=0):
+        """Lists from every row's label; S are the scaled rows from first_row on."""
+        np.maximum.at(radius, labels[first_row:], np.sqrt(((S - self.centroids_[labels[first_row:]]) ** 2).sum(1)))
+        self.list_radius_  = radius
+        self.list_rows_    = np.argsort(labels, kind="stable").astype(np.int32)
+        self.list_offsets_ = np.r_[0, np.cumsum(np.bincount(labels, minlength=len(self.centroids_)))]
+
+    def __getstate__(self):
+        # The column views are rebuilt on demand, never pickled as copies
+        state = self.__dict__.copy()
+        state.pop("_columns", None)
+        return state
+
+    @property
+    def n_samples_fit_(self):
+        return self.matrix_.shape[0]
+
+    def fits(self, scaler):
+        """True if `scaler` is the one the catalogue was built with (same affine map)."""
+        scale, offset = scaler_affine(scaler)
+        return np.array_equal(scale, self.scale_) and np.array_equal(offset, self.offset_)
+
+    def columns(self):
+        """{column: float32 view into the matrix}, the same dict on every call."""
+        if getattr(self, "_columns", None) is None:
+            self._columns = {c: self.matrix_[:, j] for j, c in enumerate(self.columns_)}
+        return self._columns
+
+    def scaled(self, rows):
+        """The scaled (float64) feature rows of catalogue rows (a slice or an index array)."""
+        return self.matrix_[rows].astype(np.float64) * self.scale_ + self.offset_
+
+    def names(self, rows):
+        """Names of catalogue rows, None where a row has none."""
+        codes = self.name_codes_[np.asarray(rows, dtype=np.int64)]
+        buffer, offsets = self.name_buffer_, self.name_offsets_
+        return [
+            None if c < 0 else bytes(buffer[offsets[c]:offsets[c + 1]]).decode("utf-8")
+            for c in codes.ravel().tolist()
+        ]
+
+    def _scan(self, X, k):
+        """Top-k (distances, rows) of every query by scanning all rows in blocks."""
+        block_rows = max(1024, BLOCK_ENTRIES // X.shape[0])
+        best_i = np.empty((X.shape[0], 0), dtype=np.int64)
+        best_d = np.empty((X.shape[0], 0))
+        for lo in range(0, self.n_samples_fit_, block_rows):
+            S = self.scaled(slice(lo, lo + block_rows))
+            d = (S ** 2).sum(1)[None, :] - 2 * X @ S.T       # + |x|^2, same for every row
+            # The block's own top-k, then merged with the running one
+            top = np.argpartition(d, k - 1, axis=1)[:, :k] if d.shape[1] > k else np.indices(d.shape)[1]
+            cand_i = np.hstack([best_i, top + lo])
+            cand_d = np.hstack([best_d, np.take_along_axis(d, top, 1)])
+            if cand_d.shape[1] > k:
+                top = np.argpartition(cand_d, k - 1, axis=1)[:, :k]
+                cand_i = np.take_along_axis(cand_i, top, 1)
+                cand_d = np.take_along_axis(cand_d, top, 1)
+            best_i, best_d = cand_i, cand_d
+
+        # Re-measure the winners directly (the expansion above loses precision)
+        return np.sqrt(((self.scaled(best_i) - X[:, None, :]) ** 2).sum(2)), best_i
+
+    def _probe(self, x, k):
+        """Top-k (distances, rows) of one query, visiting lists by their lower bound."""
+        bound = np.maximum(np.sqrt(((self.centroids_ - x) ** 2).sum(1)) - self.list_radius_, 0)
+        best_d, best_i = np.empty(0), np.empty(0, dtype=np.int64)
+        for lst in np.argsort(bound):
+            if best_d.size >= k and bound[lst] > best_d[-1]:
+                break
+            rows = self.list_rows_[self.list_offsets_[lst]:self.list_offsets_[lst + 1]]
+            d = np.sqrt(((self.scaled(rows) - x) ** 2).sum(1))
+            best_d, best_i = np.r_[best_d, d], np.r_[best_i, rows]
+            top = np.lexsort((best_i, best_d))[:k]
+            best_d, best_i = best_d[top], best_i[top]
+        return best_d, best_i
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True):
+        """Exact kNN of scaled query rows X, as NearestNeighbors.kneighbors."""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        k = min(n_neighbors, self.n_samples_fit_)
+        if self.centroids_ is None:
+            distances, indices = self._scan(X, k)
+        else:
+            found = [self._probe(x, k) for x in X]
+            distances = np.array([d for d, _ in found]).reshape(len(X), k)
+            indices   = np.array([i for _, i in found], dtype=np.int64).reshape(len(X), k)
+
+        order = np.lexsort((indices, distances))
+        indices = np.take_along_axis(indices, order, 1)
+        if not return_distance:
+            return indices
+        return np.take_along_axis(distances, order, 1), indices
+
+    def memory_report(self):
+        """Per-worker footprint of the store, next to one float64 copy of its features."""
+        arrays = {
+            "matrix":       self.matrix_,
+            "name_codes":   self.name_codes_,
+            "name_offsets": self.name_offsets_,
+            "name_buffer":  self.name_buffer_,
+        }
+        if self.centroids_ is not None:
+            arrays.update(
+                list_rows=self.list_rows_, list_offsets=self.list_offsets_,
+                list_radius=self.list_radius_, centroids=self.centroids_,
+            )
+        return {
+            "store":         "compact",
+            "rows":          self.n_samples_fit_,
+            "names":         int(self.name_offsets_.size - 1),
+            "lists":         0 if self.centroids_ is None else len(self.centroids_),
+            "float64_bytes": int(self.matrix_.size * 8),
+            **array_footprint(arrays),
+        }
+
+
+def build_compact(catalogue_path=None, scaler=None, n_lists=None):
+    """A CompactCatalogue of the Arrow catalogue (with its names, if it has them)."""
+    from artifacts import DIFF_CATALOGUE_PATH, registry   # puts src/ on sys.path
+    from gpx_pipeline import DIFF_FEATURES
+    import feature_store
+
+    path = catalogue_path or DIFF_CATALOGUE_PATH
+    names = None
+    if "name" in feature_store.column_names(path):
+        names = feature_store.read_columns(path, ["name"])["name"].tolist()
+    raw = feature_store.read_matrix(path, DIFF_FEATURES)
+    return CompactCatalogue(n_lists).fit(raw, scaler or registry.get("diff_scaler"), DIFF_FEATURES, names)
+
+
+def main():
+    from artifacts import DIFF_COMPACT_PATH
+
+    parser = argparse.ArgumentParser(description="Build the compact hike catalogue.")
+    parser.add_argument("--catalogue", default=None, help="Arrow catalogue (default: the served one)")
+    parser.add_argument("--n-lists", type=int, default=None,
+                        help=f"pruning lists (default: rows // {ROWS_PER_LIST} from {PRUNE_MIN_ROWS} rows, 0: none)")
+    parser.add_argument("--out", default=DIFF_COMPACT_PATH)
+    args = parser.parse_args()
+
+    store = build_compact(args.catalogue, n_lists=args.n_lists)
+    joblib.dump(store, args.out + ".tmp")
+    os.replace(args.out + ".tmp", args.out)
+    report = store.memory_report()
+    print(f"Saved {store.n_samples_fit_} hikes ({report['total_bytes'] / 2**20:.2f} MB, "
+          f"float64 features alone {report['float64_bytes'] / 2**20:.2f} MB) -> {args.out}")
+
+
+if __name__ == "__main__":
+    # Pickle compact_catalogue.CompactCatalogue, not __main__.CompactCatalogue
+    import compact_catalogue
+    compact_catalogue.main()
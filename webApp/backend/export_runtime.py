@@ -0,0 +1,138 @@
+# backend/export_runtime.py
+
+"""
+Export the scoring models to the NumPy-only runtime (gpx_runtime.py).
+
+Reads the served artifacts through the registry (scaler, model or its
+model_flat export, diff_scaler, diff_kmeans, diff_cluster_map and the
+hike catalogue) and writes, atomically:
+
+  model/gpx_runtime.npz   every array, uncompressed, no pickles
+  model/gpx_runtime.json  manifest: format version, the artifact version
+                          (hash of the .npz), source file hashes, feature
+                          order, scaler kinds, cluster map, array specs
+
+Re-export whenever the models are retrained; the manifest's sources show
+which files a runtime was built from.
+
+  python export_runtime.py [--out model/gpx_runtime.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from artifacts import ARTIFACT_PATHS, clustering, registry
+from flat_forest import export_forest
+from gpx_pipeline import DIFF_FEATURES, TIME_FEATURES, catalogue_columns, compact_store, scale_matrix
+from gpx_runtime import NEIGHBOR_COLUMNS, RUNTIME_FORMAT, RUNTIME_PATH, RUNTIME_VERSION, Runtime
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scaler_arrays(which, scaler):
+    """(manifest spec, {array name: array}) of a fitted scaler."""
+    if isinstance(scaler, MinMaxScaler):
+        spec = {"kind": "minmax", "clip": bool(scaler.clip), "feature_range": list(scaler.feature_range)}
+        return spec, {f"{which}_scaler/scale": scaler.scale_, f"{which}_scaler/min": scaler.min_}
+    if isinstance(scaler, StandardScaler):
+        spec = {"kind": "standard", "with_mean": bool(scaler.with_mean), "with_std": bool(scaler.with_std)}
+        arrays = {}
+        if scaler.with_mean:
+            arrays[f"{which}_scaler/mean"] = scaler.mean_
+        if scaler.with_std:
+            arrays[f"{which}_scaler/scale"] = scaler.scale_
+        return spec, arrays
+    raise TypeError(f"Cannot export a {type(scaler).__name__}")
+
+
+def forest_arrays():
+    """The duration forest's flat arrays: the model_flat export if present, else flattened now."""
+    if registry.available("model_flat"):
+        forest = registry.get("model_flat")
+    else:
+        forest = export_forest(registry.get("model"))
+    names = ("feature", "threshold", "left", "right", "value", "missing_left", "roots")
+    arrays = {name: getattr(forest, name) for name in names}
+    arrays.update(max_depth=np.int64(forest.max_depth), n_features=np.int64(forest.n_features))
+    return {f"forest/{name}": a for name, a in arrays.items()}
+
+
+def export_runtime(out=RUNTIME_PATH):
+    """Write the runtime .npz and its manifest; returns the manifest."""
+    time_spec, time_arrays = scaler_arrays("time", registry.get("scaler"))
+    diff_scaler = registry.get("diff_scaler")
+    kmeans, cluster_map = clustering()
+    diff_spec, diff_arrays = scaler_arrays("diff", diff_scaler)
+
+    catalogue = catalogue_columns()
+    raw = np.column_stack([np.asarray(catalogue[c], dtype=np.float64) for c in DIFF_FEATURES])
+    arrays = {
+        **time_arrays,
+        **diff_arrays,
+        **forest_arrays(),
+        "kmeans/centers":   kmeans.cluster_centers_,
+        "catalogue/scaled": scale_matrix(diff_scaler, raw),
+        **{f"catalogue/{c}": raw[:, DIFF_FEATURES.index(c)].copy() for c in NEIGHBOR_COLUMNS},
+    }
+    arrays = {name: np.require(a, requirements="C") for name, a in arrays.items()}
+
+    npz_path = os.path.splitext(out)[0] + ".npz"
+    with open(npz_path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    npz_sha = _file_sha256(npz_path + ".tmp")
+
+    used = ["scaler", "model_flat" if registry.available("model_flat") else "model",
+            "diff_scaler", "diff_kmeans", "diff_cluster_map",
+            "diff_compact" if compact_store() is not None else
+            "diff_catalogue" if registry.available("diff_catalogue") else "diff_df_raw"]
+    manifest = {
+        "format":         RUNTIME_FORMAT,
+        "format_version": RUNTIME_VERSION,
+        "version":        npz_sha[:16],
+        "created":        time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "npz":            os.path.basename(npz_path),
+        "npz_sha256":     npz_sha,
+        "sources":        {
+            name: {"file": os.path.basename(ARTIFACT_PATHS[name]), "sha256": _file_sha256(ARTIFACT_PATHS[name])}
+            for name in used
+        },
+        "diff_features":  DIFF_FEATURES,
+        "time_features":  TIME_FEATURES,
+        "scalers":        {"time": time_spec, "diff": diff_spec},
+        "cluster_map":    {str(int(k)): v for k, v in cluster_map.items()},
+        "arrays":         {name: {"dtype": str(a.dtype), "shape": list(a.shape)} for name, a in arrays.items()},
+    }
+
+    # The arrays first, so a manifest never names a missing or partial .npz
+    os.replace(npz_path + ".tmp", npz_path)
+    with open(out + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(out + ".tmp", out)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the NumPy-only inference runtime.")
+    parser.add_argument("--out", default=RUNTIME_PATH, help="manifest path; the .npz goes next to it")
+    args = parser.parse_args()
+
+    manifest = export_runtime(args.out)
+    runtime = Runtime.load(args.out)
+    print(f"Exported runtime {manifest['version']} ({len(manifest['arrays'])} arrays, "
+          f"{runtime.catalogue.shape[0]} hikes, {runtime.forest.n_trees} trees) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# backend/filtered_index.py
+
+"""
+Partitioned index for filtered similar-hike queries ("the 5 nearest Hard
+hikes", "like this one but one level harder", "under 4h", "between 800 and
+1500 m").
+
+The catalogue is split by difficulty label (the KMeans cluster_map), then
+into length_3d, max_elevation and duration quantile buckets, each taken
+within the previous split so partitions fill evenly, sized so a partition
+holds about target_size hikes whatever the catalogue size. Rows are stored
+partition by partition (CSR offsets, as in hike_index.IVFIndex), and every
+partition keeps the raw min/max of each feature and its bounding box in
+scaled space.
+
+A query only visits partitions with an allowed label whose min/max ranges
+overlap the filters, in order of the distance from the query to their
+bounding box, and stops as soon as the next box is further away than the
+current k-th neighbour. Rows are filtered one by one only in partitions
+that straddle a filter bound. Results are exact.
+
+Build (writes model/difficulty_partitions.pkl; without it the pipeline
+builds one in memory on first use):
+
+  python filtered_index.py --target-size 256
+"""
+
+import argparse
+import math
+
+import joblib
+import numpy as np
+
+DIFFICULTY_LABELS = ["Easy", "Medium", "Hard"]    # easiest first, as in classifier.py
+
+# Raw columns split by quantiles within each difficulty level, in order
+BUCKET_COLUMNS = ("length_3d", "max_elevation", "duration")
+
+
+def _split_groups(group, values, n_buckets):
+    """
+    Split every group into n_buckets equal-count buckets of `values`, within
+    the group (so correlated columns still give evenly filled partitions).
+    Returns the refined group number of every row.
+    """
+    order = np.lexsort((values, group))
+    sorted_group = group[order]
+    starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+    sizes = np.diff(np.r_[starts, group.size])
+    first = np.repeat(starts, sizes)
+    bucket = np.empty(group.size, dtype=np.int64)
+    bucket[order] = (np.arange(group.size) - first) * n_buckets // np.repeat(sizes, sizes)
+    return group * n_buckets + bucket
+
+
+def check_n_neighbors(n_neighbors):
+    if n_neighbors < 1:
+        raise ValueError(f"n_neighbors must be at least 1, got {n_neighbors}")
+    return n_neighbors
+
+
+class PartitionedIndex:
+    """Exact filtered kNN over difficulty x length x elevation partitions."""
+
+    def __init__(self, target_size=256):
+        self.target_size = target_size
+
+    def fit(self, X, raw, levels, columns):
+        """
+        X: scaled feature matrix; raw: the same rows unscaled (filters are
+        in raw units); levels: difficulty level of each row (index into
+        DIFFICULTY_LABELS); columns: feature names of both matrices.
+        """
+        X   = np.ascontiguousarray(X, dtype=np.float64)
+        raw = np.ascontiguousarray(raw, dtype=np.float64)
+        levels = np.asarray(levels, dtype=np.int64)
+        self.columns_ = list(columns)
+        n_levels = len(DIFFICULTY_LABELS)
+
+        # Buckets per dimension so that partitions hold ~target_size rows
+        n_dims = len(BUCKET_COLUMNS)
+        per_dim = max(1, math.ceil((X.shape[0] / (n_levels * self.target_size)) ** (1 / n_dims)))
+        part = levels
+        for column in BUCKET_COLUMNS:
+            part = _split_groups(part, raw[:, self.columns_.index(column)], per_dim)
+        n_parts = n_levels * per_dim ** n_dims
+
+        order = np.argsort(part, kind="stable")
+        counts = np.bincount(part, minlength=n_parts)
+        self.levels_  = levels          # per catalogue row, in catalogue order
+        self.order_   = order
+        self.X_       = X[order]
+        self.raw_     = raw[order]
+        self.offsets_ = np.r_[0, np.cumsum(counts)]
+        self.level_   = np.repeat(np.arange(n_levels), per_dim ** n_dims)
+        self.nonempty_ = counts > 0
+
+        # Zone maps: raw min/max and scaled bounding box of every partition
+        starts = self.offsets_[:-1][self.nonempty_]
+        self.raw_min_ = np.full((n_parts, raw.shape[1]), np.inf)
+        self.raw_max_ = np.full((n_parts, raw.shape[1]), -np.inf)
+        self.box_lo_  = np.zeros((n_parts, X.shape[1]))
+        self.box_hi_  = np.zeros((n_parts, X.shape[1]))
+        if starts.size:
+            self.raw_min_[self.nonempty_] = np.minimum.reduceat(self.raw_, starts)
+            self.raw_max_[self.nonempty_] = np.maximum.reduceat(self.raw_, starts)
+            self.box_lo_[self.nonempty_]  = np.minimum.reduceat(self.X_, starts)
+            self.box_hi_[self.nonempty_]  = np.maximum.reduceat(self.X_, starts)
+        return self
+
+    @property
+    def n_samples_fit_(self):
+        return self.order_.size
+
+    def _bounds(self, ranges):
+        """Filter dict {column: (lo, hi)} -> lo/hi arrays over all columns."""
+        lo = np.full(len(self.columns_), -np.inf)
+        hi = np.full(len(self.columns_), np.inf)
+        for column, (low, high) in (ranges or {}).items():
+            j = self.columns_.index(column)
+            lo[j] = -np.inf if low is None else low
+            hi[j] = np.inf if high is None else high
+        return lo, hi
+
+    def kneighbors(self, x, n_neighbors=5, levels=None, ranges=None):
+        """
+        (distances, indices) of the n_neighbors nearest catalogue rows to the
+        scaled query x among rows whose level is in `levels` (all when None)
+        and whose raw features lie in `ranges` ({column: (lo, hi)}, either
+        bound may be None). Fewer rows come back if fewer match.
+        """
+        check_n_neighbors(n_neighbors)
+        x = np.asarray(x, dtype=np.float64).ravel()
+        lo, hi = self._bounds(ranges)
+
+        candidate = self.nonempty_ & np.all((self.raw_max_ >= lo) & (self.raw_min_ <= hi), axis=1)
+        if levels is not None:
+            candidate &= np.isin(self.level_, list(levels))
+        parts = np.flatnonzero(candidate)
+        # Partitions entirely inside the filters need no per-row check
+        inside = np.all((self.raw_min_[parts] >= lo) & (self.raw_max_[parts] <= hi), axis=1)
+
+        # Lower bound of the distance from x to anything in each partition
+        gap = np.clip(self.box_lo_[parts] - x, 0, None) + np.clip(x - self.box_hi_[parts], 0, None)
+        bound = np.sqrt((gap ** 2).sum(1))
+        visit = np.argsort(bound, kind="stable")
+
+        best_d = np.empty(0)
+        best_i = np.empty(0, dtype=np.int64)
+        for v in visit:
+            if best_d.size == n_neighbors and bound[v] > best_d[-1]:
+                break
+            start, end = self.offsets_[parts[v]], self.offsets_[parts[v] + 1]
+            rows = np.arange(start, end)
+            if not inside[v]:
+                raw = self.raw_[start:end]
+                rows = rows[np.all((raw >= lo) & (raw <= hi), axis=1)]
+                if rows.size == 0:
+                    continue
+            d = np.sqrt(((self.X_[rows] - x) ** 2).sum(1))
+            best_d = np.r_[best_d, d]
+            best_i = np.r_[best_i, rows]
+            if best_d.size > n_neighbors:
+                top = np.argpartition(best_d, n_neighbors - 1)[:n_neighbors]
+                best_d, best_i = best_d[top], best_i[top]
+            keep = np.argsort(best_d, kind="stable")
+            best_d, best_i = best_d[keep], best_i[keep]
+
+        return best_d, self.order_[best_i]
+
+
+def difficulty_levels(clusters, cluster_map):
+    """Level (index into DIFFICULTY_LABELS) of every cluster id in clusters."""
+    level_of = np.zeros(max(int(c) for c in cluster_map) + 1, dtype=np.int64)
+    for cid, label in cluster_map.items():
+        level_of[int(cid)] = DIFFICULTY_LABELS.index(label)
+    return level_of[np.asarray(clusters, dtype=np.int64)]
+
+
+def build_partitions(target_size=256):
+    """A PartitionedIndex over the served catalogue, scaler and clustering."""
+    from artifacts import clustering, registry
+    from gpx_pipeline import DIFF_FEATURES, catalogue_columns, scale_matrix
+
+    catalogue = catalogue_columns()
+    raw = np.column_stack([catalogue[c] for c in DIFF_FEATURES]).astype(np.float64)
+    X = scale_matrix(registry.get("diff_scaler"), raw)
+    kmeans, cluster_map = clustering()
+    levels = difficulty_levels(kmeans.predict(X), cluster_map)
+    return PartitionedIndex(target_size).fit(X, raw, levels, DIFF_FEATURES)
+
+
+def main():
+    from artifacts import DIFF_PARTITIONS_PATH
+
+    parser = argparse.ArgumentParser(description="Build the filtered similar-hike index.")
+    parser.add_argument("--target-size", type=int, default=256, help="hikes per partition")
+    parser.add_argument("--out", default=DIFF_PARTITIONS_PATH)
+    args = parser.parse_args()
+
+    index = build_partitions(args.target_size)
+    joblib.dump(index, args.out)
+    print(f"Saved {index.nonempty_.sum()} partitions over {index.n_samples_fit_} hikes -> {args.out}")
+
+
+if __name__ == "__main__":
+    # Pickle filtered_index.PartitionedIndex, not __main__.PartitionedIndex
+    import filtered_index
+    filtered_index.main()
@@ -0,0 +1,146 @@
+# backend/flat_forest.py
+
+"""
+Array-based inference for the RandomForestRegressor time model.
+
+export_forest() packs every tree of a fitted forest into flat node arrays
+(feature, threshold, left/right child, leaf value) and FlatForest.predict()
+walks all trees for a whole batch at once with NumPy fancy indexing. It
+follows sklearn's own arithmetic (float32 features compared against float64
+thresholds, tree outputs summed in estimator order, then averaged), so the
+predictions are bit-identical to model.predict.
+
+Export:  python flat_forest.py model/model.pkl model/model_flat.npz
+"""
+
+import numpy as np
+
+# From this batch size on, trees are walked one at a time
+BY_TREE_MIN_ROWS = 1024
+
+
+def export_forest(model, path=None):
+    """
+    Flatten a fitted RandomForestRegressor (single output) into packed node
+    arrays. Leaves point to themselves, so every tree can be walked for the
+    same number of steps. Saves them to `path` (.npz) when given.
+    """
+    features, thresholds, lefts, rights, values, missing_left, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        node_ids = np.arange(n, dtype=np.int64)
+        leaf = tree.children_left == -1
+
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, 0.0, tree.threshold))
+        lefts.append(np.where(leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(leaf, node_ids, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        missing = getattr(tree, "missing_go_to_left", None)
+        missing_left.append(np.zeros(n, dtype=bool) if missing is None else missing.astype(bool))
+        roots.append(offset)
+
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    arrays = {
+        "feature":      np.concatenate(features),
+        "threshold":    np.concatenate(thresholds),
+        "left":         np.concatenate(lefts),
+        "right":        np.concatenate(rights),
+        "value":        np.concatenate(values),
+        "missing_left": np.concatenate(missing_left),
+        "roots":        np.asarray(roots, dtype=np.int64),
+        "max_depth":    np.int64(max_depth),
+        "n_features":   np.int64(model.n_features_in_),
+    }
+    if path is not None:
+        np.savez(path, **arrays)
+    return FlatForest(arrays)
+
+
+class FlatForest:
+    """Vectorized predictor over the packed arrays written by export_forest."""
+
+    def __init__(self, arrays):
+        self.feature      = arrays["feature"]
+        self.threshold    = arrays["threshold"]
+        self.left         = arrays["left"]
+        self.right        = arrays["right"]
+        self.value        = arrays["value"]
+        self.missing_left = arrays["missing_left"]
+        self.roots        = arrays["roots"]
+        self.max_depth    = int(arrays["max_depth"])
+        self.n_features   = int(arrays["n_features"])
+        # Interleaved [left, right] pairs: child = children[2 * node + go_right]
+        self.children     = np.stack([self.left, self.right], axis=1).ravel()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    @property
+    def n_trees(self):
+        return self.roots.size
+
+    def _walk(self, Xf, n_rows, node, has_nan):
+        """
+        Advance `node` (any shape, last axis = rows) to its leaves. Xf is the
+        input transposed and flattened, so x[row, f] == Xf[f * n_rows + row].
+        """
+        rows = np.arange(n_rows)
+        for _ in range(self.max_depth):
+            x = Xf.take(self.feature.take(node) * n_rows + rows)
+            go_left = x <= self.threshold.take(node)
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left.take(node)
+            node = self.children.take(2 * node + ~go_left)
+        return node
+
+    def _prepare(self, X):
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input of shape (n, {self.n_features}), got {X.shape}")
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = X.astype(np.float32)
+        return X.T.ravel().astype(np.float64), X.shape[0], bool(np.isnan(X).any())
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_trees, n_rows)."""
+        Xf, n_rows, has_nan = self._prepare(X)
+        node = np.repeat(self.roots[:, None], n_rows, axis=1)
+        return self._walk(Xf, n_rows, node, has_nan)
+
+    def predict(self, X):
+        Xf, n_rows, has_nan = self._prepare(X)
+        acc = np.zeros(n_rows, dtype=np.float64)
+
+        if n_rows < BY_TREE_MIN_ROWS:
+            # Few rows: walk every tree at once, a handful of NumPy calls
+            node = np.repeat(self.roots[:, None], n_rows, axis=1)
+            leaf_values = self.value.take(self._walk(Xf, n_rows, node, has_nan))
+            # Sum tree by tree, in estimator order, exactly like sklearn
+            for tree_values in leaf_values:
+                acc += tree_values
+        else:
+            # Many rows: one tree at a time keeps its nodes cache-resident
+            for root in self.roots:
+                node = np.full(n_rows, root, dtype=np.int64)
+                acc += self.value.take(self._walk(Xf, n_rows, node, has_nan))
+
+        acc /= self.n_trees
+        return acc
+
+
+if __name__ == "__main__":
+    import sys
+    import joblib
+
+    src, dst = sys.argv[1:3]
+    forest = export_forest(joblib.load(src), dst)
+    print(f"Exported {forest.n_trees} trees ({forest.feature.size} nodes, "
+          f"max depth {forest.max_depth}) -> {dst}")
@@ -0,0 +1,218 @@
+# backend/geo_index.py
+
+"""
+Spatial index over where catalogue hikes start, for "similar hikes near
+me" queries.
+
+Preprocessor.py keeps every track's start point and bounding box
+(feature_store.GEO_COLUMNS) and classifier.py carries them into the
+catalogue. GeoIndex buckets the start points into a geohash-like grid of
+cell_deg x cell_deg cells and stores the hikes cell by cell, sorted by
+latitude band and then longitude cell, so the cells a radius query has to
+look at form one contiguous slice per latitude band. Candidates in those
+slices are measured with the haversine formula, so the radius is exact
+great-circle distance at any latitude.
+
+Next to the start points the index keeps, in the same spatial order, the
+scaled feature rows, raw features and difficulty level of every hike
+(like filtered_index.PartitionedIndex does per partition). kneighbors()
+then runs the whole "similar hikes within 50 km" query on contiguous
+slices: radius, difficulty and range filters first, then an exact
+feature-space kNN over what is left.
+
+Hikes without a start point (no track points in the source, or rows
+added by online updates) are left out of the index.
+
+Build (writes model/difficulty_geo.pkl; without it the pipeline builds
+one in memory on first use):
+
+  python geo_index.py --cell-deg 0.25
+"""
+
+import argparse
+import io
+import os
+
+import joblib
+import numpy as np
+
+from filtered_index import check_n_neighbors, difficulty_levels
+from gpx_features import compute_features, read_track_arrays
+from instrumentation import stage
+
+GEO_RADIUS_KM = float(os.environ.get("GPX_GEO_RADIUS_KM", 50))
+
+# Mean Earth radius (IUGG), for converting haversine radians to kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _haversine_a(lat1, lon1, lat2, lon2, cos_lat2):
+    """The haversine term a = sin^2(d / 2R) between points in radians."""
+    return np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+
+
+def _a_to_km(a):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between points given in radians."""
+    return _a_to_km(_haversine_a(lat1, lon1, lat2, lon2, np.cos(lat2)))
+
+
+class GeoIndex:
+    """Grid-bucketed hike start points, with each hike's features alongside."""
+
+    def __init__(self, cell_deg=0.25):
+        self.cell_deg = cell_deg
+
+    def fit(self, lat, lon, X, raw, levels, columns):
+        """
+        lat/lon: start point (degrees) of every catalogue row, NaN where
+        unknown; X/raw: scaled and unscaled feature rows; levels: difficulty
+        level of every row; columns: feature names of X and raw.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        located = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        self.columns_ = list(columns)
+        self.n_samples_fit_ = lat.size
+        self.n_lon_cells_ = int(np.ceil(360 / self.cell_deg))
+
+        keys = self._cell(lat[located], lon[located])
+        order = np.argsort(keys, kind="stable")
+        self.rows_    = located[order]
+        self.keys_    = keys[order]
+        self.lat_     = np.radians(lat[self.rows_])
+        self.lon_     = np.radians(lon[self.rows_])
+        self.cos_lat_ = np.cos(self.lat_)
+        self.X_       = np.ascontiguousarray(np.asarray(X, dtype=np.float64)[self.rows_])
+        self.raw_     = np.ascontiguousarray(np.asarray(raw, dtype=np.float64)[self.rows_])
+        self.levels_  = np.asarray(levels, dtype=np.int64)[self.rows_]
+        return self
+
+    def _band(self, lat):
+        return np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64)
+
+    def _lon_cell(self, lon):
+        return np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64) % self.n_lon_cells_
+
+    def _cell(self, lat, lon):
+        return self._band(lat) * self.n_lon_cells_ + self._lon_cell(lon)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Positions (in index order) of every hike in a cell the circle touches."""
+        reach = np.degrees(radius_km / EARTH_RADIUS_KM)
+        lat_lo, lat_hi = max(lat - reach, -90.0), min(lat + reach, 90.0)
+        # Widest longitude extent of the circle; the whole band near a pole
+        if max(abs(lat_lo), abs(lat_hi)) >= 90 or reach >= 90:
+            lon_ranges = [(0, self.n_lon_cells_ - 1)]
+        else:
+            half = np.degrees(np.arcsin(min(1.0, np.sin(np.radians(reach)) / np.cos(np.radians(lat)))))
+            first, last = int(self._lon_cell(lon - half)), int(self._lon_cell(lon + half))
+            if half >= 180 - self.cell_deg:
+                lon_ranges = [(0, self.n_lon_cells_ - 1)]
+            elif first <= last:
+                lon_ranges = [(first, last)]
+            else:       # across the antimeridian
+                lon_ranges = [(first, self.n_lon_cells_ - 1), (0, last)]
+
+        slices = []
+        for band in range(int(self._band(lat_lo)), int(self._band(lat_hi)) + 1):
+            for first, last in lon_ranges:
+                base = band * self.n_lon_cells_
+                start, end = np.searchsorted(self.keys_, [base + first, base + last + 1])
+                if end > start:
+                    slices.append(np.arange(start, end))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def _within(self, lat, lon, radius_km):
+        """
+        Positions and haversine terms of the hikes within the radius,
+        compared as a <= sin^2(r / 2R) so only the results pay for arcsin.
+        """
+        pos = self._candidates(lat, lon, radius_km)
+        a = _haversine_a(np.radians(lat), np.radians(lon), self.lat_[pos], self.lon_[pos], self.cos_lat_[pos])
+        inside = a <= np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2) ** 2
+        return pos[inside], a[inside]
+
+    def within(self, lat, lon, radius_km=GEO_RADIUS_KM):
+        """(catalogue rows, distances in km) of hikes starting within radius_km of lat/lon."""
+        pos, a = self._within(lat, lon, radius_km)
+        return self.rows_[pos], _a_to_km(a)
+
+    def kneighbors(self, x, n_neighbors, levels, ranges, lat, lon, radius_km=GEO_RADIUS_KM):
+        """
+        Exact feature-space kNN of the scaled query x among hikes starting
+        within radius_km of lat/lon whose level is in `levels` (all when
+        None) and whose raw features lie in `ranges` ({column: (lo, hi)}).
+        Returns (distances, catalogue rows, levels, km from lat/lon).
+        """
+        check_n_neighbors(n_neighbors)
+        pos, a = self._within(lat, lon, radius_km)
+        keep = np.ones(pos.size, dtype=bool)
+        if levels is not None:
+            keep &= np.isin(self.levels_[pos], list(levels))
+        for column, (low, high) in (ranges or {}).items():
+            values = self.raw_[pos, self.columns_.index(column)]
+            keep &= (values >= (-np.inf if low is None else low)) & (values <= (np.inf if high is None else high))
+        pos, a = pos[keep], a[keep]
+
+        d = np.sqrt(((self.X_[pos] - np.asarray(x, dtype=np.float64).ravel()) ** 2).sum(1))
+        top = np.argpartition(d, n_neighbors - 1)[:n_neighbors] if d.size > n_neighbors else np.arange(d.size)
+        top = top[np.argsort(d[top], kind="stable")]
+        return d[top], self.rows_[pos[top]], self.levels_[pos[top]], _a_to_km(a[top])
+
+
+def start_point(track):
+    """(lat, lon) of the first located point of a parsed track."""
+    located = np.flatnonzero(np.isfinite(track.lat) & np.isfinite(track.lon))
+    if located.size == 0:
+        raise ValueError("Track has no located points")
+    return float(track.lat[located[0]]), float(track.lon[located[0]])
+
+
+def nearby_from_bytes(data):
+    """(features, start point) of a GPX document; safe for pool workers."""
+    with stage("parse"):
+        track = read_track_arrays(io.BytesIO(data))
+    with stage("features"):
+        return compute_features(track), start_point(track)
+
+
+def build_geo_index(cell_deg=0.25):
+    """A GeoIndex over the served catalogue, scaler and clustering."""
+    from artifacts import clustering, registry
+    from gpx_pipeline import DIFF_FEATURES, catalogue_columns, scale_matrix
+
+    geometry = registry.get("diff_geometry")
+    if geometry is None:
+        raise ValueError(
+            "The hike catalogue has no start points; rebuild it with Preprocessor.py, "
+            "feature_store.py data/features.arrow and classifier.py"
+        )
+    catalogue = catalogue_columns()
+    raw = np.column_stack([catalogue[c] for c in DIFF_FEATURES]).astype(np.float64)
+    X = scale_matrix(registry.get("diff_scaler"), raw)
+    kmeans, cluster_map = clustering()
+    levels = difficulty_levels(kmeans.predict(X), cluster_map)
+    return GeoIndex(cell_deg).fit(geometry["start_lat"], geometry["start_lon"], X, raw, levels, DIFF_FEATURES)
+
+
+def main():
+    from artifacts import DIFF_GEO_PATH
+
+    parser = argparse.ArgumentParser(description="Build the hike start-point index.")
+    parser.add_argument("--cell-deg", type=float, default=0.25, help="grid cell size in degrees")
+    parser.add_argument("--out", default=DIFF_GEO_PATH)
+    args = parser.parse_args()
+
+    index = build_geo_index(args.cell_deg)
+    joblib.dump(index, args.out)
+    print(f"Saved {index.rows_.size} located hikes of {index.n_samples_fit_} -> {args.out}")
+
+
+if __name__ == "__main__":
+    # Pickle geo_index.GeoIndex, not __main__.GeoIndex
+    import geo_index
+    geo_index.main()
@@ -0,0 +1,216 @@
+# backend/gpx_batch.py
+
+"""
+Bulk GPX analysis: parsing and feature extraction fan out over a process
+pool, then the models run once on the stacked feature matrix
+(gpx_pipeline.score_features).
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from gpx_simplify import extract_features
+from gpx_stream import STREAMING_THRESHOLD_BYTES, stream_features
+
+MAX_WORKERS = int(os.environ.get("GPX_BATCH_WORKERS", os.cpu_count() or 1))
+
+# Files queued per worker, bounding how many uploads sit in memory at once
+IN_FLIGHT_PER_WORKER = 2
+
+# Uploads bigger than this are spooled to disk while the batch runs
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
+# Zip members bigger than this (uncompressed) are reported, not read
+MAX_MEMBER_BYTES = int(os.environ.get("GPX_BATCH_MAX_MEMBER_BYTES", 64 * 1024 * 1024))
+
+WORKER_CRASHED = "Worker process died while analysing this file (out of memory?)"
+
+_pool      = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(max_workers=None):
+    """
+    Process pool shared by every batch request, created on first use with
+    max_workers (default MAX_WORKERS) processes.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers or MAX_WORKERS)
+        return _pool
+
+
+def reset_pool(broken):
+    """
+    Forget the shared pool once it is broken (a worker died, e.g. killed
+    for running out of memory on a hostile upload), so the next get_pool()
+    starts a fresh one instead of every later request failing with
+    BrokenProcessPool. Pools other than the shared one are left alone.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+@contextlib.contextmanager
+def recovering(pool):
+    """Reset the shared pool if `pool` breaks inside the block; the error still propagates."""
+    try:
+        yield pool
+    except BrokenProcessPool:
+        reset_pool(pool)
+        raise
+
+
+def detach_upload(upload):
+    """
+    Copy an uploaded file into our own spooled temp file so it outlives the
+    request (the response is streamed after werkzeug closes its uploads).
+    Returns (filename, file object).
+    """
+    copy = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    upload.stream.seek(0)
+    shutil.copyfileobj(upload.stream, copy)
+    copy.seek(0)
+    return upload.filename or "upload.gpx", copy
+
+
+def read_member(archive, member):
+    """
+    Bytes of a zip member, refusing members that would inflate past
+    MAX_MEMBER_BYTES (zipfile never returns more than the declared size).
+    """
+    if member.file_size > MAX_MEMBER_BYTES:
+        raise ValueError(
+            f"Archive member is {member.file_size} bytes uncompressed; "
+            f"the limit is {MAX_MEMBER_BYTES}"
+        )
+    return archive.read(member)
+
+
+def iter_gpx_uploads(files):
+    """
+    Yield (name, bytes) for every GPX in a list of (filename, file object)
+    pairs; zip archives are expanded into their .gpx members. Members that
+    read_member refuses are yielded with the exception instead of bytes.
+    """
+    for name, stream in files:
+        with stream:
+            if name.lower().endswith(".zip") or zipfile.is_zipfile(stream):
+                stream.seek(0)
+                with zipfile.ZipFile(stream) as archive:
+                    for member in archive.infolist():
+                        base = os.path.basename(member.filename)
+                        if member.is_dir() or base.startswith(".") or not base.lower().endswith(".gpx"):
+                            continue
+                        try:
+                            data = read_member(archive, member)
+                        except ValueError as e:
+                            data = e
+                        yield member.filename, data
+            else:
+                stream.seek(0)
+                yield name, stream.read()
+
+
+def extract_from_bytes(data):
+    """Worker entry point: feature dict for one GPX file's raw bytes."""
+    if len(data) > STREAMING_THRESHOLD_BYTES:
+        return stream_features(io.BytesIO(data))
+    return extract_features(io.BytesIO(data))
+
+
+def extract_from_path(path):
+    """Worker entry point: feature dict for a GPX file on disk, streamed when large."""
+    with open(path, "rb") as f:
+        if os.path.getsize(path) > STREAMING_THRESHOLD_BYTES:
+            return stream_features(f)
+        return extract_features(f)
+
+
+def extract_batch(uploads, pool=None):
+    """
+    Extract features for (name, bytes) pairs across the process pool.
+    Yields (name, feature_dict, None) or (name, None, error_message) in
+    completion order; an exception in place of the bytes is reported as
+    that file's error.
+
+    If a worker dies, the files in flight on the pool are reported as
+    failed and the rest go to a fresh shared pool. A pool passed in by the
+    caller is not replaced: once broken, every remaining file fails.
+    """
+    shared = pool is None
+    pool = pool or get_pool()
+    # Sized from the pool in use: bulk_score --workers and callers' own
+    # pools need not match GPX_BATCH_WORKERS
+    limit = getattr(pool, "_max_workers", MAX_WORKERS) * IN_FLIGHT_PER_WORKER
+    uploads = iter(uploads)
+    pending = {}
+
+    while True:
+        # Keep the pool fed without reading the whole batch into memory
+        for name, data in uploads:
+            if isinstance(data, Exception):
+                yield name, None, str(data)
+                continue
+            try:
+                future = pool.submit(extract_from_bytes, data)
+            except BrokenProcessPool:
+                # The futures already pending fail with it and are reported
+                # below; this file has not run yet and gets a fresh pool
+                if not shared:
+                    yield name, None, WORKER_CRASHED
+                    continue
+                reset_pool(pool)
+                pool = get_pool()
+                future = pool.submit(extract_from_bytes, data)
+            pending[future] = name
+            if len(pending) >= limit:
+                break
+        if not pending:
+            return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                yield name, future.result(), None
+            except BrokenProcessPool:
+                if shared:
+                    reset_pool(pool)
+                yield name, None, WORKER_CRASHED
+            except Exception as e:
+                yield name, None, str(e)
+
+
+def analyze_batch(uploads, pool=None):
+    """
+    Analyze many GPX files. Failures are yielded as soon as they happen;
+    successful tracks are scored together once extraction is finished and
+    then yielded in the order their extraction completed.
+    """
+    # Imported here so pool workers don't load the model artifacts
+    from gpx_pipeline import score_features
+
+    names, rows = [], []
+    for name, feats, error in extract_batch(uploads, pool):
+        if error is not None:
+            yield {"file": name, "error": error}
+        else:
+            names.append(name)
+            rows.append(feats)
+
+    if rows:
+        for name, stats in zip(names, score_features(rows)):
+            yield {"file": name, "stats": stats}
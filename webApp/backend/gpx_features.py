@@ -0,0 +1,259 @@
+# backend/gpx_features.py
+
+"""
+NumPy feature extraction for GPX tracks.
+
+Track points are read straight into flat arrays (one entry per <trkpt>) and
+the trail statistics are computed with array operations, reproducing what
+gpxpy's length_3d(), get_duration() and get_uphill_downhill() return without
+building a Python object per point.
+"""
+
+import math
+import warnings
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from instrumentation import stage
+
+# Same constants gpxpy.geo uses, so distances match to the last digit
+EARTH_RADIUS = 6378.137 * 1000
+ONE_DEGREE   = (2 * math.pi * EARTH_RADIUS) / 360
+
+# gpxpy falls back to haversine once two points are this far apart (degrees)
+HAVERSINE_THRESHOLD = 0.2
+
+_EPOCH = np.datetime64("1970-01-01T00:00:00", "us")
+
+
+class TrackArrays(NamedTuple):
+    """Flat per-point arrays for every track segment in a GPX file."""
+    lat:     np.ndarray   # float64, degrees
+    lon:     np.ndarray   # float64, degrees
+    ele:     np.ndarray   # float64, meters (NaN when missing)
+    time:    np.ndarray   # float64, seconds since epoch (NaN when missing)
+    segment: np.ndarray   # int64, running segment number of each point
+
+
+def _local(tag):
+    """Strip the XML namespace from an element tag."""
+    return tag.rpartition("}")[2]
+
+
+def parse_times(values):
+    """
+    Convert ISO-8601 timestamps (None for missing) into float seconds since
+    the epoch, NaN where a point has no time.
+    """
+    if not values:
+        return np.empty(0, dtype=np.float64)
+    try:
+        # Fast path: UTC timestamps ending in 'Z', parsed by NumPy in one go.
+        # NumPy only warns about (deprecated) explicit offsets, so the warning
+        # sends those to the slow path too.
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", UserWarning)
+            stamps = np.array(
+                [v[:-1] if v and v.endswith("Z") else v for v in values],
+                dtype="datetime64[us]",
+            )
+    except (ValueError, UserWarning):
+        # Explicit offsets (+02:00 ...) need the slow per-value parser
+        stamps = np.array([
+            None if v is None else
+            datetime.fromisoformat(v).astimezone(timezone.utc).replace(tzinfo=None)
+            for v in values
+        ], dtype="datetime64[us]")
+
+    seconds = (stamps - _EPOCH).astype(np.float64) / 1e6
+    seconds[np.isnat(stamps)] = np.nan
+    return seconds
+
+
+def _to_arrays(lat, lon, ele, times, segment):
+    return TrackArrays(
+        lat=np.asarray(lat, dtype=np.float64),
+        lon=np.asarray(lon, dtype=np.float64),
+        ele=np.asarray(ele, dtype=np.float64),
+        time=parse_times(times),
+        segment=np.asarray(segment, dtype=np.int64),
+    )
+
+
+def iter_track_chunks(stream, chunk_size=None):
+    """
+    Parse the <trkpt> elements of a GPX stream incrementally, yielding
+    TrackArrays of at most chunk_size points (everything at once when
+    chunk_size is None). Each point element is dropped from the tree as soon
+    as it is read, so the parser itself holds no more than one chunk.
+    Routes and waypoints are ignored, as in analyze_gpx_stream.
+    """
+    lat, lon, ele, times, segment = [], [], [], [], []
+    seg_no, seg_elem = -1, None
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "trkseg":
+                seg_no, seg_elem = seg_no + 1, elem
+            continue
+        if tag == "trkseg":
+            seg_elem = None
+            elem.clear()
+            continue
+        if tag != "trkpt":
+            continue
+
+        point_ele, point_time = None, None
+        for child in elem:
+            child_tag = _local(child.tag)
+            if child_tag == "ele" and child.text:
+                point_ele = float(child.text)
+            elif child_tag == "time" and child.text:
+                point_time = child.text.strip()
+
+        lat.append(float(elem.get("lat")))
+        lon.append(float(elem.get("lon")))
+        ele.append(np.nan if point_ele is None else point_ele)
+        times.append(point_time)
+        segment.append(seg_no)
+        if seg_elem is not None:
+            seg_elem.remove(elem)
+
+        if chunk_size and len(lat) >= chunk_size:
+            yield _to_arrays(lat, lon, ele, times, segment)
+            lat, lon, ele, times, segment = [], [], [], [], []
+
+    if lat or not chunk_size:
+        yield _to_arrays(lat, lon, ele, times, segment)
+
+
+def read_track_arrays(stream):
+    """Parse every <trkpt> of a GPX stream into a single TrackArrays tuple."""
+    return next(iter_track_chunks(stream))
+
+
+def point_distances(lat1, lon1, ele1, lat2, lon2, ele2):
+    """
+    Vectorized gpxpy.geo.distance: equirectangular 3D distance for nearby
+    points, 2D haversine for points further apart than HAVERSINE_THRESHOLD.
+    """
+    d_lat = lat1 - lat2
+    d_lon = lon1 - lon2
+
+    coef    = np.cos(np.radians(lat1))
+    flat_2d = np.sqrt(d_lat * d_lat + (d_lon * coef) ** 2) * ONE_DEGREE
+    d_ele   = ele1 - ele2
+    flat_3d = np.where(np.isnan(d_ele) | (d_ele == 0), flat_2d,
+                       np.sqrt(flat_2d ** 2 + d_ele ** 2))
+
+    far = (np.abs(d_lat) > HAVERSINE_THRESHOLD) | (np.abs(d_lon) > HAVERSINE_THRESHOLD)
+    if not far.any():
+        return flat_3d
+
+    r_lat1, r_lat2 = np.radians(lat1), np.radians(lat2)
+    a = (np.sin((r_lat1 - r_lat2) / 2) ** 2
+         + np.sin(np.radians(d_lon) / 2) ** 2 * np.cos(r_lat1) * np.cos(r_lat2))
+    haversine = EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+    return np.where(far, haversine, flat_3d)
+
+
+def length_3d(track):
+    """Sum of point-to-point distances inside each segment, in meters."""
+    same_seg = track.segment[1:] == track.segment[:-1]
+    d = point_distances(
+        track.lat[1:],  track.lon[1:],  track.ele[1:],
+        track.lat[:-1], track.lon[:-1], track.ele[:-1],
+    )
+    return float(d[same_seg].sum())
+
+
+def elevation_steps(ele, segment):
+    """
+    Elevation changes after gpxpy's 0.3/0.4/0.3 smoothing, as (index of the
+    point each change ends at, change in meters), within segments only.
+    Points without elevation are dropped first, exactly like gpxpy.
+    """
+    points = np.flatnonzero(~np.isnan(ele))
+    ele, segment = ele[points], segment[points]
+    if ele.size < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    smoothed = ele.copy()
+    interior = (segment[:-2] == segment[1:-1]) & (segment[1:-1] == segment[2:])
+    mixed    = ele[:-2] * .3 + ele[1:-1] * .4 + ele[2:] * .3
+    smoothed[1:-1] = np.where(interior, mixed, ele[1:-1])
+
+    same_seg = segment[1:] == segment[:-1]
+    return points[1:][same_seg], np.diff(smoothed)[same_seg]
+
+
+def uphill_downhill(ele, segment):
+    """Elevation gain and loss per segment, like gpx.get_uphill_downhill()."""
+    _, d = elevation_steps(ele, segment)
+    return float(d[d > 0].sum()), float(-d[d < 0].sum())
+
+
+def duration(time, segment) -> Optional[float]:
+    """
+    Sum of per-segment (last time - first time), like gpx.get_duration().
+    Returns None when a segment lacks usable timestamps.
+    """
+    if time.size == 0:
+        return 0.0
+
+    # Boundaries of each run of equal segment numbers
+    starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+    ends   = np.r_[starts[1:], segment.size] - 1
+    multi  = ends > starts              # single-point segments count as 0s
+    starts, ends = starts[multi], ends[multi]
+
+    # gpxpy tolerates a missing time on the very first/last point only
+    first = np.where(np.isnan(time[starts]), time[np.minimum(starts + 1, ends)], time[starts])
+    last  = np.where(np.isnan(time[ends]),   time[np.maximum(ends - 1, starts)], time[ends])
+    if np.isnan(first).any() or np.isnan(last).any() or (last < first).any():
+        return None
+    return float((last - first).sum())
+
+
+def compute_features(track):
+    """
+    Compute the DIFF_FEATURES dict (length_3d, elevations, uphill, downhill,
+    break_time, duration) for a parsed track.
+    """
+    if track.lat.size < 2:
+        raise ValueError("Not enough data points")
+    if np.isnan(track.ele).all():
+        raise ValueError("Track has no elevation data")
+    if np.isnan(track.time[[0, -1]]).any():
+        raise ValueError("Track is missing start or end time")
+
+    with stage("moving_time"):
+        duration_obs = duration(track.time, track.segment) or 0
+    with stage("uphill_downhill"):
+        uphill, downhill = uphill_downhill(track.ele, track.segment)
+    with stage("length_3d"):
+        length = length_3d(track)
+    total_time = float(track.time[-1] - track.time[0])
+
+    return {
+        "length_3d":     length,
+        "min_elevation": float(np.nanmin(track.ele)),
+        "max_elevation": float(np.nanmax(track.ele)),
+        "uphill":        uphill,
+        "downhill":      downhill,
+        "break_time":    max(0.0, total_time - duration_obs),
+        "duration":      float(duration_obs),
+    }
+
+
+def extract_features(stream):
+    """Parse a GPX stream and return its feature dict."""
+    with stage("parse"):
+        track = read_track_arrays(stream)
+    with stage("features"):
+        return compute_features(track)
+
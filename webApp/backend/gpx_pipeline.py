@@ -1,33 +1,26 @@
 # backend/gpx_pipeline.py
 
-import os
-import joblib
+import numpy as np
 import pandas as pd
-import gpxpy
+from sklearn.preprocessing import MinMaxScaler
 
-MODEL_PATH  = os.path.join("model", "model.pkl")
-SCALER_PATH = os.path.join("model", "scaler.pkl")
-DIFF_SCALER_PATH = os.path.join("model", "difficulty_scaler.pkl")
-DIFF_KMEANS_PATH = os.path.join("model", "difficulty_kmeans.pkl")
-DIFF_MAP_PATH    = os.path.join("model", "difficulty_cluster_map.pkl")
-DIFF_NN_PATH      = os.path.join("model", "difficulty_nn.pkl")
-DIFF_DF_RAW_PATH  = os.path.join("model", "difficulty_df_raw.pkl")
-NAMES_DF_PATH = os.path.join("model", "df_raw_copy.pkl")
+from artifacts import clustering, registry
+from compact_catalogue import array_footprint
+from feature_store import GEO_COLUMNS
+from filtered_index import DIFFICULTY_LABELS, build_partitions, check_n_neighbors
+from geo_index import GEO_RADIUS_KM, build_geo_index
+from gpx_runtime import NEIGHBOR_FIELDS, format_stats, secs_to_hm, secs_to_hm_array
+from gpx_simplify import extract_features
+from gpx_stream import stream_features
+from instrumentation import stage
 
-
-# Load once
-_model  = joblib.load(MODEL_PATH)
-_scaler = joblib.load(SCALER_PATH)
-_diff_scaler      = joblib.load(DIFF_SCALER_PATH)
-_diff_kmeans      = joblib.load(DIFF_KMEANS_PATH)
-_diff_cluster_map = joblib.load(DIFF_MAP_PATH)
-_diff_nn       = joblib.load(DIFF_NN_PATH)
-_diff_df_raw   = joblib.load(DIFF_DF_RAW_PATH)
-_names_df     = joblib.load(NAMES_DF_PATH)
-
-
-# print(_names_df.columns)   # should include 'name'
-# print(_names_df.head())
+# Artifacts are loaded lazily on first use (see artifacts.py):
+#   model (or its flattened model_flat export), scaler, diff_scaler,
+#   diff_kmeans, diff_cluster_map, diff_nn (or a diff_index built by
+#   hike_index.py), diff_partitions (filtered_index.py), diff_graph
+#   (similarity_graph.py), diff_geo (geo_index.py), diff_compact
+#   (compact_catalogue.py) or diff_catalogue (or the older diff_df_raw
+#   pickle), the catalogue's diff_geometry, names_df
 
 DIFF_FEATURES = [
     "length_3d",
@@ -39,122 +32,329 @@ DIFF_FEATURES = [
     "duration"
 ]
 
-def secs_to_hm(seconds):
-    """Convert seconds to 'Xh Ym' format."""
-    seconds = float(seconds)
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    return f"{hours}h {minutes}m"
-
-def analyze_gpx_stream(stream):
-    # 1. Parse
-    gpx = gpxpy.parse(stream)
-
-    # 2. Flatten points
-    pts = [
-        pt
-        for tr in gpx.tracks
-        for seg in tr.segments
-        for pt in seg.points
-    ]
-    if len(pts) < 2:
-        raise ValueError("Not enough data points")
-
-    # 3. Compute core stats (the exact features your scaler/model expect)
-    length_3d    = gpx.length_3d()               # meters
-    duration_obs = gpx.get_duration() or 0       # seconds
-    uphill, downhill = gpx.get_uphill_downhill() # meters up/down
-    elevations   = [pt.elevation for pt in pts]
-    min_elev, max_elev = float(min(elevations)), float(max(elevations))
-
-    # 4. Build DataFrame with exactly those five columns
-    feat_df = pd.DataFrame([{
-        "length_3d":     length_3d,
-        "min_elevation": min_elev,
-        "max_elevation": max_elev,
-        "uphill":        uphill,
-        "downhill":      downhill,
-    }])
-
-    # 5. Scale & predict
-    X_scaled     = _scaler.transform(feat_df)
-    pred_seconds = float(_model.predict(X_scaled)[0])
-    hours = int(pred_seconds // 3600)
-    minutes = int((pred_seconds % 3600) // 60)
-    # Debug print showing hours and minutes
-    # print(f"Predicted duration:({hours}h {minutes}m)")
-
- 
-    # 6. Return raw stats + prediction
-    stats = {
-        "length_3d_m":           round(length_3d, 2),
-        "uphill_m":              round(uphill, 2),
-        "downhill_m":            round(downhill, 2),
-        "min_elevation_m":       round(min_elev, 2),
-        "max_elevation_m":       round(max_elev, 2),
-        "break_time_sec":        round((pts[-1].time - pts[0].time).total_seconds() - duration_obs, 2),
-        "observed_duration_sec": round(duration_obs, 2),
-        "predicted_duration_hm": f"{hours}h {minutes}m",
+TIME_FEATURES = DIFF_FEATURES[:5]   # what the duration scaler/model expect
+
+
+# Above this batch size sklearn's compiled traversal beats the NumPy one
+FLAT_FOREST_MAX_ROWS = 256
+
+
+def time_model(n_rows=1):
+    """
+    The duration regressor for a batch of n_rows: the flattened forest
+    (flat_forest.py) when it has been exported, which predicts identically
+    without sklearn's per-call overhead, otherwise (or for big batches when
+    the pickle is around) the RandomForestRegressor itself.
+    """
+    flat_ok = registry.available("model_flat")
+    if flat_ok and (n_rows <= FLAT_FOREST_MAX_ROWS or not registry.available("model")):
+        return registry.get("model_flat")
+    return registry.get("model")
+
+
+def neighbor_index():
+    """
+    The similar-hike index: one built by hike_index.py (exact tree or
+    approximate IVF, as configured at build time) if present, then the
+    compact catalogue (compact_store()), which is its own exact index,
+    otherwise the brute-force NearestNeighbors from classifier.py.
+    """
+    if registry.available("diff_index"):
+        return registry.get("diff_index")
+    if compact_store() is not None:
+        return compact_store()
+    return registry.get("diff_nn")
+
+
+# In-memory indexes, each kept with the artifacts it was built from. They
+# hold on to those objects and compare them by identity: comparing id()s
+# would mistake a new object at a freed object's address for the old one.
+_built = {}
+
+
+def _built_from(name, sources, build):
+    cached = _built.get(name)
+    if cached is None or len(cached[0]) != len(sources) or any(a is not b for a, b in zip(cached[0], sources)):
+        _built[name] = cached = (sources, build())
+    return cached[1]
+
+
+def compact_store():
+    """
+    The compact catalogue, or None when there is none or it was built with
+    another diff_scaler than the served one: its folded-in scaler would put
+    the catalogue and the queries in different spaces, so the other stores
+    (written together with the scaler by classifier.py) are served instead.
+    """
+    if not registry.available("diff_compact"):
+        return None
+    compact, scaler = registry.get("diff_compact"), registry.get("diff_scaler")
+    return compact if _built_from("compact_fits", (compact, scaler), lambda: compact.fits(scaler)) else None
+
+
+def partition_index():
+    """
+    The filtered (difficulty x length x elevation) index: the one built by
+    filtered_index.py if present, otherwise one built in memory and kept
+    until the catalogue or clustering it was built from is swapped out.
+    """
+    if registry.available("diff_partitions"):
+        return registry.get("diff_partitions")
+    return _built_from(
+        "partitions", (catalogue_columns(), registry.get("diff_kmeans")), build_partitions
+    )
+
+
+def geo_index():
+    """
+    The start-point index (geo_index.py): the built one if present,
+    otherwise one built in memory from the catalogue's locations.
+    """
+    if registry.available("diff_geo"):
+        return registry.get("diff_geo")
+    return _built_from(
+        "geo", (registry.get("diff_geometry"), catalogue_columns(), registry.get("diff_kmeans")),
+        build_geo_index,
+    )
+
+
+def catalogue_columns():
+    """
+    {column: array} of the hike catalogue's DIFF_FEATURES, row-aligned with
+    the neighbour index: float32 views of the compact catalogue, or
+    zero-copy views of the Arrow table written by classifier.py, or of the
+    legacy difficulty_df_raw.pkl DataFrame.
+    """
+    if compact_store() is not None:
+        return compact_store().columns()
+    if registry.available("diff_catalogue"):
+        return registry.get("diff_catalogue")
+    # One dict per loaded DataFrame, so the indexes built from it stay cached
+    df = registry.get("diff_df_raw")
+    return _built_from("df_raw_columns", (df,), lambda: {c: df[c].to_numpy() for c in DIFF_FEATURES})
+
+
+def catalogue_memory():
+    """
+    Per-worker footprint of the served catalogue and neighbour index
+    (see compact_catalogue.array_footprint): the compact store's own
+    report, or the catalogue columns plus the index's training matrix.
+    """
+    if compact_store() is not None:
+        return compact_store().memory_report()
+    columns = catalogue_columns()
+    arrays = {f"catalogue.{c}": np.asarray(a) for c, a in columns.items()}
+    index = neighbor_index()
+    fit_X = getattr(index, "_fit_X", getattr(index, "list_X_", None))
+    if fit_X is not None:
+        arrays["index"] = fit_X
+    return {
+        "store":         "arrow" if registry.available("diff_catalogue") else "pickle",
+        "rows":          len(columns["duration"]),
+        "float64_bytes": len(columns["duration"]) * len(DIFF_FEATURES) * 8,
+        **array_footprint(arrays),
     }
 
-    # Recompute break_time
-    t0, t1     = pts[0].time, pts[-1].time
-    total_time = (t1 - t0).total_seconds()
-    break_time = max(0.0, total_time - duration_obs)
-
-    diff_df = pd.DataFrame([{
-        "length_3d":     length_3d,
-        "min_elevation": min_elev,
-        "max_elevation": max_elev,
-        "uphill":        uphill,
-        "downhill":      downhill,
-        "break_time":    break_time,
-        "duration":      duration_obs,
-    }])
-
-    # Scale + predict cluster
-    Xd          = _diff_scaler.transform(diff_df)
-    cluster_id  = int(_diff_kmeans.predict(Xd)[0])
-    diff_label  = _diff_cluster_map[cluster_id]
-    # print(f"Predicted difficulty: {diff_label}")    
-
-    # Append to stats
-    stats["predicted_difficulty"] = diff_label
-
-    # 5. Nearest-hikes recommendation
-    distances, indices = _diff_nn.kneighbors(Xd, n_neighbors=3)
-    neigh_df = _diff_df_raw.iloc[indices[0]].reset_index(drop=True)
-    neighbor_ids = indices[0]
-    #neigh_df["name"] = _names_df["name"].iloc[neighbor_ids].values
-    # Convert units:
-    # - duration to hours/minutes
-    # - other stats remain in meters
-    neigh_df["duration_hm"]      = neigh_df["duration"].apply(secs_to_hm)
-    neigh_df["length_3d_m"]      = neigh_df["length_3d"]
-    neigh_df["uphill_m"]         = neigh_df["uphill"]
-    neigh_df["downhill_m"]       = neigh_df["downhill"]
-    neigh_df["min_elevation_m"]  = neigh_df["min_elevation"]
-    neigh_df["max_elevation_m"]  = neigh_df["max_elevation"]
-    neigh_df["break_time_hm"]    = neigh_df["break_time"].apply(secs_to_hm)
-
-    # Only keep the converted fields + optionally distance ranking
-    stats = {
-        "length_3d_m":           round(length_3d, 2),
-        "uphill_m":              round(uphill, 2),
-        "downhill_m":            round(downhill, 2),
-        "min_elevation_m":       round(min_elev, 2),
-        "max_elevation_m":       round(max_elev, 2),
-        "break_time_sec":        round(break_time, 2),
-        "observed_duration_hm":  secs_to_hm(duration_obs),
-        "predicted_duration_hm": f"{hours}h {minutes}m",
-        "predicted_difficulty":  diff_label,
-        "nearest_hikes":         neigh_df[[
-            "duration_hm",
-            "length_3d_m",
-            "uphill_m",
-            "downhill_m",
-            "break_time_hm"
-        ]].to_dict(orient="records")
+
+def scale_matrix(scaler, X):
+    """
+    scaler.transform for a float matrix already in the scaler's column
+    order. A MinMaxScaler is applied directly (the same X * scale_ + min_
+    sklearn computes) to skip its per-call validation and feature-name checks.
+    """
+    if isinstance(scaler, MinMaxScaler) and not scaler.clip:
+        return X * scaler.scale_ + scaler.min_
+    names = getattr(scaler, "feature_names_in_", None)
+    return scaler.transform(X if names is None else pd.DataFrame(X, columns=names))
+
+
+def feature_matrix(feature_rows):
+    """Stack feature dicts into an (n, len(DIFF_FEATURES)) float64 matrix."""
+    return np.array([[row[c] for c in DIFF_FEATURES] for row in feature_rows], dtype=np.float64)
+
+
+def score_features(feature_rows, n_neighbors=3):
+    """
+    Run the duration model, the difficulty clustering and the nearest-hike
+    lookup once on a stacked batch of feature dicts (as returned by
+    gpx_features.extract_features) and return one stats dict per row.
+    """
+    # 1. Stack every track into one matrix, columns in DIFF_FEATURES order
+    X = feature_matrix(feature_rows)
+
+    # 2. Scale & predict durations
+    with stage("scale"):
+        X_scaled = scale_matrix(registry.get("scaler"), X[:, :len(TIME_FEATURES)])
+        Xd       = scale_matrix(registry.get("diff_scaler"), X)
+    with stage("time_model"):
+        pred_seconds = time_model(len(X)).predict(X_scaled)
+
+    # 3. Predict clusters
+    with stage("kmeans"):
+        kmeans, cluster_map = clustering()
+        cluster_ids = kmeans.predict(Xd)
+
+    # 4. Nearest-hikes recommendation, one lookup for the whole batch
+    with stage("knn"):
+        distances, indices = neighbor_index().kneighbors(Xd, n_neighbors=n_neighbors)
+    with stage("format"):
+        catalogue = catalogue_columns()
+        neigh = {c: catalogue[c][indices.ravel()] for c in DIFF_FEATURES}
+        #neigh["name"] = registry.get("names_df")["name"].iloc[indices.ravel()].values
+        # 5. Only keep the converted fields, per track
+        difficulties = [cluster_map[int(c)] for c in cluster_ids]
+        return format_stats(X, DIFF_FEATURES, pred_seconds, difficulties, neigh, n_neighbors)
+
+
+# Relative difficulty requests, as level offsets from the query hike
+RELATIVE_DIFFICULTY = {"same": 0, "harder": 1, "easier": -1}
+
+# Range filters accepted by recommend(), in raw units
+FILTER_COLUMNS = DIFF_FEATURES
+
+
+def recommend(feats, n_neighbors=5, difficulty=None, ranges=None, near=None):
+    """
+    Nearest catalogue hikes to one feature dict, restricted to a difficulty
+    (a label from DIFFICULTY_LABELS, or 'same'/'harder'/'easier' relative
+    to the hike's own) and to {column: (lo, hi)} ranges in raw units, e.g.
+    {"duration": (None, 4 * 3600)}. Searches only the matching partitions
+    of partition_index(); with near = (lat, lon, radius_km), only the hikes
+    starting within the radius (geo_index().kneighbors), and each hike then
+    also carries its start point, bounding box and distance_km.
+    """
+    check_n_neighbors(n_neighbors)
+    X  = feature_matrix([feats])
+    Xd = scale_matrix(registry.get("diff_scaler"), X)
+    kmeans, cluster_map = clustering()
+    label = cluster_map[int(kmeans.predict(Xd)[0])]
+
+    if difficulty is None:
+        levels = None
+    elif difficulty in RELATIVE_DIFFICULTY:
+        levels = [DIFFICULTY_LABELS.index(label) + RELATIVE_DIFFICULTY[difficulty]]
+        levels = [l for l in levels if 0 <= l < len(DIFFICULTY_LABELS)]
+    elif difficulty in DIFFICULTY_LABELS:
+        levels = [DIFFICULTY_LABELS.index(difficulty)]
+    else:
+        raise ValueError(
+            f"Unknown difficulty {difficulty!r}, expected one of "
+            f"{DIFFICULTY_LABELS + list(RELATIVE_DIFFICULTY)}"
+        )
+    unknown = set(ranges or {}) - set(FILTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown filter columns {sorted(unknown)}, expected some of {FILTER_COLUMNS}")
+
+    if levels == []:
+        distances, km = np.empty(0), np.empty(0)
+        indices = hike_levels = np.empty(0, dtype=np.int64)
+    elif near is not None:
+        with stage("geo"):
+            distances, indices, hike_levels, km = geo_index().kneighbors(Xd[0], n_neighbors, levels, ranges, *near)
+    else:
+        index = partition_index()
+        with stage("knn"):
+            distances, indices = index.kneighbors(Xd[0], n_neighbors, levels, ranges)
+        hike_levels = index.levels_[indices]
+    catalogue = catalogue_columns()
+    neigh = {c: catalogue[c][indices] for c in DIFF_FEATURES}
+    hikes = [
+        {
+            **dict(zip(NEIGHBOR_FIELDS, (duration, length, up, down, break_time))),
+            "difficulty": DIFFICULTY_LABELS[level],
+            "distance":   round(dist, 4),
+        }
+        for duration, length, up, down, break_time, level, dist in zip(
+            secs_to_hm_array(neigh["duration"]).tolist(), neigh["length_3d"].tolist(),
+            neigh["uphill"].tolist(), neigh["downhill"].tolist(),
+            secs_to_hm_array(neigh["break_time"]).tolist(), hike_levels.tolist(),
+            distances.tolist(),
+        )
+    ]
+    if near is not None:
+        geometry = registry.get("diff_geometry")
+        where = np.column_stack([geometry[c][indices] for c in GEO_COLUMNS]).tolist()
+        for hike, (lat, lon, *bbox), dist_km in zip(hikes, where, km.tolist()):
+            hike.update({"start": [lat, lon], "bbox": bbox, "distance_km": round(dist_km, 3)})
+    return {
+        "predicted_difficulty": label,
+        "searched_difficulty":  None if levels is None else [DIFFICULTY_LABELS[l] for l in levels],
+        "nearest_hikes":        hikes,
     }
 
-    return stats
\ No newline at end of file
+
+def parse_recommend_request(body):
+    """
+    (features, k, difficulty, ranges, near) from a /api/recommend JSON body:
+    {"features": {<DIFF_FEATURES>}, "k": 5, "difficulty": "harder",
+     "filters": {"duration": [null, 14400], "max_elevation": [800, 1500]},
+     "near": {"lat": 47.2, "lon": 13.2, "radius_km": 50}}
+    """
+    feats = body.get('features') or {}
+    missing = [c for c in DIFF_FEATURES if c not in feats]
+    if missing:
+        raise ValueError(f"features is missing {missing}")
+    ranges = {column: tuple(bounds) for column, bounds in (body.get('filters') or {}).items()}
+    near = body.get('near')
+    if near is not None:
+        near = (float(near['lat']), float(near['lon']), float(near.get('radius_km', GEO_RADIUS_KM)))
+    return feats, int(body.get('k', 5)), body.get('difficulty'), ranges, near
+
+
+def similar_hikes(hike_id, n_neighbors=5):
+    """
+    Nearest catalogue hikes to catalogue hike `hike_id` (its row number),
+    itself excluded: a slice of the graph precomputed by
+    similarity_graph.py when it covers the hike, a kNN query otherwise.
+    """
+    check_n_neighbors(n_neighbors)
+    catalogue = catalogue_columns()
+    n_rows = len(catalogue["duration"])
+    if not 0 <= hike_id < n_rows:
+        raise IndexError(f"Hike {hike_id} is not in the catalogue ({n_rows} hikes)")
+
+    with stage("knn"):
+        graph = registry.get("diff_graph") if registry.available("diff_graph") else None
+        if graph is not None and hike_id < graph.n_rows and n_neighbors <= graph.indptr[1] - graph.indptr[0]:
+            indices, distances = graph.neighbors(hike_id, n_neighbors)
+        else:
+            x = np.array([[catalogue[c][hike_id] for c in DIFF_FEATURES]], dtype=np.float64)
+            xd = scale_matrix(registry.get("diff_scaler"), x)
+            distances, indices = neighbor_index().kneighbors(xd, n_neighbors=min(n_neighbors + 1, n_rows))
+            keep = indices[0] != hike_id
+            indices, distances = indices[0][keep][:n_neighbors], distances[0][keep][:n_neighbors]
+
+    neigh = {c: catalogue[c][indices] for c in DIFF_FEATURES}
+    hikes = [
+        {
+            "hike_id": hid,
+            **dict(zip(NEIGHBOR_FIELDS, (duration, length, up, down, break_time))),
+            "distance": round(dist, 4),
+        }
+        for hid, duration, length, up, down, break_time, dist in zip(
+            np.asarray(indices).tolist(), secs_to_hm_array(neigh["duration"]).tolist(),
+            neigh["length_3d"].tolist(), neigh["uphill"].tolist(), neigh["downhill"].tolist(),
+            secs_to_hm_array(neigh["break_time"]).tolist(), np.asarray(distances, dtype=np.float64).tolist(),
+        )
+    ]
+    return {"hike_id": hike_id, "nearest_hikes": hikes}
+
+
+def track_features(stream, streaming=False):
+    """
+    Feature dict of a GPX upload. With streaming=True the track is reduced
+    chunk by chunk in bounded memory (for very large uploads) instead of
+    being parsed into arrays in one go. The in-memory path applies the
+    optional GPX_SIMPLIFY stage (gpx_simplify.py) before the features.
+    """
+    # Parse points into arrays & compute core stats in one vectorized pass
+    # (the exact features your scaler/model expect)
+    return stream_features(stream) if streaming else extract_features(stream)
+
+
+def analyze_gpx_stream(stream, streaming=False):
+    """
+    Analyze a GPX upload and return trail stats, predictions and similar hikes.
+    """
+    return score_features([track_features(stream, streaming)])[0]
+
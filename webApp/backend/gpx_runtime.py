@@ -0,0 +1,229 @@
+# backend/gpx_runtime.py
+
+"""
+Dependency-light inference: the whole scoring path of gpx_pipeline
+(scalers, duration forest, difficulty clustering, nearest hikes) on NumPy
+alone, from one exported artifact.
+
+gpx_pipeline imports pandas and scikit-learn to unpickle its models, which
+dominates the cold start of a CLI or serverless worker. export_runtime.py
+bundles every model the scoring path uses into model/gpx_runtime.npz
+(plain arrays, loaded with allow_pickle=False) and a JSON manifest next to
+it (format version, artifact version, source file hashes, feature order,
+scaler kinds, the cluster map and the shape and dtype of every array).
+This module imports only NumPy, the standard library and the repo's
+NumPy-only modules (flat_forest, gpx_features, gpx_simplify).
+
+The results are those of gpx_pipeline.score_features with the models the
+runtime was exported from: scalers apply sklearn's arithmetic, the forest
+is flat_forest's bit-identical walk, clusters come from the same
+||c||^2 - 2 x.c comparison KMeans.predict makes, and neighbours from an
+exact scan whose distances are computed as diff_nn's KD-tree computes
+them. Only the order of exactly tied neighbours may differ, and an
+approximate hike_index.py index, if one is served, is not reproduced (the
+runtime's neighbours are the exact ones).
+
+  python gpx_runtime.py track.gpx [more.gpx ...]     # one JSON line each
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from flat_forest import FlatForest
+
+RUNTIME_FORMAT  = "gpx-runtime"
+RUNTIME_VERSION = 1
+
+RUNTIME_PATH = os.path.join(os.environ.get("GPX_MODEL_DIR", "model"), "gpx_runtime.json")
+
+# Distance entries (queries x catalogue rows x features) computed at once
+KNN_BLOCK_ENTRIES = 8 * 1024 * 1024
+
+NEIGHBOR_FIELDS = [
+    "duration_hm",
+    "length_3d_m",
+    "uphill_m",
+    "downhill_m",
+    "break_time_hm"
+]
+
+# Catalogue columns the neighbour fields are made of
+NEIGHBOR_COLUMNS = ["duration", "length_3d", "uphill", "downhill", "break_time"]
+
+
+def secs_to_hm(seconds):
+    """Convert seconds to 'Xh Ym' format."""
+    seconds = float(seconds)
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes}m"
+
+
+def secs_to_hm_array(seconds):
+    """secs_to_hm over a whole array at once; returns an array of str."""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    hours   = (seconds // 3600).astype(np.int64).astype(str)
+    minutes = ((seconds % 3600) // 60).astype(np.int64).astype(str)
+    return np.char.add(np.char.add(hours, "h "), np.char.add(minutes, "m"))
+
+
+def format_stats(X, columns, pred_seconds, difficulties, neigh, n_neighbors):
+    """
+    One stats dict per row of the raw feature matrix X (in `columns`
+    order): rounded trail stats, observed and predicted duration, the
+    difficulty label and the n_neighbors nearest hikes, whose raw
+    NEIGHBOR_COLUMNS values are in neigh ({column: array}, row-major).
+    """
+    # Convert units:
+    # - duration to hours/minutes
+    # - other stats remain in meters
+    neighbors = [
+        dict(zip(NEIGHBOR_FIELDS, row))
+        for row in zip(
+            secs_to_hm_array(neigh["duration"]).tolist(), neigh["length_3d"].tolist(),
+            neigh["uphill"].tolist(), neigh["downhill"].tolist(),
+            secs_to_hm_array(neigh["break_time"]).tolist(),
+        )
+    ]
+    observed_hm  = secs_to_hm_array(X[:, columns.index("duration")]).tolist()
+    predicted_hm = secs_to_hm_array(pred_seconds).tolist()
+
+    # Only keep the converted fields, per track
+    results = []
+    for i, feats in enumerate(X.tolist()):
+        feats = dict(zip(columns, feats))
+        results.append({
+            "length_3d_m":           round(feats["length_3d"], 2),
+            "uphill_m":              round(feats["uphill"], 2),
+            "downhill_m":            round(feats["downhill"], 2),
+            "min_elevation_m":       round(feats["min_elevation"], 2),
+            "max_elevation_m":       round(feats["max_elevation"], 2),
+            "break_time_sec":        round(feats["break_time"], 2),
+            "observed_duration_hm":  observed_hm[i],
+            "predicted_duration_hm": predicted_hm[i],
+            "predicted_difficulty":  difficulties[i],
+            "nearest_hikes":         neighbors[i * n_neighbors:(i + 1) * n_neighbors],
+        })
+    return results
+
+
+class Runtime:
+    """The exported models, as arrays, with the scoring path on top."""
+
+    def __init__(self, manifest, arrays):
+        self.manifest      = manifest
+        self.version       = manifest["version"]
+        self.diff_features = manifest["diff_features"]
+        self.time_features = manifest["time_features"]
+        self.scalers       = manifest["scalers"]
+        self.cluster_map   = {int(k): v for k, v in manifest["cluster_map"].items()}
+        self.arrays        = arrays
+        self.forest = FlatForest({
+            name.split("/", 1)[1]: a for name, a in arrays.items() if name.startswith("forest/")
+        })
+        self.centers    = arrays["kmeans/centers"]
+        self.catalogue  = arrays["catalogue/scaled"]
+        self.neighbours = {c: arrays[f"catalogue/{c}"] for c in NEIGHBOR_COLUMNS}
+
+    @classmethod
+    def load(cls, path=RUNTIME_PATH):
+        """Read a manifest and its .npz, checking format and array shapes."""
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != RUNTIME_FORMAT or manifest.get("format_version") != RUNTIME_VERSION:
+            raise ValueError(
+                f"{path} is not a version {RUNTIME_VERSION} {RUNTIME_FORMAT} manifest; "
+                "re-export it with export_runtime.py"
+            )
+        npz_path = os.path.join(os.path.dirname(path), manifest["npz"])
+        with np.load(npz_path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        for name, spec in manifest["arrays"].items():
+            a = arrays.get(name)
+            if a is None or list(a.shape) != spec["shape"] or str(a.dtype) != spec["dtype"]:
+                raise ValueError(f"{npz_path} does not match its manifest (array {name!r})")
+        return cls(manifest, arrays)
+
+    def scale(self, which, X):
+        """The exported `which` ("time" or "diff") scaler's transform of X."""
+        spec = self.scalers[which]
+        if spec["kind"] == "minmax":
+            X = X * self.arrays[f"{which}_scaler/scale"] + self.arrays[f"{which}_scaler/min"]
+            if spec["clip"]:
+                X = np.clip(X, *spec["feature_range"])
+            return X
+        # standard
+        if spec["with_mean"]:
+            X = X - self.arrays[f"{which}_scaler/mean"]
+        if spec["with_std"]:
+            X = X / self.arrays[f"{which}_scaler/scale"]
+        return X
+
+    def predict_duration(self, X):
+        """Predicted moving time (seconds) of raw feature rows."""
+        return self.forest.predict(self.scale("time", X[:, :len(self.time_features)]))
+
+    def predict_cluster(self, Xd):
+        """Difficulty cluster ids of scaled rows, as KMeans.predict."""
+        d = np.einsum("ij,ij->i", self.centers, self.centers) - 2 * Xd @ self.centers.T
+        return d.argmin(axis=1)
+
+    def kneighbors(self, Xd, n_neighbors=3):
+        """(distances, catalogue rows) of the exact nearest hikes of scaled rows."""
+        C = self.catalogue
+        k = min(n_neighbors, C.shape[0])
+        step = max(1, KNN_BLOCK_ENTRIES // (C.shape[0] * C.shape[1]))
+        distances = np.empty((Xd.shape[0], k))
+        indices   = np.empty((Xd.shape[0], k), dtype=np.int64)
+        for lo in range(0, Xd.shape[0], step):
+            Q = Xd[lo:lo + step]
+            # Squared differences summed feature by feature, as the KD-tree does
+            d = np.sqrt(((C[None, :, :] - Q[:, None, :]) ** 2).sum(2))
+            top = np.argpartition(d, k - 1, axis=1)[:, :k] if d.shape[1] > k else np.indices(d.shape)[1]
+            top_d = np.take_along_axis(d, top, 1)
+            order = np.lexsort((top, top_d))
+            indices[lo:lo + step]   = np.take_along_axis(top, order, 1)
+            distances[lo:lo + step] = np.take_along_axis(top_d, order, 1)
+        return distances, indices
+
+    def score(self, feature_rows, n_neighbors=3):
+        """gpx_pipeline.score_features on the exported models."""
+        X = np.array([[row[c] for c in self.diff_features] for row in feature_rows], dtype=np.float64)
+        pred_seconds = self.predict_duration(X)
+        Xd = self.scale("diff", X)
+        difficulties = [self.cluster_map[int(c)] for c in self.predict_cluster(Xd)]
+        _, indices = self.kneighbors(Xd, n_neighbors)
+        neigh = {c: a[indices.ravel()] for c, a in self.neighbours.items()}
+        return format_stats(X, self.diff_features, pred_seconds, difficulties, neigh, n_neighbors)
+
+    def analyze(self, stream):
+        """Trail stats, predictions and similar hikes of one GPX stream."""
+        from gpx_simplify import extract_features
+
+        return self.score([extract_features(stream)])[0]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score GPX files with the exported runtime.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--runtime", default=RUNTIME_PATH, help="manifest written by export_runtime.py")
+    args = parser.parse_args()
+
+    runtime = Runtime.load(args.runtime)
+    for path in args.files:
+        try:
+            with open(path, "rb") as f:
+                result = {"file": path, "stats": runtime.analyze(f)}
+        except Exception as e:
+            result = {"file": path, "error": str(e)}
+        print(json.dumps(result))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
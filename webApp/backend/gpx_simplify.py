@@ -0,0 +1,188 @@
+# backend/gpx_simplify.py
+
+"""
+Optional track simplification between parsing and feature extraction.
+
+Steps work on a parsed TrackArrays and are vectorized with NumPy; every
+step keeps the first and last point of each segment, so duration and
+break_time are unchanged and only length, elevation and uphill/downhill
+can drift:
+
+  rdp:<metres>        Ramer-Douglas-Peucker in 3D (local metric x/y plus
+                      elevation), level by level over all open intervals
+  time:<seconds>      keep the first point in every <seconds> window
+  distance:<metres>   keep the first point in every <metres> of 3D path
+  smooth:<points>     centred moving average of elevation (odd window)
+
+GPX_SIMPLIFY chains steps left to right, e.g. "smooth:5,rdp:2". It is off
+by default; benchmarks/bench_simplify.py reports the point reduction,
+speedup and feature/prediction drift of a spec before you turn it on.
+"""
+
+import os
+
+import numpy as np
+
+from gpx_features import (
+    ONE_DEGREE, TrackArrays, compute_features, point_distances, read_track_arrays,
+)
+from instrumentation import stage
+
+SIMPLIFY = os.environ.get("GPX_SIMPLIFY", "")
+
+
+def parse_spec(spec):
+    """'smooth:5,rdp:2' -> [('smooth', 5.0), ('rdp', 2.0)]."""
+    steps = []
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        method, _, value = part.partition(":")
+        if method not in STEPS:
+            raise ValueError(f"Unknown simplification {method!r}, expected one of {sorted(STEPS)}")
+        steps.append((method, float(value)))
+    return steps
+
+
+def _segment_bounds(segment):
+    """First and last index of each run of equal segment numbers."""
+    starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+    ends   = np.r_[starts[1:], segment.size] - 1
+    return starts, ends
+
+
+def _take(track, keep):
+    return TrackArrays(*(a[keep] for a in track))
+
+
+def _with_endpoints(track, keep):
+    starts, ends = _segment_bounds(track.segment)
+    keep[starts] = True
+    keep[ends] = True
+    return keep
+
+
+def _metric_xyz(track):
+    """Local east/north/up coordinates in metres (missing elevation -> 0)."""
+    lat0 = np.radians(np.nanmean(track.lat)) if track.lat.size else 0.0
+    x = track.lon * ONE_DEGREE * np.cos(lat0)
+    y = track.lat * ONE_DEGREE
+    z = np.nan_to_num(track.ele)
+    return np.column_stack([x, y, z])
+
+
+def rdp(track, tolerance):
+    """
+    Ramer-Douglas-Peucker in 3D. Instead of recursing, every open interval
+    is processed at once per level: each interior point's distance to its
+    interval's chord, the farthest point per interval (via reduceat), and a
+    split wherever it exceeds the tolerance.
+    """
+    n = track.lat.size
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return track
+    xyz = _metric_xyz(track)
+    lo, hi = _segment_bounds(track.segment)
+    keep[lo] = keep[hi] = True
+
+    while True:
+        open_ = hi - lo > 1
+        lo, hi = lo[open_], hi[open_]
+        if lo.size == 0:
+            break
+
+        # Interior point indices of all intervals, grouped by interval
+        counts = hi - lo - 1
+        group_start = np.cumsum(counts) - counts
+        group = np.repeat(np.arange(lo.size), counts)
+        idx = np.arange(counts.sum()) - group_start[group] + lo[group] + 1
+
+        # Distance of each point to its interval's chord (a segment in 3D)
+        a, b = xyz[lo[group]], xyz[hi[group]]
+        ab = b - a
+        ab2 = (ab * ab).sum(1)
+        t = np.divide(((xyz[idx] - a) * ab).sum(1), ab2, out=np.zeros_like(ab2), where=ab2 > 0)
+        proj = a + np.clip(t, 0, 1)[:, None] * ab
+        dist = np.sqrt(((xyz[idx] - proj) ** 2).sum(1))
+
+        # Farthest point of each interval; split those beyond the tolerance
+        gmax = np.maximum.reduceat(dist, group_start)
+        hits = np.flatnonzero(dist == gmax[group])
+        first_hit = hits[np.unique(group[hits], return_index=True)[1]]
+        split = gmax > tolerance
+        mid = idx[first_hit][split]
+        keep[mid] = True
+        lo = np.r_[lo[split], mid]
+        hi = np.r_[mid, hi[split]]
+
+    return _take(track, keep)
+
+
+def _bucket_firsts(track, buckets):
+    """Keep the first point of each (segment, bucket) run, plus endpoints."""
+    keep = np.r_[True, (buckets[1:] != buckets[:-1]) | (track.segment[1:] != track.segment[:-1])]
+    return _take(track, _with_endpoints(track, keep))
+
+
+def resample_time(track, seconds):
+    """One point per `seconds` of recording time in each segment."""
+    starts, _ = _segment_bounds(track.segment)
+    seg_idx = np.cumsum(np.r_[True, track.segment[1:] != track.segment[:-1]]) - 1
+    t0 = track.time[starts][seg_idx]
+    buckets = np.floor((track.time - t0) / seconds)
+    # Points without a timestamp are kept rather than guessed
+    buckets = np.where(np.isnan(buckets), -np.arange(buckets.size) - 1, buckets)
+    return _bucket_firsts(track, buckets)
+
+
+def resample_distance(track, metres):
+    """One point per `metres` of 3D path in each segment."""
+    same_seg = track.segment[1:] == track.segment[:-1]
+    d = point_distances(
+        track.lat[1:],  track.lon[1:],  track.ele[1:],
+        track.lat[:-1], track.lon[:-1], track.ele[:-1],
+    )
+    cumulative = np.r_[0.0, np.cumsum(np.where(same_seg, d, 0.0))]
+    return _bucket_firsts(track, np.floor(cumulative / metres))
+
+
+def smooth_elevation(track, window):
+    """Centred moving average of elevation within each segment, ignoring NaNs."""
+    window = int(window) | 1
+    if window < 3:
+        return track
+    kernel = np.ones(window)
+    ele = track.ele.copy()
+    starts, ends = _segment_bounds(track.segment)
+    for lo, hi in zip(starts, ends + 1):
+        seg = track.ele[lo:hi]
+        valid = ~np.isnan(seg)
+        sums   = np.convolve(np.where(valid, seg, 0.0), kernel, mode="same")
+        counts = np.convolve(valid.astype(float), kernel, mode="same")
+        ele[lo:hi] = np.where(valid, sums / np.maximum(counts, 1), np.nan)
+    return track._replace(ele=ele)
+
+
+STEPS = {
+    "rdp":      rdp,
+    "time":     resample_time,
+    "distance": resample_distance,
+    "smooth":   smooth_elevation,
+}
+
+
+def simplify(track, spec=SIMPLIFY):
+    """Apply the steps of a GPX_SIMPLIFY-style spec to a parsed track."""
+    for method, value in parse_spec(spec):
+        track = STEPS[method](track, value)
+    return track
+
+
+def extract_features(stream, spec=SIMPLIFY):
+    """gpx_features.extract_features with the simplification spec applied."""
+    with stage("parse"):
+        track = read_track_arrays(stream)
+    if spec:
+        with stage("simplify"):
+            track = simplify(track, spec)
+    with stage("features"):
+        return compute_features(track)
@@ -0,0 +1,206 @@
+# backend/gpx_stream.py
+
+"""
+Bounded-memory GPX analysis for very large uploads.
+
+The track is parsed in fixed-size chunks of points (see
+gpx_features.iter_track_chunks) and each chunk is folded into running
+accumulators, so peak memory depends on CHUNK_POINTS rather than on the
+length of the file. The resulting feature dict is the same one
+gpx_features.compute_features returns for the whole track at once.
+"""
+
+import os
+
+import numpy as np
+
+from gpx_features import iter_track_chunks, point_distances
+from instrumentation import stage
+
+# Points parsed and reduced per step
+CHUNK_POINTS = 8192
+
+# Uploads larger than this are analyzed in streaming mode
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("GPX_STREAMING_THRESHOLD", 8 * 1024 * 1024))
+
+
+class StreamingTrackStats:
+    """Running length / elevation / timing accumulators over point chunks."""
+
+    def __init__(self):
+        self.points   = 0
+        self.length   = 0.0
+        self.uphill   = 0.0
+        self.downhill = 0.0
+        self.min_ele  = np.inf
+        self.max_ele  = -np.inf
+
+        # Last point seen, for the distance across a chunk boundary
+        self._last = None           # (lat, lon, ele, segment)
+
+        # Smoothing needs one point of look-ahead: the last two points with
+        # an elevation are carried over, plus the final smoothed value of
+        # the first of them (its neighbours were already known).
+        self._ele_tail = np.empty(0)
+        self._seg_tail = np.empty(0, dtype=np.int64)
+        self._smoothed_head = None
+
+        # First/last two timestamps of the segment currently being read
+        self._seg_times   = None
+        self._duration    = 0.0
+        self._time_broken = False
+        self._start_time  = None
+        self._end_time    = None
+
+    # ─── length ────────────────────────────────────────────────────────────
+    def _update_length(self, chunk):
+        lat, lon, ele, seg = chunk.lat, chunk.lon, chunk.ele, chunk.segment
+        if self._last is not None:
+            lat = np.r_[self._last[0], lat]
+            lon = np.r_[self._last[1], lon]
+            ele = np.r_[self._last[2], ele]
+            seg = np.r_[self._last[3], seg]
+        self._last = (lat[-1], lon[-1], ele[-1], seg[-1])
+
+        same_seg = seg[1:] == seg[:-1]
+        d = point_distances(lat[1:], lon[1:], ele[1:], lat[:-1], lon[:-1], ele[:-1])
+        self.length += float(d[same_seg].sum())
+
+    # ─── uphill / downhill ─────────────────────────────────────────────────
+    def _update_elevation(self, chunk):
+        has_ele = ~np.isnan(chunk.ele)
+        if not has_ele.any():
+            return
+        self.min_ele = min(self.min_ele, float(chunk.ele[has_ele].min()))
+        self.max_ele = max(self.max_ele, float(chunk.ele[has_ele].max()))
+
+        ele = np.r_[self._ele_tail, chunk.ele[has_ele]]
+        seg = np.r_[self._seg_tail, chunk.segment[has_ele]]
+        if ele.size < 3:
+            self._ele_tail, self._seg_tail = ele, seg
+            return
+
+        # Points 1..n-2 have both neighbours available now; the last point
+        # waits for the next chunk (or finish()) to know its successor.
+        smoothed = ele.copy()
+        interior = (seg[:-2] == seg[1:-1]) & (seg[1:-1] == seg[2:])
+        mixed    = ele[:-2] * .3 + ele[1:-1] * .4 + ele[2:] * .3
+        smoothed[1:-1] = np.where(interior, mixed, ele[1:-1])
+        if self._smoothed_head is not None:
+            smoothed[0] = self._smoothed_head
+
+        d = np.diff(smoothed[:-1])[seg[1:-1] == seg[:-2]]
+        self.uphill   += float(d[d > 0].sum())
+        self.downhill -= float(d[d < 0].sum())
+
+        self._ele_tail, self._seg_tail = ele[-2:], seg[-2:]
+        self._smoothed_head = smoothed[-2]
+
+    def _finish_elevation(self):
+        ele, seg = self._ele_tail, self._seg_tail
+        if ele.size < 2:
+            return
+        # Only the last pair is left; the final point is an endpoint
+        # and keeps its raw value, the first may still need smoothing.
+        if self._smoothed_head is not None:
+            head = self._smoothed_head
+        else:
+            head = ele[0]
+        if seg[0] == seg[1]:
+            d = ele[1] - head
+            if d > 0:
+                self.uphill += float(d)
+            else:
+                self.downhill -= float(d)
+
+    # ─── duration ──────────────────────────────────────────────────────────
+    def _close_segment(self):
+        # gpxpy tolerates a missing time on the first/last point only
+        seg_times, self._seg_times = self._seg_times, None
+        if seg_times is None or len(seg_times["head"]) < 2:
+            return                      # single-point segments count as 0s
+        head, tail = seg_times["head"], seg_times["tail"]
+        start = head[1] if np.isnan(head[0]) else head[0]
+        end   = tail[0] if np.isnan(tail[1]) else tail[1]
+        if np.isnan(start) or np.isnan(end) or end < start:
+            self._time_broken = True
+        else:
+            self._duration += end - start
+
+    def _update_time(self, chunk):
+        time, seg = chunk.time, chunk.segment
+        if self._start_time is None:
+            self._start_time = time[0]
+        self._end_time = time[-1]
+
+        # Only the first two and last two times of a segment matter
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        ends   = np.r_[starts[1:], seg.size]
+        for lo, hi in zip(starts, ends):
+            if self._seg_times is None or self._seg_times["segment"] != seg[lo]:
+                self._close_segment()
+                self._seg_times = {"segment": seg[lo], "head": [], "tail": []}
+            seg_times = self._seg_times
+            run = time[lo:hi]
+            seg_times["head"] = (seg_times["head"] + list(run[:2]))[:2]
+            seg_times["tail"] = (seg_times["tail"] + list(run[-2:]))[-2:]
+
+    # ─── public API ────────────────────────────────────────────────────────
+    def update(self, chunk):
+        """Fold one TrackArrays chunk into the running totals."""
+        if chunk.lat.size == 0:
+            return
+        self.points += chunk.lat.size
+        self._update_length(chunk)
+        self._update_elevation(chunk)
+        self._update_time(chunk)
+
+    def features(self):
+        """
+        Finish the accumulators and return the DIFF_FEATURES dict, matching
+        gpx_features.compute_features.
+        """
+        if self.points < 2:
+            raise ValueError("Not enough data points")
+        if not np.isfinite(self.min_ele):
+            raise ValueError("Track has no elevation data")
+        if np.isnan(self._start_time) or np.isnan(self._end_time):
+            raise ValueError("Track is missing start or end time")
+
+        self._finish_elevation()
+        self._close_segment()
+        duration_obs = 0.0 if self._time_broken else float(self._duration)
+        total_time   = float(self._end_time - self._start_time)
+
+        return {
+            "length_3d":     self.length,
+            "min_elevation": self.min_ele,
+            "max_elevation": self.max_ele,
+            "uphill":        self.uphill,
+            "downhill":      self.downhill,
+            "break_time":    max(0.0, total_time - duration_obs),
+            "duration":      duration_obs,
+        }
+
+
+def stream_features(stream, chunk_size=CHUNK_POINTS):
+    """Parse and reduce a GPX stream chunk by chunk; returns its feature dict."""
+    stats = StreamingTrackStats()
+    with stage("stream"):
+        for chunk in iter_track_chunks(stream, chunk_size=chunk_size):
+            stats.update(chunk)
+        return stats.features()
+
+
+def upload_size(stream):
+    """
+    Size in bytes of an uploaded file stream (werkzeug spools large
+    uploads to a seekable temp file), or None if it can't be determined.
+    """
+    try:
+        pos = stream.tell()
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(pos)
+        return size
+    except (AttributeError, OSError):
+        return None
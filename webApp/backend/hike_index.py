@@ -0,0 +1,205 @@
+# backend/hike_index.py
+
+"""
+Pluggable nearest-neighbour index for the similar-hike lookup.
+
+Every backend exposes the NearestNeighbors interface the pipeline already
+uses, kneighbors(X, n_neighbors) -> (distances, indices):
+
+  brute, kd_tree, ball_tree   exact, sklearn NearestNeighbors
+  ivf                         approximate inverted-file index: points are
+                              bucketed by a k-means coarse quantizer and a
+                              query only scans the n_probe closest buckets
+
+online_update.py adds uploaded hikes with add(): the IVF index files them
+into its lists, an sklearn index gets wrapped in AppendedIndex.
+
+Build (writes model/difficulty_index.pkl, which the pipeline then prefers
+over difficulty_nn.pkl):
+
+  python hike_index.py --kind ivf --n-lists 256 --n-probe 8
+"""
+
+import argparse
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+INDEX_KINDS = ("brute", "kd_tree", "ball_tree", "ivf")
+
+
+class IVFIndex:
+    """Inverted-file approximate kNN over a k-means coarse quantizer."""
+
+    def __init__(self, n_lists=256, n_probe=8, random_state=42):
+        self.n_lists      = n_lists
+        self.n_probe      = n_probe
+        self.random_state = random_state
+
+    def fit(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_lists = min(self.n_lists, X.shape[0])
+        quantizer = MiniBatchKMeans(
+            n_clusters=n_lists, random_state=self.random_state, n_init=3
+        ).fit(X)
+
+        # Inverted lists as CSR: list l holds rows offsets[l]:offsets[l+1] of
+        # list_X_ (points stored list by list, so a probe is a plain slice)
+        # whose catalogue ids are the same rows of order_
+        labels = quantizer.labels_
+        self.centroids_ = quantizer.cluster_centers_
+        self.order_     = np.argsort(labels, kind="stable")
+        self.offsets_   = np.r_[0, np.cumsum(np.bincount(labels, minlength=n_lists))]
+        self.list_X_    = X[self.order_]
+        return self
+
+    def add(self, X):
+        """
+        Append points (catalogue ids continue from n_samples_fit_) to the
+        lists of their nearest centroids. The quantizer itself is not
+        retrained, so rebuild the index offline once many rows were added.
+        """
+        X = np.ascontiguousarray(np.atleast_2d(X), dtype=np.float64)
+        d2 = (
+            (X ** 2).sum(1)[:, None]
+            - 2 * X @ self.centroids_.T
+            + (self.centroids_ ** 2).sum(1)[None, :]
+        )
+        n_lists = self.centroids_.shape[0]
+        labels = np.r_[np.repeat(np.arange(n_lists), np.diff(self.offsets_)), d2.argmin(1)]
+        ids    = np.r_[self.order_, np.arange(self.n_samples_fit_, self.n_samples_fit_ + X.shape[0])]
+        perm   = np.argsort(labels, kind="stable")
+
+        self.order_   = ids[perm]
+        self.list_X_  = np.vstack([self.list_X_, X])[perm]
+        self.offsets_ = np.r_[0, np.cumsum(np.bincount(labels, minlength=n_lists))]
+        return self
+
+    @property
+    def n_samples_fit_(self):
+        return self.order_.size
+
+    def _probe(self, centroid_order, k):
+        """Row ranges of the closest lists: at least n_probe lists and k points."""
+        sizes = self.offsets_[centroid_order + 1] - self.offsets_[centroid_order]
+        n_lists = max(self.n_probe, int(np.searchsorted(np.cumsum(sizes), k)) + 1)
+        lists = centroid_order[:n_lists]
+        return [(self.offsets_[l], self.offsets_[l + 1]) for l in lists]
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        k = min(n_neighbors, self.n_samples_fit_)
+
+        # Rank the coarse lists for the whole batch in one matrix product
+        c_d2 = (
+            (X ** 2).sum(1)[:, None]
+            - 2 * X @ self.centroids_.T
+            + (self.centroids_ ** 2).sum(1)[None, :]
+        )
+        c_order = np.argsort(c_d2, axis=1)
+
+        distances = np.empty((X.shape[0], k))
+        indices   = np.empty((X.shape[0], k), dtype=np.int64)
+        for i, q in enumerate(X):
+            ranges = self._probe(c_order[i], k)
+            rows = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+            cand = np.concatenate([self.list_X_[lo:hi] for lo, hi in ranges])
+            d2 = ((cand - q) ** 2).sum(1)
+            top = np.argpartition(d2, k - 1)[:k] if d2.size > k else np.arange(d2.size)
+            top = top[np.argsort(d2[top], kind="stable")]
+            distances[i] = np.sqrt(d2[top])
+            indices[i]   = self.order_[rows[top]]
+
+        return (distances, indices) if return_distance else indices
+
+
+class AppendedIndex:
+    """
+    A fitted index plus the rows appended to the catalogue since it was
+    fitted (online_update.py), which are scanned by brute force and merged
+    into every answer. add() only stores the new rows, so a tree index is
+    not rebuilt per batch; fit() refits the wrapped index on everything.
+    """
+
+    def __init__(self, base):
+        self.base  = base
+        self.tail_ = np.empty((0, base.n_features_in_))
+
+    @property
+    def n_samples_fit_(self):
+        return self.base.n_samples_fit_ + self.tail_.shape[0]
+
+    def fit(self, X):
+        self.base.fit(X)
+        self.tail_ = np.empty((0, self.base.n_features_in_))
+        return self
+
+    def add(self, X):
+        self.tail_ = np.vstack([self.tail_, np.atleast_2d(np.asarray(X, dtype=np.float64))])
+        return self
+
+    def kneighbors(self, X, n_neighbors=5, return_distance=True):
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        k = min(n_neighbors, self.n_samples_fit_)
+        distances, indices = self.base.kneighbors(X, min(k, self.base.n_samples_fit_))
+        if self.tail_.shape[0]:
+            tail_d = np.sqrt(((X[:, None, :] - self.tail_[None]) ** 2).sum(2))
+            tail_i = np.broadcast_to(self.base.n_samples_fit_ + np.arange(self.tail_.shape[0]), tail_d.shape)
+            distances = np.hstack([distances, tail_d])
+            indices   = np.hstack([indices, tail_i])
+            top = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, top, 1)
+            indices   = np.take_along_axis(indices, top, 1)
+        return (distances, indices) if return_distance else indices
+
+
+def build_index(X, kind="brute", **params):
+    """Fit a nearest-neighbour index of the given kind (see INDEX_KINDS) on X."""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind {kind!r}, expected one of {INDEX_KINDS}")
+    if kind == "ivf":
+        return IVFIndex(**params).fit(X)
+    return NearestNeighbors(n_neighbors=5, metric="euclidean", algorithm=kind, **params).fit(X)
+
+
+def catalogue_matrix():
+    """The scaled DIFF_FEATURES matrix of the hike catalogue, as served."""
+    import pandas as pd
+
+    from artifacts import registry
+    from gpx_pipeline import DIFF_FEATURES, catalogue_columns
+
+    df = pd.DataFrame(catalogue_columns(), columns=DIFF_FEATURES)
+    return registry.get("diff_scaler").transform(df)
+
+
+def main():
+    from artifacts import DIFF_INDEX_PATH
+
+    parser = argparse.ArgumentParser(description="Build the similar-hike index.")
+    parser.add_argument("--kind", choices=INDEX_KINDS, default="ivf")
+    parser.add_argument("--n-lists", type=int, default=256, help="ivf: number of coarse lists")
+    parser.add_argument("--n-probe", type=int, default=8, help="ivf: lists scanned per query")
+    parser.add_argument("--leaf-size", type=int, default=30, help="kd_tree/ball_tree leaf size")
+    parser.add_argument("--out", default=DIFF_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.kind == "ivf":
+        params = {"n_lists": args.n_lists, "n_probe": args.n_probe}
+    elif args.kind in ("kd_tree", "ball_tree"):
+        params = {"leaf_size": args.leaf_size}
+    else:
+        params = {}
+
+    index = build_index(catalogue_matrix(), args.kind, **params)
+    joblib.dump(index, args.out)
+    print(f"Saved {args.kind} index {params} -> {args.out}")
+
+
+if __name__ == "__main__":
+    # Run through the imported module so the pickled IVFIndex refers to
+    # hike_index.IVFIndex rather than __main__.IVFIndex
+    import hike_index
+    hike_index.main()
@@ -0,0 +1,169 @@
+# backend/inference_scheduler.py
+
+"""
+Micro-batching scheduler for the model stage of /api/process-gpx.
+
+Requests hand their extracted feature dict to scheduler.submit() and get a
+Future back. A single background thread waits for the first submission,
+keeps collecting for up to GPX_INFER_WINDOW_MS or until GPX_INFER_MAX_BATCH
+rows are queued, then scores the whole batch with one
+gpx_pipeline.score_features call (one scaler/model/kmeans/kneighbors call
+per batch instead of per request) and resolves each Future with its row.
+
+Works for threaded WSGI workers (scheduler.score blocks the request thread,
+for at most GPX_INFER_TIMEOUT_S) and for asyncio
+(asyncio.wrap_future(scheduler.submit(...))). A Future cancelled before its
+batch starts, e.g. by a client disconnecting from the ASGI app, is dropped
+from the batch.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+
+from instrumentation import collect_breakdown, record, stage
+
+WINDOW_MS = float(os.environ.get("GPX_INFER_WINDOW_MS", 2.0))
+MAX_BATCH = int(os.environ.get("GPX_INFER_MAX_BATCH", 64))
+TIMEOUT_S = float(os.environ.get("GPX_INFER_TIMEOUT_S", 30))
+
+# Recent batches kept for the size/delay percentiles in stats()
+METRIC_SAMPLES = 1024
+
+
+class InferenceScheduler:
+    """Coalesces concurrent score requests into batched model calls."""
+
+    def __init__(self, score_fn=None, window_ms=WINDOW_MS, max_batch=MAX_BATCH):
+        self.score_fn  = score_fn
+        self.window    = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue    = queue.Queue()
+        self._thread   = None
+        self._lock     = threading.Lock()
+
+        self._batches = 0
+        self._rows    = 0
+        self._sizes   = deque(maxlen=METRIC_SAMPLES)
+        self._delays  = deque(maxlen=METRIC_SAMPLES)
+
+    def _score(self, rows):
+        if self.score_fn is None:
+            # Imported here so process-pool workers never load the models
+            from gpx_pipeline import score_features
+            self.score_fn = score_features
+        return self.score_fn(rows)
+
+    def _ensure_started(self):
+        # Started on first use, so nothing runs before a pre-fork server forks
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="gpx-inference", daemon=True
+                    )
+                    self._thread.start()
+
+    def submit(self, feats):
+        """Queue one feature dict; returns a Future resolving to its stats dict."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((feats, future, time.perf_counter()))
+        return future
+
+    def score(self, feats, timeout=TIMEOUT_S, timings=None):
+        """
+        Blocking submit(): the stats dict for one feature dict. If a timings
+        dict is given, the batch's stage times and this row's queueing
+        delay are added to it. Raises TimeoutError after `timeout` seconds
+        (the row is dropped if its batch hasn't started yet).
+        """
+        future = self.submit(feats)
+        try:
+            result = future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+        if timings is not None:
+            timings.update(future.stage_times)
+        return result
+
+    def _collect(self):
+        """Block for one item, then gather more until the window or batch fills."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _resolve(future, result=None, error=None):
+        # A future that can't take its outcome must not stop the thread
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        while True:
+            # Claim every future first; the ones cancelled meanwhile are dropped
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            rows = [feats for feats, _, _ in batch]
+            with collect_breakdown() as batch_times:
+                try:
+                    with stage("score"):
+                        results = self._score(rows)
+                except Exception:
+                    # Score rows one by one so a bad track only fails its own request
+                    results = None
+
+            for i, (feats, future, queued) in enumerate(batch):
+                record("queue", started - queued)
+                future.stage_times = {"queue": started - queued, **batch_times}
+                if results is not None:
+                    self._resolve(future, results[i])
+                    continue
+                try:
+                    self._resolve(future, self._score([feats])[0])
+                except Exception as e:
+                    self._resolve(future, error=e)
+
+            self._batches += 1
+            self._rows += len(batch)
+            self._sizes.append(len(batch))
+            self._delays.extend(started - queued for _, _, queued in batch)
+
+    def stats(self):
+        """Batch size and queueing delay (submit -> batch start) metrics."""
+        sizes  = np.asarray(self._sizes, dtype=float)
+        delays = np.asarray(self._delays, dtype=float) * 1000
+        return {
+            "window_ms":          self.window * 1000,
+            "max_batch":          self.max_batch,
+            "batches":            self._batches,
+            "rows":               self._rows,
+            "queued":             self._queue.qsize(),
+            "batch_size_mean":    round(float(sizes.mean()), 2) if sizes.size else None,
+            "batch_size_max":     int(sizes.max()) if sizes.size else None,
+            "queue_delay_ms_p50": round(float(np.percentile(delays, 50)), 3) if delays.size else None,
+            "queue_delay_ms_p99": round(float(np.percentile(delays, 99)), 3) if delays.size else None,
+        }
+
+
+scheduler = InferenceScheduler()
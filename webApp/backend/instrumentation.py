@@ -0,0 +1,232 @@
+# backend/instrumentation.py
+
+"""
+Per-stage latency timers and request profiling for the GPX pipeline.
+
+  with stage("knn"):
+      ...
+
+records the block's wall time into a per-stage histogram (rendered in
+Prometheus text format by render_prometheus, served at /api/metrics) and,
+inside collect_breakdown(), into a per-request {stage: seconds} dict that
+the API returns as a Server-Timing header when asked to. With
+GPX_STAGE_TIMERS=0, stage() returns a shared no-op context manager.
+
+Stages: parse, simplify (only with GPX_SIMPLIFY set), features
+(length_3d, uphill_downhill, moving_time inside it), stream (chunked parse
++ reduce for large uploads), segments (per-window reduction of
+/api/process-gpx/segments), geo (radius and feature kNN of "near me"
+recommendations), split (per-track cut of /api/process-gpx/tracks), and
+per model batch scale, time_model, kmeans, knn, format (all inside score);
+the apps add hash, cache, extract, queue and total.
+
+Profiling: with GPX_PROFILE_EVERY=N every Nth profiled request is captured
+to GPX_PROFILE_DIR, either with cProfile (GPX_PROFILE_MODE=cprofile, a
+.prof file for pstats/snakeviz) or by a stack-sampling thread
+(GPX_PROFILE_MODE=sample, a .folded file of collapsed stacks for
+flamegraph.pl/speedscope).
+"""
+
+import bisect
+import contextlib
+import contextvars
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+TIMERS_ENABLED = os.environ.get("GPX_STAGE_TIMERS", "1") != "0"
+
+# Histogram upper bounds in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_EVERY       = int(os.environ.get("GPX_PROFILE_EVERY", 0))
+PROFILE_DIR         = os.environ.get("GPX_PROFILE_DIR", "profiles")
+PROFILE_MODE        = os.environ.get("GPX_PROFILE_MODE", "cprofile")
+SAMPLE_INTERVAL_MS  = float(os.environ.get("GPX_PROFILE_INTERVAL_MS", 1.0))
+
+
+# ─── Stage timers ────────────────────────────────────────────────────────────
+
+class StageHistograms:
+    """Cumulative latency histograms, one per stage name."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._counts = {}
+        self._sums   = {}
+        self._lock   = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            counts = self._counts.get(name)
+            if counts is None:
+                counts = self._counts[name] = [0] * (len(self.buckets) + 1)
+                self._sums[name] = 0.0
+            # First bucket with seconds <= bound; the last slot is +Inf
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._sums[name] += seconds
+
+    def snapshot(self):
+        """{stage: (per-bucket counts, sum)} copied under the lock."""
+        with self._lock:
+            return {name: (list(c), self._sums[name]) for name, c in self._counts.items()}
+
+
+histograms = StageHistograms()
+
+_breakdown = contextvars.ContextVar("gpx_stage_breakdown", default=None)
+
+
+def record(name, seconds):
+    """Add one timing to the stage histogram and the current breakdown."""
+    histograms.observe(name, seconds)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[name] = breakdown.get(name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name):
+    """Context manager timing a pipeline stage (a no-op when timers are off)."""
+    return _Stage(name) if TIMERS_ENABLED else _NO_STAGE
+
+
+@contextlib.contextmanager
+def collect_breakdown():
+    """Collect {stage: seconds} for everything timed in this context."""
+    breakdown = {}
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def server_timing(breakdown):
+    """Format a breakdown as a Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in breakdown.items())
+
+
+def render_prometheus(gauges=None):
+    """
+    Stage histograms (gpx_stage_seconds) plus any extra {metric: value}
+    gauges, in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP gpx_stage_seconds Wall time spent in each GPX pipeline stage.",
+        "# TYPE gpx_stage_seconds histogram",
+    ]
+    for name, (counts, total) in sorted(histograms.snapshot().items()):
+        cumulative = 0
+        for bound, count in zip(histograms.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'gpx_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'gpx_stage_seconds_sum{{stage="{name}"}} {total:.9f}')
+        lines.append(f'gpx_stage_seconds_count{{stage="{name}"}} {cumulative}')
+
+    for metric, value in (gauges or {}).items():
+        if value is None:
+            continue
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ─── Profiling ───────────────────────────────────────────────────────────────
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval_ms=SAMPLE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval  = interval_ms / 1000.0
+        self.stacks    = Counter()
+        self._stop     = threading.Event()
+        self._thread   = threading.Thread(target=self._run, name="gpx-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """Profiles every Nth request passed through maybe_profile()."""
+
+    def __init__(self, every=PROFILE_EVERY, directory=PROFILE_DIR, mode=PROFILE_MODE):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"Unknown profile mode {mode!r}, expected 'cprofile' or 'sample'")
+        self.every     = every
+        self.directory = directory
+        self.mode      = mode
+        self._counter  = itertools.count(1)
+
+    @contextlib.contextmanager
+    def maybe_profile(self, label="request"):
+        """Yields True (and writes a profile on exit) for every Nth call."""
+        n = next(self._counter) if self.every > 0 else 0
+        if not n or n % self.every:
+            yield False
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{label}-{int(time.time())}-{n}")
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield True
+            finally:
+                profile.disable()
+                profile.dump_stats(base + ".prof")
+        else:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                yield True
+            finally:
+                sampler.stop()
+                sampler.dump(base + ".folded")
+
+
+profiler = RequestProfiler()
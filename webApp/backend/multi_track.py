@@ -0,0 +1,217 @@
+# backend/multi_track.py
+
+"""
+Per-track and per-segment analysis of GPX files with several <trk> or
+<trkseg> elements.
+
+analyze_gpx_stream and /api/process-gpx treat a file as one hike: every
+track and segment is merged into a single feature row. A multi-day trip
+recorded as one track per day, or a track split wherever the recorder
+paused, instead gets one result per part here, with the same features,
+predicted duration, difficulty and nearest hikes as a single upload.
+
+split_tracks() cuts the raw document into one standalone GPX document per
+<trk> (the original header and root element around each track), located
+by an expat pass that builds no tree, so every track is parsed once, on
+its own. Files of at least GPX_TRACKS_PARALLEL_BYTES with more than one
+track have their tracks parsed and reduced to features on the gpx_batch
+process pool; smaller files are handled in-process, where the pool round
+trip would cost more than it saves. Either way the models then run once, on the stacked
+feature rows of every part (gpx_pipeline.score_features).
+
+Parts that cannot be analysed (a single point, no elevation, no
+timestamps) are reported with their error instead of failing the file.
+"""
+
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+import numpy as np
+
+from gpx_batch import MAX_WORKERS
+from gpx_features import TrackArrays, compute_features, read_track_arrays
+from instrumentation import stage
+
+PARALLEL_BYTES = int(os.environ.get("GPX_TRACKS_PARALLEL_BYTES", 4 * 1024 * 1024))
+
+MODES = ("track", "segment")
+
+# The rest of a tag up to its closing '>', which may appear in quoted values
+TAG_END = re.compile(rb"""(?:[^>"']|"[^"]*"|'[^']*')*>""")
+
+
+def _local(tag):
+    return tag.rpartition("}")[2]
+
+
+def _tag_end(data, i):
+    """Offset just past the tag starting at data[i] ('>' inside quoted attributes skipped)."""
+    return TAG_END.match(data, i).end()
+
+
+def split_tracks(data):
+    """
+    One standalone GPX document (bytes) per <trk> of a GPX document: the
+    original prolog and root element, that track and the closing root tag.
+    An expat pass without any tree finds the byte range of every <trk>
+    child of the root, so comments, CDATA, empty <trk/> elements and
+    namespace prefixes need no special casing, and each track is only
+    parsed for real by whoever analyses it.
+    """
+    # Names come with their prefix (g:trk), namespaces aren't resolved
+    parser = expat.ParserCreate()
+    ranges, depth, root_close = [], 0, None
+
+    def start(name, attrs):
+        nonlocal depth
+        depth += 1
+        if depth == 2 and (name == "trk" or name.endswith(":trk")):
+            ranges.append(parser.CurrentByteIndex)
+
+    def end(name):
+        nonlocal depth, root_close
+        depth -= 1
+        if depth > 1:
+            return
+        at = parser.CurrentByteIndex
+        if depth == 1 and (name == "trk" or name.endswith(":trk")):
+            start_end = _tag_end(data, ranges[-1])
+            empty = data[start_end - 2:start_end] == b"/>"
+            ranges[-1] = (ranges[-1], start_end if empty else _tag_end(data, at))
+        elif depth == 0:
+            root_close = data[at:_tag_end(data, at)]
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler   = end
+    try:
+        parser.Parse(data, True)
+    except expat.ExpatError as e:
+        raise ValueError(f"Invalid GPX: {e}") from None
+    if not ranges:
+        raise ValueError("GPX has no tracks")
+
+    header = data[:ranges[0][0]]
+    return [header + data[s:e] + root_close for s, e in ranges]
+
+
+def track_name(doc):
+    """The <name> of the single track in a split_tracks document, or None."""
+    path = []
+    for event, elem in ET.iterparse(io.BytesIO(doc), events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if tag == "trkseg":
+                return None
+            path.append(tag)
+            continue
+        path.pop()
+        # gpx > trk > name, the track's own name (not the file's or a point's)
+        if tag == "name" and path[1:] == ["trk"]:
+            return (elem.text or "").strip()
+    return None
+
+
+def _part(track, points):
+    """(points, features, error) of one track or segment."""
+    try:
+        return points, compute_features(track), None
+    except Exception as e:
+        return points, None, str(e)
+
+
+def track_parts(doc, mode="track"):
+    """
+    Analyse the single track of a split_tracks document; safe for pool
+    workers. Returns (name, [(segment, points, features, error), ...]),
+    with segment None in "track" mode and the segment's position inside
+    the track in "segment" mode.
+    """
+    name = track_name(doc)
+    with stage("parse"):
+        track = read_track_arrays(io.BytesIO(doc))
+
+    with stage("features"):
+        if mode == "track":
+            return name, [(None, *_part(track, track.lat.size))]
+
+        # Points are in document order, so every segment is one run
+        starts = np.flatnonzero(np.r_[True, track.segment[1:] != track.segment[:-1]])
+        bounds = np.r_[starts, track.lat.size]
+        parts = []
+        for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            segment = TrackArrays(*(a[lo:hi] for a in track))
+            parts.append((i, *_part(segment, int(hi - lo))))
+        return name, parts
+
+
+def check_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    return mode
+
+
+def fan_out(data, docs):
+    """
+    Whether a document's tracks are worth sending to the process pool: with
+    a single worker the pool only adds the round trip.
+    """
+    return MAX_WORKERS > 1 and len(docs) > 1 and len(data) >= PARALLEL_BYTES
+
+
+def analyze_track_docs(docs, mode="track", pool=None):
+    """track_parts() of every document, in order, on `pool` when given."""
+    if pool is None:
+        return [track_parts(doc, mode) for doc in docs]
+    return list(pool.map(track_parts, docs, [mode] * len(docs)))
+
+
+def score_parts(results, n_neighbors=3):
+    """
+    One entry per track (or segment) of track_parts results, scored in a
+    single batch: {"track", "name", ["segment",] "points", **stats} or
+    the same keys with "error".
+    """
+    from gpx_pipeline import score_features
+
+    entries, rows = [], []
+    for track_no, (name, parts) in enumerate(results):
+        for segment, points, feats, error in parts:
+            entry = {"track": track_no, "name": name}
+            if segment is not None:
+                entry["segment"] = segment
+            entry["points"] = points
+            if error is not None:
+                entry["error"] = error
+            else:
+                rows.append((entry, feats))
+            entries.append(entry)
+
+    if rows:
+        with stage("score"):
+            stats = score_features([feats for _, feats in rows], n_neighbors)
+        for (entry, _), row_stats in zip(rows, stats):
+            entry.update(row_stats)
+    return {"tracks": len(results), "parts": entries}
+
+
+def analyze_tracks(data, mode="track", pool=None):
+    """
+    Per-track or per-segment results for the raw bytes of a GPX file.
+    Tracks of large multi-track files are analysed on `pool` (the shared
+    gpx_batch pool when None).
+    """
+    from gpx_batch import get_pool, recovering
+
+    check_mode(mode)
+    with stage("split"):
+        docs = split_tracks(data)
+    if fan_out(data, docs):
+        pool = pool or get_pool()
+    else:
+        pool = None
+    with stage("extract"), recovering(pool):
+        results = analyze_track_docs(docs, mode, pool)
+    return score_parts(results)
@@ -0,0 +1,335 @@
+# backend/online_update.py
+
+"""
+Online updates of the difficulty and similar-hike models from uploads.
+
+With GPX_ONLINE_UPDATES=1 every freshly analysed upload hands its feature
+row to updater.observe(). Rows are buffered and applied in batches (every
+GPX_ONLINE_BATCH_ROWS rows or GPX_ONLINE_FLUSH_S seconds) on a background
+thread, under a file lock so several workers never interleave updates.
+
+A batch only appends, at a cost proportional to the batch:
+
+  1. the new rows, deduplicated by upload hash and labelled by the current
+     clustering, become a fragment of the catalogue table
+     (model/difficulty_catalogue.arrow, see feature_store.append_rows) and
+     of the training feature store (GPX_ONLINE_STORE, by default
+     data/hikes.arrow) if it exists
+  2. the compact catalogue (compact_catalogue.py) and the neighbour index
+     take them with add(): an IVF index (hike_index.py) into its lists,
+     an sklearn index (classifier.py's diff_nn, or a tree from
+     hike_index.py) into the brute-force tail of hike_index.AppendedIndex
+     wrapped around it, so no tree is rebuilt per batch
+
+Once GPX_ONLINE_REBUILD_ROWS rows have been appended since the last
+rebuild, the batch also runs the full rebuild: the difficulty clustering
+takes a MiniBatchKMeans.partial_fit step over those rows (a KMeans from
+classifier.py is converted once, seeded with its centres and cluster
+sizes), every row is relabelled and the catalogue rewritten as one file,
+the Easy/Medium/Hard map is re-derived, and the neighbour (unwrapped),
+compact, filtered (filtered_index.py) and spatial (geo_index.py) indexes
+are refit. Until then the filtered and spatial indexes don't return the
+new rows.
+
+Every file is replaced atomically, catalogue first and index last, so a
+reader never sees index rows the catalogue doesn't have yet. The map is
+stored on the kmeans it belongs to (artifacts.clustering), so the two are
+swapped in as one file. The updating worker swaps the new files in right
+away; the servers watch the artifacts every GPX_ONLINE_WATCH_S seconds
+while online updates are on (unless GPX_ARTIFACT_WATCH_S is set), so
+other workers do too without a request paying for the reload.
+
+The diff_scaler and the duration model are left as trained; retrain with
+classifier.py / timeRegression.py to refit those (they read the appended
+feature store).
+"""
+
+import fcntl
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+from sklearn.cluster import MiniBatchKMeans
+
+from artifacts import (
+    ARTIFACT_DIR, DIFF_CATALOGUE_PATH, DIFF_COMPACT_PATH, DIFF_GEO_PATH, DIFF_INDEX_PATH,
+    DIFF_KMEANS_PATH, DIFF_NN_PATH, DIFF_PARTITIONS_PATH, DIFF_SCALER_PATH, SRC_DIR, registry,
+)
+import feature_store   # from src/, which importing artifacts puts on sys.path
+from filtered_index import DIFFICULTY_LABELS, PartitionedIndex, difficulty_levels
+from geo_index import GeoIndex
+from gpx_pipeline import DIFF_FEATURES, scale_matrix
+from hike_index import AppendedIndex
+
+ONLINE_UPDATES = os.environ.get("GPX_ONLINE_UPDATES") == "1"
+BATCH_ROWS     = int(os.environ.get("GPX_ONLINE_BATCH_ROWS", 32))
+FLUSH_SECONDS  = float(os.environ.get("GPX_ONLINE_FLUSH_S", 60))
+REBUILD_ROWS   = int(os.environ.get("GPX_ONLINE_REBUILD_ROWS", 4096))
+WATCH_SECONDS  = float(os.environ.get("GPX_ONLINE_WATCH_S", 5))
+STORE_PATH     = os.environ.get(
+    "GPX_ONLINE_STORE", os.path.join(SRC_DIR, "..", feature_store.HIKES_PATH)
+)
+LOCK_PATH      = os.path.join(ARTIFACT_DIR, ".online_update.lock")
+
+# Columns an appendable catalogue has besides DIFF_FEATURES
+APPEND_COLUMNS = ["cluster", "upload_hash"]
+
+# Upload hashes of each catalogue file, keyed by (path, size, mtime_ns):
+# files are only ever replaced, so a file is read once
+_file_hashes = {}
+
+
+def _dump(obj, path):
+    """joblib.dump via a rename, so memory-mapped readers of path stay valid."""
+    joblib.dump(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _read_catalogue():
+    """The full catalogue table as a DataFrame (built from the legacy pickle if needed)."""
+    if os.path.exists(DIFF_CATALOGUE_PATH):
+        return feature_store.open_table(DIFF_CATALOGUE_PATH).to_pandas()
+    return joblib.load(registry.paths["diff_df_raw"]).reset_index(drop=True)
+
+
+def _appendable():
+    """True if batches can be appended to the catalogue as fragments."""
+    return os.path.exists(DIFF_CATALOGUE_PATH) and set(APPEND_COLUMNS) <= set(
+        feature_store.column_names(DIFF_CATALOGUE_PATH)
+    )
+
+
+def _catalogue_hashes():
+    """One set of upload hashes per catalogue file."""
+    hashes = []
+    current = {}
+    for path in feature_store.table_files(DIFF_CATALOGUE_PATH):
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        if key not in _file_hashes:
+            column = feather.read_table(path, columns=["upload_hash"], memory_map=True).column(0)
+            _file_hashes[key] = set(column.drop_null().to_pylist())
+        current[key] = _file_hashes[key]
+        hashes.append(current[key])
+    _file_hashes.clear()
+    _file_hashes.update(current)
+    return hashes
+
+
+def _rows_since_rebuild():
+    """Rows appended as catalogue fragments since the last full rebuild."""
+    return sum(
+        feather.read_table(path, columns=[DIFF_FEATURES[0]], memory_map=True).num_rows
+        for path in feature_store.fragment_paths(DIFF_CATALOGUE_PATH)
+    )
+
+
+def as_minibatch(kmeans, X):
+    """
+    A MiniBatchKMeans continuing a fitted KMeans: one partial_fit over the
+    catalogue it was fitted on starts from its centres and leaves them
+    where they were (they are already the means of their clusters) while
+    recording the cluster sizes, so later small batches only nudge them.
+    """
+    if isinstance(kmeans, MiniBatchKMeans):
+        return kmeans
+    mbk = MiniBatchKMeans(
+        n_clusters=kmeans.n_clusters, init=kmeans.cluster_centers_, n_init=1,
+        random_state=getattr(kmeans, "random_state", None),
+    )
+    return mbk.partial_fit(X)
+
+
+def cluster_map(labels, duration):
+    """Cluster id -> difficulty label, by mean duration (classifier.py's rule)."""
+    order = pd.Series(duration).groupby(labels).mean().sort_values().index
+    return {cid: lbl for cid, lbl in zip(order, DIFFICULTY_LABELS)}
+
+
+def append_update(new):
+    """
+    Append the rows of `new` (DIFF_FEATURES and upload_hash) that aren't in
+    the catalogue yet, without touching the existing rows. Returns the
+    number of rows added.
+    """
+    known = _catalogue_hashes()
+    new = new[[not any(h in s for s in known) for h in new["upload_hash"]]]
+    if new.empty:
+        return 0
+
+    X_new = scale_matrix(joblib.load(DIFF_SCALER_PATH), new[DIFF_FEATURES].to_numpy(np.float64))
+    new = new.assign(cluster=joblib.load(DIFF_KMEANS_PATH).predict(X_new))
+
+    # 1. Catalogue rows first, so the indexes never point past its end
+    feature_store.append_rows(new, DIFF_CATALOGUE_PATH, parquet=False)
+    if os.path.exists(STORE_PATH):
+        feature_store.append_rows(new[feature_store.FEATURES], STORE_PATH)
+
+    # 2. Indexes that can take rows without a refit
+    if os.path.exists(DIFF_COMPACT_PATH):
+        _dump(joblib.load(DIFF_COMPACT_PATH).add(new[DIFF_FEATURES]), DIFF_COMPACT_PATH)
+    index_path = DIFF_INDEX_PATH if os.path.exists(DIFF_INDEX_PATH) else DIFF_NN_PATH
+    if os.path.exists(index_path):
+        index = joblib.load(index_path)
+        if not hasattr(index, "add"):
+            index = AppendedIndex(index)
+        _dump(index.add(X_new), index_path)
+    return len(new)
+
+
+def rebuild(new=None):
+    """
+    Fold the rows appended since the last rebuild (and the rows of `new`
+    not in the catalogue yet) into the clustering, then rewrite the
+    catalogue and refit every built index over all rows. Returns the number
+    of rows added from `new`.
+    """
+    catalogue = _read_catalogue()
+    n_delta = _rows_since_rebuild() if os.path.exists(DIFF_CATALOGUE_PATH) else 0
+    added = 0
+    if new is not None:
+        seen = set(catalogue["upload_hash"].dropna()) if "upload_hash" in catalogue else set()
+        new = new[~new["upload_hash"].isin(seen)]
+        catalogue = pd.concat([catalogue, new], ignore_index=True)
+        added = len(new)
+        n_delta += added
+    n_base = len(catalogue) - n_delta
+
+    scaler = joblib.load(DIFF_SCALER_PATH)
+    raw = catalogue[DIFF_FEATURES].to_numpy(np.float64)
+    X = scale_matrix(scaler, raw)
+    kmeans = as_minibatch(joblib.load(DIFF_KMEANS_PATH), X[:n_base])
+    if n_delta:
+        kmeans.partial_fit(X[n_base:])
+    labels = kmeans.predict(X)
+    kmeans.cluster_map_ = cluster_map(labels, catalogue["duration"].to_numpy())
+
+    # 1. Catalogue rows first, so the indexes never point past its end
+    catalogue["cluster"] = labels
+    feature_store.write_table(catalogue, DIFF_CATALOGUE_PATH, parquet=False)
+    if added and os.path.exists(STORE_PATH):
+        feature_store.append_rows(new[feature_store.FEATURES], STORE_PATH)
+
+    # 2. Clustering, with its map, as one file
+    _dump(kmeans, DIFF_KMEANS_PATH)
+
+    # 3. Every built index, refit on all rows
+    if os.path.exists(DIFF_COMPACT_PATH):
+        compact = joblib.load(DIFF_COMPACT_PATH)
+        names = compact.names(np.arange(compact.n_samples_fit_)) + [None] * (len(raw) - compact.n_samples_fit_)
+        compact = type(compact)(compact.n_lists, compact.random_state)
+        _dump(compact.fit(raw, scaler, DIFF_FEATURES, names), DIFF_COMPACT_PATH)
+    index_path = DIFF_INDEX_PATH if os.path.exists(DIFF_INDEX_PATH) else DIFF_NN_PATH
+    index = joblib.load(index_path)
+    _dump((index.base if isinstance(index, AppendedIndex) else index).fit(X), index_path)
+    levels = difficulty_levels(labels, kmeans.cluster_map_)
+    if os.path.exists(DIFF_PARTITIONS_PATH):
+        partitions = PartitionedIndex(joblib.load(DIFF_PARTITIONS_PATH).target_size)
+        _dump(partitions.fit(X, raw, levels, DIFF_FEATURES), DIFF_PARTITIONS_PATH)
+    if os.path.exists(DIFF_GEO_PATH) and "start_lat" in catalogue:
+        geo = GeoIndex(joblib.load(DIFF_GEO_PATH).cell_deg)
+        _dump(geo.fit(catalogue["start_lat"], catalogue["start_lon"], X, raw, levels, DIFF_FEATURES),
+              DIFF_GEO_PATH)
+    return added
+
+
+def apply_update(rows, hashes):
+    """
+    Apply one batch of feature dicts (with their upload hashes) to the
+    artifacts on disk: append them, and rebuild once REBUILD_ROWS rows
+    were appended (or right away for a catalogue that can't take appends
+    yet). Returns the number of rows actually added.
+    """
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    with open(LOCK_PATH, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        new = pd.DataFrame(rows, columns=DIFF_FEATURES)
+        new["upload_hash"] = hashes
+        new = new.drop_duplicates("upload_hash")
+        if not _appendable():
+            return rebuild(new)
+        added = append_update(new)
+        if added and _rows_since_rebuild() >= REBUILD_ROWS:
+            rebuild()
+        return added
+
+
+class OnlineUpdater:
+    """Buffers analysed rows and applies them in batches on a background thread."""
+
+    def __init__(self, batch_rows=BATCH_ROWS, flush_seconds=FLUSH_SECONDS):
+        self.batch_rows    = max(1, batch_rows)
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._lock    = threading.Lock()
+        self._wake    = threading.Event()
+        self._thread  = None
+
+        self._updates = 0
+        self._rows    = 0
+        self._errors  = 0
+        self._last_update_s = None
+
+    def observe(self, feats, content_hash):
+        """Queue one analysed upload's feature dict."""
+        self._ensure_started()
+        with self._lock:
+            self._pending.append((feats, content_hash))
+            if len(self._pending) >= self.batch_rows:
+                self._wake.set()
+
+    def _ensure_started(self):
+        # Started on first use, so nothing runs before a pre-fork server forks
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="gpx-online-update", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep serving with the current models; the rows are dropped
+                self._errors += 1
+
+    def flush(self):
+        """Apply everything buffered now; returns the number of rows added."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        added = apply_update([feats for feats, _ in batch], [h for _, h in batch])
+        # This worker swaps the new files in right away (off the request path)
+        registry.refresh(reload=True)
+        self._updates += 1
+        self._rows += added
+        self._last_update_s = round(time.perf_counter() - start, 4)
+        return added
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "enabled":       ONLINE_UPDATES,
+            "pending":       pending,
+            "updates":       self._updates,
+            "rows_added":    self._rows,
+            "errors":        self._errors,
+            "last_update_s": self._last_update_s,
+        }
+
+
+updater = OnlineUpdater()
@@ -0,0 +1,153 @@
+# backend/result_cache.py
+
+"""
+Content-addressed cache of /api/process-gpx results.
+
+A result is keyed by the SHA-256 of the uploaded bytes plus a fingerprint of
+the model artifacts on disk, so re-uploads and client retries skip the whole
+pipeline, and any change to a model/*.pkl (or *.npz) file changes every key
+and invalidates the old results automatically. The fingerprint is the one
+the registry serves: while registry.watch() runs it is kept current in the
+background, otherwise the model directory is checked at most every
+GPX_CACHE_CHECK_S seconds rather than on every request.
+
+Two tiers: an in-process LRU dict in front of an on-disk SQLite table shared
+by all workers, evicted least-recently-used once it grows past
+GPX_CACHE_DISK_BYTES.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from artifacts import registry
+from gpx_simplify import SIMPLIFY
+
+CACHE_DIR        = os.environ.get("GPX_CACHE_DIR", "cache")
+CACHE_DB_PATH    = os.path.join(CACHE_DIR, "results.sqlite")
+MEMORY_ITEMS     = int(os.environ.get("GPX_CACHE_MEMORY_ITEMS", 1024))
+DISK_BYTES       = int(os.environ.get("GPX_CACHE_DISK_BYTES", 256 * 1024 * 1024))
+CHECK_SECONDS    = float(os.environ.get("GPX_CACHE_CHECK_S", 1.0))
+
+# Bump when the shape of the cached stats changes
+CACHE_VERSION = 1
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def hash_stream(stream):
+    """SHA-256 hex digest of a seekable stream, which is rewound afterwards."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(_HASH_CHUNK), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """In-memory LRU in front of a size-bounded SQLite table."""
+
+    def __init__(self, db_path=CACHE_DB_PATH, memory_items=MEMORY_ITEMS, disk_bytes=DISK_BYTES,
+                 check_seconds=CHECK_SECONDS):
+        self.memory_items  = memory_items
+        self.disk_bytes    = disk_bytes
+        self.check_seconds = check_seconds
+        self._memory       = OrderedDict()
+        self._lock         = threading.Lock()
+        self._fingerprint  = None
+        self._checked      = None
+
+        self.db_path = db_path
+        self._db = None
+        if db_path and disk_bytes > 0:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT, value TEXT,"
+                " size INTEGER, accessed REAL)"
+            )
+            self._db.commit()
+
+    def _check_fingerprint(self):
+        """
+        Current artifact fingerprint, refreshed at most every check_seconds.
+        When it changes, the registry drops the stale models and results
+        computed with the old ones are purged.
+        """
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_seconds:
+            return self._fingerprint
+        self._checked = now
+        fingerprint = registry.refresh()
+        if fingerprint != self._fingerprint:
+            with self._lock:
+                self._memory.clear()
+                if self._db is not None:
+                    self._db.execute("DELETE FROM results WHERE fingerprint != ?", (fingerprint,))
+                    self._db.commit()
+                self._fingerprint = fingerprint
+        return fingerprint
+
+    def key(self, content_hash):
+        """Cache key for an upload hash under the current artifacts and simplification."""
+        return f"v{CACHE_VERSION}:{self._check_fingerprint()}:{SIMPLIFY}:{content_hash}"
+
+    def get(self, key):
+        """Return (value, tier) with tier 'memory' or 'disk', or (None, None)."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key], "memory"
+            if self._db is None:
+                return None, None
+            row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            value = json.loads(row[0])
+            self._remember(key, value)
+            return value, "disk"
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+            blob = json.dumps(value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, self._fingerprint, blob, len(blob), time.time()),
+            )
+            self._evict_disk()
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Drop least-recently-used rows until the table fits disk_bytes."""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        while total > self.disk_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                if total <= self.disk_bytes:
+                    break
+
+
+cache = ResultCache()
@@ -0,0 +1,163 @@
+# backend/segment_pace.py
+
+"""
+Per-segment pace and ETA checkpoints along a track.
+
+segment_table() cuts a parsed track into fixed-distance windows (every
+window_m meters of 3D path, GPX_SEGMENT_WINDOW_M by default) and reduces
+every point-to-point step into its window with np.bincount in one pass:
+distance, elevation delta, uphill/downhill (gpxpy-smoothed, so the windows
+add up to the whole-track features), grade and, when the track has
+timestamps, the observed moving time.
+
+predict_segments() then times all windows in one batched call: Tobler's
+hiking function gives each window's relative cost from its grade, and the
+windows are scaled so they add up to the duration model's prediction for
+the whole track. Cumulative sums of those are the ETA checkpoints, so the
+last checkpoint is exactly predicted_duration from /api/process-gpx while
+climbs get more of the time than flat or downhill stretches.
+
+The duration model itself only knows whole hikes: fed with route prefixes
+it bottoms out at ~20 minutes for the first few hundred meters, which is
+why it sets the total here rather than the per-window shape.
+"""
+
+import io
+import os
+
+import numpy as np
+
+from artifacts import registry
+from gpx_features import compute_features, elevation_steps, point_distances, read_track_arrays
+from gpx_pipeline import (
+    TIME_FEATURES, feature_matrix, scale_matrix, secs_to_hm, secs_to_hm_array, time_model,
+)
+from instrumentation import stage
+
+WINDOW_M = float(os.environ.get("GPX_SEGMENT_WINDOW_M", 500))
+
+# Accepted window lengths: below MIN_WINDOW_M a request could ask for
+# millions of windows (and their arrays) on an ordinary track
+MIN_WINDOW_M, MAX_WINDOW_M = 10.0, 10_000.0
+
+# Tobler's hiking function: km/h = 6 * exp(-3.5 * |grade + 0.05|)
+TOBLER_KMH, TOBLER_DECAY, TOBLER_OFFSET = 6.0, 3.5, 0.05
+
+
+def check_window(window_m):
+    # Written so that NaN fails too
+    if not MIN_WINDOW_M <= window_m <= MAX_WINDOW_M:
+        raise ValueError(f"window_m must be between {MIN_WINDOW_M:g} and {MAX_WINDOW_M:g} meters")
+    return window_m
+
+
+def segment_table(track, window_m=WINDOW_M):
+    """
+    {column: array} with one entry per window of window_m meters:
+    start_m, distance_m, elevation_delta_m, uphill_m, downhill_m, grade and
+    observed_sec (NaN without timestamps). Steps across a segment break
+    count for nothing; the last window holds the remainder.
+    """
+    check_window(window_m)
+    same_seg = track.segment[1:] == track.segment[:-1]
+    step = np.where(same_seg, point_distances(
+        track.lat[1:],  track.lon[1:],  track.ele[1:],
+        track.lat[:-1], track.lon[:-1], track.ele[:-1],
+    ), 0.0)
+    start = np.r_[0.0, np.cumsum(step)]
+
+    # Step i (point i -> i+1) belongs to the window its start point is in
+    window = (start[:-1] // window_m).astype(np.int64)
+    n = int(window[-1]) + 1 if window.size else 1
+
+    ele_idx, ele_d = elevation_steps(track.ele, track.segment)
+    ele_window = window[ele_idx - 1]
+    delta    = np.bincount(ele_window, ele_d, n)
+    uphill   = np.bincount(ele_window, np.clip(ele_d, 0, None), n)
+    downhill = np.bincount(ele_window, np.clip(-ele_d, 0, None), n)
+
+    distance = np.bincount(window, step, n)
+    grade = np.divide(delta, distance, out=np.zeros(n), where=distance > 0)
+
+    dt = np.where(same_seg, np.diff(track.time), 0.0)
+    observed = np.bincount(window, np.nan_to_num(dt), n)
+    if np.isnan(dt[same_seg]).any():
+        observed[:] = np.nan
+
+    return {
+        "start_m":           np.arange(n) * window_m,
+        "distance_m":        distance,
+        "elevation_delta_m": delta,
+        "uphill_m":          uphill,
+        "downhill_m":        downhill,
+        "grade":             grade,
+        "observed_sec":      observed,
+    }
+
+
+def tobler_seconds(distance_m, grade):
+    """Walking time of each window at Tobler's speed for its grade."""
+    kmh = TOBLER_KMH * np.exp(-TOBLER_DECAY * np.abs(grade + TOBLER_OFFSET))
+    return distance_m / (kmh / 3.6)
+
+
+def segments_from_bytes(data, window_m=WINDOW_M):
+    """(features, segment table) of a GPX document; safe for pool workers."""
+    with stage("parse"):
+        track = read_track_arrays(io.BytesIO(data))
+    with stage("features"):
+        feats = compute_features(track)
+    with stage("segments"):
+        return feats, segment_table(track, window_m)
+
+
+def predict_segments(feats, table, window_m=WINDOW_M):
+    """
+    Predicted time and cumulative ETA of every window: the whole-track
+    prediction split in proportion to each window's Tobler time.
+    """
+    with stage("time_model"):
+        X = feature_matrix([feats])[:, :len(TIME_FEATURES)]
+        total = float(time_model(1).predict(scale_matrix(registry.get("scaler"), X))[0])
+
+    cost = tobler_seconds(table["distance_m"], table["grade"])
+    seconds = cost * (total / cost.sum()) if cost.sum() > 0 else np.zeros_like(cost)
+    eta = np.cumsum(seconds)
+    observed = np.cumsum(table["observed_sec"])
+    eta_hm = secs_to_hm_array(eta).tolist()
+    observed_hm = (
+        [None] * observed.size if np.isnan(observed).any() else secs_to_hm_array(observed).tolist()
+    )
+
+    segments = [
+        {
+            "index":              i,
+            "start_m":            round(start, 1),
+            "distance_m":         round(dist, 2),
+            "elevation_delta_m":  round(delta, 2),
+            "uphill_m":           round(up, 2),
+            "downhill_m":         round(down, 2),
+            "grade_pct":          round(grade * 100, 2),
+            "predicted_sec":      round(sec, 1),
+            "eta_sec":            round(t, 1),
+            "eta_hm":             t_hm,
+            "observed_eta_hm":    obs_hm,
+        }
+        for i, (start, dist, delta, up, down, grade, sec, t, t_hm, obs_hm) in enumerate(zip(
+            table["start_m"].tolist(), table["distance_m"].tolist(),
+            table["elevation_delta_m"].tolist(), table["uphill_m"].tolist(),
+            table["downhill_m"].tolist(), table["grade"].tolist(),
+            seconds.tolist(), eta.tolist(), eta_hm, observed_hm,
+        ))
+    ]
+    return {
+        "window_m":              window_m,
+        "predicted_duration_hm": secs_to_hm(total),
+        "segments":              segments,
+    }
+
+
+def analyze_segments(stream, window_m=WINDOW_M):
+    """Segment table plus ETA checkpoints for a GPX upload."""
+    feats, table = segments_from_bytes(stream.read(), window_m)
+    return predict_segments(feats, table, window_m)
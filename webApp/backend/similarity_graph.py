@@ -0,0 +1,194 @@
+# backend/similarity_graph.py
+
+"""
+Precomputed k-nearest-neighbour graph of the whole hike catalogue, so the
+"similar routes" of a catalogue hike are a slice instead of a kNN query.
+
+The graph lives in the difficulty feature space (classifier.py's scaler,
+the space diff_nn and the other indexes search) and is built offline:
+the catalogue is cut into row blocks, and a process pool computes each
+block's distances to the rest of the catalogue column chunk by column
+chunk (||a||^2 + ||b||^2 - 2ab, at most block_mb of distances in memory
+per worker), keeping a running top-k. Workers memory-map the scaled
+matrix from a temporary .npy instead of receiving it. The k winners of
+every row are then re-measured exactly, and a hike is never its own
+neighbour (exact duplicates are).
+
+The result is CSR: neighbours of hike i are indices[indptr[i]:indptr[i+1]]
+(int32, nearest first) with their distances (float32). Pickled with
+joblib, those arrays are memory-mapped by the artifact registry like every
+other model array, so lookups are O(1) and the pages are shared between
+workers.
+
+Rows added later by online_update.py are not in the graph; the pipeline
+answers those with a kNN query until the graph is rebuilt.
+
+  python similarity_graph.py -k 20 --workers 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import joblib
+import numpy as np
+
+
+class SimilarityGraph:
+    """kNN graph of a catalogue in CSR form (indptr, indices, distances)."""
+
+    def __init__(self, indptr, indices, distances):
+        self.indptr    = indptr
+        self.indices   = indices
+        self.distances = distances
+
+    @property
+    def n_rows(self):
+        return self.indptr.size - 1
+
+    def neighbors(self, row, n_neighbors=None):
+        """(indices, distances) of catalogue row `row`, nearest first."""
+        if not 0 <= row < self.n_rows:
+            raise IndexError(f"Hike {row} is not in the graph ({self.n_rows} hikes)")
+        start, end = self.indptr[row], self.indptr[row + 1]
+        if n_neighbors is not None:
+            end = min(end, start + n_neighbors)
+        return self.indices[start:end], self.distances[start:end]
+
+    def as_csr(self):
+        """The graph as a scipy.sparse.csr_matrix of distances."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.distances, self.indices, self.indptr), shape=(self.n_rows, self.n_rows))
+
+
+# ─── block computation (runs in pool workers) ───────────────────────────────
+
+_X = None
+
+
+def _init_worker(matrix_path):
+    global _X
+    _X = np.load(matrix_path, mmap_mode="r")
+
+
+def _block_neighbors(start, stop, k, chunk_cols):
+    """Top-k (indices, exact distances) of rows start:stop against all rows."""
+    X = _X
+    A = np.asarray(X[start:stop], dtype=np.float64)
+    a_sq = (A ** 2).sum(1)[:, None]
+    rows = np.arange(stop - start)
+
+    best_i = np.empty((A.shape[0], 0), dtype=np.int64)
+    best_d = np.empty((A.shape[0], 0))
+    for c0 in range(0, X.shape[0], chunk_cols):
+        B = np.asarray(X[c0:c0 + chunk_cols], dtype=np.float64)
+        d = a_sq + (B ** 2).sum(1)[None, :] - 2 * A @ B.T
+        # Never a hike's own neighbour
+        own = rows + start - c0
+        inside = (own >= 0) & (own < B.shape[0])
+        d[rows[inside], own[inside]] = np.inf
+
+        cand_i = np.hstack([best_i, np.broadcast_to(np.arange(c0, c0 + B.shape[0]), d.shape)])
+        cand_d = np.hstack([best_d, d])
+        if cand_d.shape[1] > k:
+            top = np.argpartition(cand_d, k - 1, axis=1)[:, :k]
+            cand_i = np.take_along_axis(cand_i, top, 1)
+            cand_d = np.take_along_axis(cand_d, top, 1)
+        best_i, best_d = cand_i, cand_d
+
+    # Re-measure the winners directly (the expansion above loses precision)
+    exact = np.sqrt(((X[best_i] - A[:, None, :]) ** 2).sum(2))
+    order = np.argsort(exact, axis=1, kind="stable")
+    return start, np.take_along_axis(best_i, order, 1), np.take_along_axis(exact, order, 1)
+
+
+# ─── build ──────────────────────────────────────────────────────────────────
+
+def build_graph(X, k=20, workers=None, block_mb=64, progress=False):
+    """
+    SimilarityGraph of the k nearest neighbours of every row of the scaled
+    matrix X, computed in row blocks on `workers` processes with at most
+    ~block_mb MB of distances per block.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    n = X.shape[0]
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    if n < 2:
+        raise ValueError(f"A similarity graph needs at least 2 hikes, got {n}")
+    k = min(k, n - 1)
+    workers = workers or os.cpu_count() or 1
+
+    # Blocks of block_rows x chunk_cols float64 distances
+    chunk_cols = min(n, 8192)
+    block_rows = max(1, min(n, (block_mb << 20) // (8 * 2 * chunk_cols)))
+
+    indices   = np.empty((n, k), dtype=np.int32 if n < 2 ** 31 else np.int64)
+    distances = np.empty((n, k), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        matrix_path = os.path.join(tmp, "X.npy")
+        np.save(matrix_path, X)
+
+        blocks = iter(range(0, n, block_rows))
+        done = 0
+        start_t = time.perf_counter()
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(matrix_path,)) as pool:
+            pending = set()
+            while True:
+                # At most two blocks per worker in flight
+                for start in blocks:
+                    pending.add(pool.submit(_block_neighbors, start, min(n, start + block_rows), k, chunk_cols))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, idx, dist = future.result()
+                    indices[start:start + idx.shape[0]] = idx
+                    distances[start:start + idx.shape[0]] = dist
+                    done += idx.shape[0]
+                if progress:
+                    print(f"\r{done}/{n} hikes, {time.perf_counter() - start_t:.1f}s", end="", flush=True)
+        if progress:
+            print()
+
+    indptr = np.arange(0, n * k + 1, k, dtype=np.int64)
+    return SimilarityGraph(indptr, indices.ravel(), distances.ravel())
+
+
+def catalogue_matrix():
+    """The served catalogue in the difficulty feature space."""
+    from artifacts import registry
+    from gpx_pipeline import DIFF_FEATURES, catalogue_columns, scale_matrix
+
+    catalogue = catalogue_columns()
+    raw = np.column_stack([catalogue[c] for c in DIFF_FEATURES]).astype(np.float64)
+    return scale_matrix(registry.get("diff_scaler"), raw)
+
+
+def main():
+    from artifacts import DIFF_GRAPH_PATH
+
+    parser = argparse.ArgumentParser(description="Precompute the catalogue's kNN graph.")
+    parser.add_argument("-k", type=int, default=20, help="neighbours per hike")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--block-mb", type=int, default=64, help="distance block size per worker")
+    parser.add_argument("--out", default=DIFF_GRAPH_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = build_graph(catalogue_matrix(), args.k, args.workers, args.block_mb, progress=True)
+    joblib.dump(graph, args.out + ".tmp")
+    os.replace(args.out + ".tmp", args.out)
+    print(f"Saved {graph.n_rows} hikes x {args.k} neighbours in "
+          f"{time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    # Pickle similarity_graph.SimilarityGraph, not __main__.SimilarityGraph
+    import similarity_graph
+    similarity_graph.main()
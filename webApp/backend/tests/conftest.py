@@ -0,0 +1,11 @@
+# backend/tests/conftest.py
+
+"""Run the tests against the flat backend modules, as app.py imports them."""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR    = os.path.dirname(os.path.dirname(BACKEND_DIR))
+
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,100 @@
+# backend/tests/test_compact_catalogue.py
+
+"""
+CompactCatalogue (compact_catalogue.py) against an exact float64
+NearestNeighbors over the scaled catalogue, within the tolerance its
+docstring documents: distances to ~1e-6, the same neighbours except among
+near-ties, and catalogue values rounded to float32.
+"""
+
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from compact_catalogue import CompactCatalogue
+from gpx_pipeline import DIFF_FEATURES
+
+DIST_TOL = 1e-6
+VALUE_REL_TOL = 6e-8
+
+# Rough magnitudes of length, elevations, climbs, breaks and duration
+SCALES = np.array([12_000, 800, 2_000, 900, 900, 1_800, 14_400])
+
+
+def catalogue(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.gamma(2.0, 0.5, size=(n, len(DIFF_FEATURES))) * SCALES
+
+
+def reference(raw, scaler):
+    return NearestNeighbors(algorithm="brute").fit(scaler.transform(raw))
+
+
+def assert_same_neighbours(store, ref, scaler, raw, Q, k):
+    Xq = scaler.transform(Q)
+    dist, idx = store.kneighbors(Xq, n_neighbors=k)
+    ref_dist, ref_idx = ref.kneighbors(Xq, n_neighbors=k)
+    np.testing.assert_allclose(dist, ref_dist, rtol=0, atol=DIST_TOL)
+
+    # Every returned hike is truly that close; lists differ only on near-ties
+    S = scaler.transform(raw)
+    true = np.sqrt(((S[idx] - Xq[:, None, :]) ** 2).sum(2))
+    np.testing.assert_allclose(true, ref_dist, rtol=0, atol=DIST_TOL)
+    gaps = np.diff(ref_dist, axis=1)
+    clear = np.ones_like(ref_dist, dtype=bool)
+    clear[:, 1:] &= gaps > DIST_TOL
+    clear[:, :-1] &= gaps > DIST_TOL
+    np.testing.assert_array_equal(idx[clear], ref_idx[clear])
+
+
+@pytest.mark.parametrize("scaler_cls", [MinMaxScaler, StandardScaler])
+@pytest.mark.parametrize("n_lists", [0, 24])
+def test_kneighbors_matches_float64(scaler_cls, n_lists):
+    # n_lists 0 scans in blocks, 24 probes the pruning lists
+    raw = catalogue(6000)
+    scaler = scaler_cls().fit(raw)
+    store = CompactCatalogue(n_lists=n_lists).fit(raw, scaler, DIFF_FEATURES)
+    Q = np.r_[catalogue(60, seed=1), raw[:5]]
+    for k in (1, 5, 12):
+        assert_same_neighbours(store, reference(raw, scaler), scaler, raw, Q, k)
+
+
+@pytest.mark.parametrize("n_lists", [0, 24])
+def test_add_rows(n_lists):
+    raw = catalogue(4000)
+    extra = catalogue(300, seed=2)
+    scaler = MinMaxScaler().fit(raw)
+    store = CompactCatalogue(n_lists=n_lists).fit(raw, scaler, DIFF_FEATURES).add(extra)
+    both = np.r_[raw, extra]
+    assert store.n_samples_fit_ == len(both)
+    # Appended rows are their own nearest neighbours
+    assert_same_neighbours(store, reference(both, scaler), scaler, both, extra[:40], 5)
+
+
+def test_columns_are_float32_rounded():
+    raw = catalogue(500)
+    store = CompactCatalogue().fit(raw, MinMaxScaler().fit(raw), DIFF_FEATURES)
+    columns = store.columns()
+    assert columns is store.columns()
+    for j, c in enumerate(DIFF_FEATURES):
+        np.testing.assert_allclose(columns[c], raw[:, j], rtol=VALUE_REL_TOL, atol=0)
+
+
+def test_more_neighbours_than_rows():
+    raw = catalogue(4)
+    scaler = MinMaxScaler().fit(raw)
+    dist, idx = CompactCatalogue().fit(raw, scaler, DIFF_FEATURES).kneighbors(scaler.transform(raw[:1]), 10)
+    assert idx.shape == (1, 4) and idx[0, 0] == 0 and dist[0, 0] == pytest.approx(0, abs=DIST_TOL)
+
+
+def test_names_and_fits():
+    raw = catalogue(6)
+    scaler = MinMaxScaler().fit(raw)
+    names = ["Zugspitze", None, "Säntis", "Zugspitze", "", "Säntis"]
+    store = CompactCatalogue().fit(raw, scaler, DIFF_FEATURES, names).add(catalogue(2, seed=3), ["Säntis", None])
+    assert store.names(range(8)) == names + ["Säntis", None]
+    assert store.name_offsets_.size - 1 == 3
+
+    assert store.fits(scaler)
+    assert not store.fits(MinMaxScaler().fit(raw[:3]))
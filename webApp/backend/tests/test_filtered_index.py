@@ -0,0 +1,79 @@
+# backend/tests/test_filtered_index.py
+
+"""
+PartitionedIndex (filtered_index.py) against a brute-force kNN over the
+rows that pass the same difficulty and range filters.
+"""
+
+import numpy as np
+import pytest
+
+from filtered_index import DIFFICULTY_LABELS, PartitionedIndex
+from gpx_pipeline import DIFF_FEATURES
+
+SCALES = np.array([12_000, 800, 2_000, 900, 900, 1_800, 14_400])
+
+
+def catalogue(n, seed=0):
+    """(scaled, raw, levels) of n synthetic hikes."""
+    rng = np.random.default_rng(seed)
+    raw = rng.gamma(2.0, 0.5, size=(n, len(DIFF_FEATURES))) * SCALES
+    X = (raw - raw.min(0)) / (raw.max(0) - raw.min(0))
+    return X, raw, rng.integers(0, len(DIFFICULTY_LABELS), size=n)
+
+
+def masked_knn(X, raw, levels, x, k, allowed=None, ranges=None):
+    mask = np.ones(len(X), dtype=bool)
+    if allowed is not None:
+        mask &= np.isin(levels, list(allowed))
+    for column, (lo, hi) in (ranges or {}).items():
+        values = raw[:, DIFF_FEATURES.index(column)]
+        if lo is not None:
+            mask &= values >= lo
+        if hi is not None:
+            mask &= values <= hi
+    rows = np.flatnonzero(mask)
+    d = np.sqrt(((X[rows] - x) ** 2).sum(1))
+    top = np.argsort(d, kind="stable")[:k]
+    return d[top], rows[top]
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    X, raw, levels = catalogue(5000)
+    return PartitionedIndex(target_size=64).fit(X, raw, levels, DIFF_FEATURES), X, raw, levels
+
+
+FILTERS = [
+    (None, None),
+    ({2}, None),
+    ({0, 1}, None),
+    (None, {"duration": (None, 4 * 3600)}),
+    (None, {"max_elevation": (800, 1500)}),
+    ({1}, {"length_3d": (5_000, 15_000), "uphill": (300, None)}),
+    ({2}, {"duration": (40_000, None), "length_3d": (None, 3_000)}),   # few or no matches
+]
+
+
+@pytest.mark.parametrize("allowed, ranges", FILTERS)
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_matches_masked_brute_force(fitted, allowed, ranges, k):
+    index, X, raw, levels = fitted
+    queries = np.r_[X[:3], np.random.default_rng(1).uniform(size=(10, X.shape[1]))]
+    for x in queries:
+        dist, idx = index.kneighbors(x, k, levels=allowed, ranges=ranges)
+        ref_dist, ref_idx = masked_knn(X, raw, levels, x, k, allowed, ranges)
+        np.testing.assert_allclose(dist, ref_dist, rtol=1e-12, atol=0)
+        np.testing.assert_array_equal(idx, ref_idx)
+
+
+def test_returns_catalogue_rows(fitted):
+    index, X, _, _ = fitted
+    dist, idx = index.kneighbors(X[123], 1)
+    assert idx.tolist() == [123] and dist[0] == 0
+
+
+def test_rejects_non_positive_n_neighbors(fitted):
+    index, X, _, _ = fitted
+    with pytest.raises(ValueError):
+        index.kneighbors(X[0], 0)
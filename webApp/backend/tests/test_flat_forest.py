@@ -0,0 +1,84 @@
+# backend/tests/test_flat_forest.py
+
+"""
+FlatForest (flat_forest.py) against the RandomForestRegressor it was
+exported from: predictions must match model.predict bit for bit.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from conftest import BACKEND_DIR
+from flat_forest import BY_TREE_MIN_ROWS, FlatForest, export_forest
+
+MODEL_PATH = os.path.join(BACKEND_DIR, "model", "model.pkl")
+
+
+def synthetic_forest(n_rows=600, n_features=6, nan_fraction=0.0, seed=0):
+    """A small fitted forest on noisy non-linear data, and its training inputs."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features)) * rng.uniform(1, 1000, size=n_features)
+    y = np.sin(X[:, 0] / 300) * 3600 + X[:, 1] * 0.5 + rng.normal(scale=60, size=n_rows)
+    if nan_fraction:
+        X[rng.random(X.shape) < nan_fraction] = np.nan
+    model = RandomForestRegressor(n_estimators=25, max_depth=12, random_state=seed)
+    return model.fit(X, y), X
+
+
+def queries(X, n_rows, seed=1):
+    """Rows drawn around the training data, including exact training rows."""
+    rng = np.random.default_rng(seed)
+    picked = X[rng.integers(0, len(X), size=n_rows)]
+    jitter = rng.normal(scale=np.nanstd(X, axis=0), size=picked.shape)
+    return np.where(rng.random(n_rows)[:, None] < 0.3, picked, picked + jitter)
+
+
+@pytest.mark.parametrize("n_rows", [1, 7, BY_TREE_MIN_ROWS - 1, BY_TREE_MIN_ROWS, 3000])
+def test_predict_bit_identical(n_rows):
+    # Both walk strategies (all trees at once, tree by tree) must agree
+    model, X = synthetic_forest()
+    Q = queries(X, n_rows)
+    np.testing.assert_array_equal(export_forest(model).predict(Q), model.predict(Q))
+
+
+def test_predict_with_missing_values():
+    model, X = synthetic_forest(nan_fraction=0.1)
+    for n_rows in (50, BY_TREE_MIN_ROWS + 10):
+        Q = queries(X, n_rows)
+        np.testing.assert_array_equal(export_forest(model).predict(Q), model.predict(Q))
+
+
+def test_apply_matches_sklearn_leaves():
+    model, X = synthetic_forest()
+    Q = queries(X, 200)
+    flat = export_forest(model)
+    # Node ids are offset by each tree's root in the packed arrays
+    ours = flat.apply(Q) - flat.roots[:, None]
+    np.testing.assert_array_equal(ours, model.apply(Q).T)
+
+
+def test_export_round_trip(tmp_path):
+    model, X = synthetic_forest()
+    path = tmp_path / "model_flat.npz"
+    export_forest(model, path)
+    Q = queries(X, 100)
+    np.testing.assert_array_equal(FlatForest.load(path).predict(Q), model.predict(Q))
+
+
+def test_rejects_wrong_shape():
+    model, _ = synthetic_forest(n_features=4)
+    with pytest.raises(ValueError):
+        export_forest(model).predict(np.zeros((3, 5)))
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="model/model.pkl not available")
+def test_bundled_model():
+    import joblib
+
+    model = joblib.load(MODEL_PATH)
+    rng = np.random.default_rng(2)
+    Q = rng.uniform(0, 1, size=(2000, model.n_features_in_)) * rng.uniform(1, 5000, model.n_features_in_)
+    np.testing.assert_array_equal(export_forest(model).predict(Q), model.predict(Q))
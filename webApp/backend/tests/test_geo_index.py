@@ -0,0 +1,121 @@
+# backend/tests/test_geo_index.py
+
+"""
+GeoIndex (geo_index.py) against a brute-force kNN over the hikes whose
+start point lies within the radius and which pass the same filters,
+including queries across the antimeridian and near a pole.
+"""
+
+import numpy as np
+import pytest
+
+from filtered_index import DIFFICULTY_LABELS
+from geo_index import EARTH_RADIUS_KM, GeoIndex
+from gpx_pipeline import DIFF_FEATURES
+
+SCALES = np.array([12_000, 800, 2_000, 900, 900, 1_800, 14_400])
+
+# (lat, lon) centres hikes are scattered around, a few degrees wide
+CENTRES = [(47.3, 11.4), (46.0, 7.7), (-41.2, 174.8), (65.0, 179.8), (-17.5, -179.7), (89.2, 30.0)]
+
+
+def catalogue(n_per_centre=600, seed=0):
+    """(lat, lon, scaled, raw, levels) of hikes around CENTRES, some unlocated."""
+    rng = np.random.default_rng(seed)
+    lat = np.concatenate([c[0] + rng.normal(scale=0.6, size=n_per_centre) for c in CENTRES])
+    lon = np.concatenate([c[1] + rng.normal(scale=1.0, size=n_per_centre) for c in CENTRES])
+    lat = np.clip(lat, -90, 90)
+    lon = (lon + 180) % 360 - 180
+    n = lat.size
+    lat[rng.random(n) < 0.05] = np.nan
+    raw = rng.gamma(2.0, 0.5, size=(n, len(DIFF_FEATURES))) * SCALES
+    X = (raw - raw.min(0)) / (raw.max(0) - raw.min(0))
+    return lat, lon, X, raw, rng.integers(0, len(DIFFICULTY_LABELS), size=n)
+
+
+def great_circle_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def masked_knn(data, x, k, allowed, ranges, qlat, qlon, radius_km):
+    lat, lon, X, raw, levels = data
+    with np.errstate(invalid="ignore"):
+        km = great_circle_km(qlat, qlon, lat, lon)
+        mask = km <= radius_km
+    if allowed is not None:
+        mask &= np.isin(levels, list(allowed))
+    for column, (lo, hi) in (ranges or {}).items():
+        values = raw[:, DIFF_FEATURES.index(column)]
+        mask &= (values >= (-np.inf if lo is None else lo)) & (values <= (np.inf if hi is None else hi))
+    rows = np.flatnonzero(mask)
+    d = np.sqrt(((X[rows] - x) ** 2).sum(1))
+    top = np.argsort(d, kind="stable")[:k]
+    return d[top], rows[top], km[rows[top]]
+
+
+@pytest.fixture(scope="module")
+def data():
+    return catalogue()
+
+
+@pytest.fixture(scope="module", params=[0.1, 0.25, 2.0])
+def index(request, data):
+    lat, lon, X, raw, levels = data
+    return GeoIndex(cell_deg=request.param).fit(lat, lon, X, raw, levels, DIFF_FEATURES)
+
+
+QUERIES = [
+    (47.3, 11.4, 50),
+    (46.5, 9.0, 150),
+    (65.0, -179.9, 80),        # across the antimeridian
+    (-17.5, 179.9, 120),
+    (89.9, -120.0, 200),       # over the pole
+    (0.0, 0.0, 50),            # nothing nearby
+    (47.0, 10.0, 2_000),
+]
+
+FILTERS = [
+    (None, None),
+    ({0}, None),
+    ({1, 2}, {"duration": (None, 4 * 3600), "max_elevation": (500, None)}),
+]
+
+
+@pytest.mark.parametrize("qlat, qlon, radius_km", QUERIES)
+@pytest.mark.parametrize("allowed, ranges", FILTERS)
+def test_matches_masked_brute_force(index, data, qlat, qlon, radius_km, allowed, ranges):
+    X = data[2]
+    rng = np.random.default_rng(1)
+    for x in np.r_[X[:2], rng.uniform(size=(3, X.shape[1]))]:
+        for k in (1, 5, 25):
+            dist, rows, levels, km = index.kneighbors(x, k, allowed, ranges, qlat, qlon, radius_km)
+            ref_dist, ref_rows, ref_km = masked_knn(data, x, k, allowed, ranges, qlat, qlon, radius_km)
+            np.testing.assert_array_equal(rows, ref_rows)
+            np.testing.assert_allclose(dist, ref_dist, rtol=1e-12, atol=0)
+            np.testing.assert_allclose(km, ref_km, rtol=1e-9, atol=1e-9)
+            np.testing.assert_array_equal(levels, data[4][rows])
+
+
+@pytest.mark.parametrize("qlat, qlon, radius_km", QUERIES)
+def test_within(index, data, qlat, qlon, radius_km):
+    lat, lon = data[:2]
+    rows, km = index.within(qlat, qlon, radius_km)
+    with np.errstate(invalid="ignore"):
+        ref = great_circle_km(qlat, qlon, lat, lon)
+        expected = np.flatnonzero(ref <= radius_km)
+    order = np.argsort(rows)
+    np.testing.assert_array_equal(rows[order], expected)
+    np.testing.assert_allclose(km[order], ref[expected], rtol=1e-9, atol=1e-9)
+
+
+def test_unlocated_hikes_are_left_out(index, data):
+    lat = data[0]
+    assert index.rows_.size == np.isfinite(lat).sum()
+    assert index.n_samples_fit_ == lat.size
+
+
+def test_rejects_non_positive_n_neighbors(index, data):
+    with pytest.raises(ValueError):
+        index.kneighbors(data[2][0], 0, None, None, 47.3, 11.4)
@@ -0,0 +1,135 @@
+# backend/tests/test_gpx_features.py
+
+"""
+Parity of the NumPy feature extraction (gpx_features.py) with gpxpy, the
+reference the original analyze_gpx_stream computed every feature with.
+"""
+
+import glob
+import io
+import os
+from datetime import datetime, timedelta, timezone
+
+import gpxpy
+import pytest
+
+from conftest import REPO_DIR
+from gpx_features import HAVERSINE_THRESHOLD, extract_features
+from gpx_pipeline import DIFF_FEATURES
+
+REL_TOL = 1e-9
+ABS_TOL = 1e-6
+
+SAMPLE_FILES = sorted(glob.glob(os.path.join(REPO_DIR, "*.gpx")))
+
+
+def gpxpy_features(data):
+    """DIFF_FEATURES of a GPX document, computed as the original pipeline did."""
+    gpx = gpxpy.parse(io.BytesIO(data))
+    pts = [pt for tr in gpx.tracks for seg in tr.segments for pt in seg.points]
+    duration_obs = gpx.get_duration() or 0
+    uphill, downhill = gpx.get_uphill_downhill()
+    min_elev, max_elev = gpx.get_elevation_extremes()
+    total_time = (pts[-1].time - pts[0].time).total_seconds()
+    return {
+        "length_3d":     gpx.length_3d(),
+        "min_elevation": min_elev,
+        "max_elevation": max_elev,
+        "uphill":        uphill,
+        "downhill":      downhill,
+        "break_time":    max(0.0, total_time - duration_obs),
+        "duration":      duration_obs,
+    }
+
+
+def assert_parity(data):
+    ours = extract_features(io.BytesIO(data))
+    ref  = gpxpy_features(data)
+    assert set(ours) == set(DIFF_FEATURES)
+    for key in DIFF_FEATURES:
+        assert ours[key] == pytest.approx(ref[key], rel=REL_TOL, abs=ABS_TOL), key
+
+
+def point(lat, lon, ele=None, time=None):
+    children = ""
+    if ele is not None:
+        children += f"<ele>{ele}</ele>"
+    if time is not None:
+        children += f"<time>{time}</time>"
+    return f'<trkpt lat="{lat}" lon="{lon}">{children}</trkpt>'
+
+
+def gpx_doc(*tracks):
+    """GPX bytes of tracks given as lists of segments of point() strings."""
+    body = "".join(
+        "<trk>" + "".join("<trkseg>" + "".join(seg) + "</trkseg>" for seg in segments) + "</trk>"
+        for segments in tracks
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">'
+        f"{body}</gpx>"
+    ).encode()
+
+
+def walk(n, lat=47.0, lon=11.0, step=0.0004, ele=1000.0, t0=0, every=30, offset="Z"):
+    """
+    n points heading north-east, climbing and descending, every `every`
+    seconds from t0 seconds after 08:00 UTC, written with `offset`.
+    """
+    tz = timezone.utc if offset == "Z" else datetime.strptime(offset, "%z").tzinfo
+    start = datetime(2024, 6, 1, 8, tzinfo=timezone.utc) + timedelta(seconds=t0)
+    points = []
+    for i in range(n):
+        stamp = (start + timedelta(seconds=i * every)).astimezone(tz).isoformat()
+        points.append(point(lat + i * step, lon + i * step * 0.7, ele + 15 * ((i % 7) - 3),
+                            stamp.replace("+00:00", "Z") if offset == "Z" else stamp))
+    return points
+
+
+@pytest.mark.parametrize("path", SAMPLE_FILES, ids=os.path.basename)
+def test_sample_files(path):
+    with open(path, "rb") as f:
+        assert_parity(f.read())
+
+
+def test_multiple_segments_and_tracks():
+    # Gaps between segments are breaks: no distance, climb or moving time
+    assert_parity(gpx_doc(
+        [walk(20), walk(15, lat=47.01, t0=900)],
+        [walk(10, lat=47.02, t0=1500), walk(1, lat=47.03, t0=2000), walk(12, lat=47.04, t0=2100)],
+    ))
+
+
+def test_missing_elevation():
+    seg = walk(25)
+    for i in (0, 4, 5, 13, 24):
+        seg[i] = seg[i].replace("<ele>", "<!--").replace("</ele>", "-->")
+    assert_parity(gpx_doc([seg, walk(8, lat=47.02, t0=1200)]))
+
+
+def test_missing_interior_and_edge_times():
+    # gpxpy tolerates a missing time on a segment's first or last point
+    seg = walk(20)
+    for i in (0, 7, 8, 19):
+        seg[i] = seg[i].replace("<time>", "<!--").replace("</time>", "-->")
+    first = walk(3, t0=-120)
+    assert_parity(gpx_doc([first, seg, walk(5, lat=47.05, t0=2000)]))
+
+
+def test_haversine_branch():
+    # Consecutive points further apart than the threshold switch to haversine
+    far = HAVERSINE_THRESHOLD * 1.5
+    seg = walk(6) + walk(6, lat=47.0 + far, lon=11.0 + far, t0=600) + walk(4, lon=11.0 - 2 * far, t0=1200)
+    assert_parity(gpx_doc([seg]))
+
+
+def test_non_utc_offsets():
+    assert_parity(gpx_doc([walk(30, offset="+02:00"), walk(10, lat=47.03, t0=1800, offset="-05:30")]))
+
+
+def test_duplicate_points_and_flat_elevation():
+    seg = [point(47.0, 11.0, 500, "2024-06-01T08:00:00Z")] * 3 + [
+        point(47.0 + i * 1e-4, 11.0, 500, f"2024-06-01T08:0{i}:00Z") for i in range(1, 8)
+    ]
+    assert_parity(gpx_doc([seg]))
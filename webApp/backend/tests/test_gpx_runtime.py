@@ -0,0 +1,94 @@
+# backend/tests/test_gpx_runtime.py
+
+"""
+The NumPy-only runtime (gpx_runtime.py) against the scoring path it was
+exported from: Runtime.score and Runtime.analyze must return what
+gpx_pipeline.score_features and analyze_gpx_stream return.
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import BACKEND_DIR, REPO_DIR
+
+SAMPLE_FILES = sorted(glob.glob(os.path.join(REPO_DIR, "*.gpx")))
+
+
+@pytest.fixture(scope="module", autouse=True)
+def model_dir():
+    # Artifact paths are relative to the backend directory, as in app.py
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(BACKEND_DIR)
+        from artifacts import registry
+
+        if not (registry.available("model") or registry.available("model_flat")):
+            pytest.skip("model/model.pkl not available")
+        yield
+
+
+@pytest.fixture(scope="module")
+def runtime(tmp_path_factory):
+    from export_runtime import export_runtime
+    from gpx_runtime import Runtime
+
+    path = str(tmp_path_factory.mktemp("runtime") / "gpx_runtime.json")
+    export_runtime(path)
+    return Runtime.load(path)
+
+
+def sample_rows():
+    from gpx_simplify import extract_features
+
+    rows = []
+    for path in SAMPLE_FILES:
+        with open(path, "rb") as f:
+            rows.append(extract_features(f))
+    return rows
+
+
+def perturbed_rows(rows, n=40, seed=0):
+    """Feature rows scattered around the samples, well inside the catalogue's range."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        base = rows[rng.integers(len(rows))]
+        out.append({k: float(v) * rng.uniform(0.5, 1.5) for k, v in base.items()})
+    return out
+
+
+@pytest.mark.parametrize("n_neighbors", [1, 3, 5])
+def test_score_matches_pipeline(runtime, n_neighbors):
+    from gpx_pipeline import score_features
+
+    rows = sample_rows() + perturbed_rows(sample_rows())
+    assert runtime.score(rows, n_neighbors) == score_features(rows, n_neighbors)
+
+
+@pytest.mark.parametrize("path", SAMPLE_FILES, ids=os.path.basename)
+def test_analyze_matches_pipeline(runtime, path):
+    from gpx_pipeline import analyze_gpx_stream
+
+    with open(path, "rb") as f:
+        expected = analyze_gpx_stream(f)
+    with open(path, "rb") as f:
+        assert runtime.analyze(f) == expected
+
+
+def test_load_rejects_mismatched_manifest(runtime, tmp_path):
+    from gpx_runtime import Runtime
+
+    manifest = dict(runtime.manifest)
+    manifest["arrays"] = {**manifest["arrays"], "kmeans/centers": {"dtype": "float32", "shape": [1, 1]}}
+    np.savez(tmp_path / "gpx_runtime.npz", **runtime.arrays)
+    path = tmp_path / "gpx_runtime.json"
+    path.write_text(json.dumps({**manifest, "npz": "gpx_runtime.npz"}))
+    with pytest.raises(ValueError, match="kmeans/centers"):
+        Runtime.load(str(path))
+
+    path.write_text(json.dumps({**manifest, "format_version": 0}))
+    with pytest.raises(ValueError, match="re-export"):
+        Runtime.load(str(path))
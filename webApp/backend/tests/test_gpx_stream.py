@@ -0,0 +1,75 @@
+# backend/tests/test_gpx_stream.py
+
+"""
+Parity of the bounded-memory streaming reduction (gpx_stream.py) with the
+in-memory features of gpx_features.extract_features, for chunk sizes that
+split tracks at every kind of boundary.
+"""
+
+import glob
+import io
+import os
+
+import pytest
+
+from conftest import REPO_DIR
+from gpx_features import extract_features
+from gpx_pipeline import DIFF_FEATURES
+from gpx_stream import CHUNK_POINTS, stream_features, upload_size
+from test_gpx_features import gpx_doc, point, walk
+
+REL_TOL = 1e-9
+ABS_TOL = 1e-6
+
+SAMPLE_FILES = sorted(glob.glob(os.path.join(REPO_DIR, "*.gpx")))
+
+CHUNK_SIZES = [1, 2, 3, 7, 64, CHUNK_POINTS]
+
+
+def assert_stream_parity(data, chunk_size):
+    ours = stream_features(io.BytesIO(data), chunk_size=chunk_size)
+    ref  = extract_features(io.BytesIO(data))
+    assert set(ours) == set(DIFF_FEATURES)
+    for key in DIFF_FEATURES:
+        assert ours[key] == pytest.approx(ref[key], rel=REL_TOL, abs=ABS_TOL), key
+
+
+@pytest.mark.parametrize("chunk_size", [7, 500, CHUNK_POINTS])
+@pytest.mark.parametrize("path", SAMPLE_FILES, ids=os.path.basename)
+def test_sample_files(path, chunk_size):
+    with open(path, "rb") as f:
+        assert_stream_parity(f.read(), chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_segments_and_tracks(chunk_size):
+    # Chunk boundaries fall on, just before and just after segment breaks
+    assert_stream_parity(gpx_doc(
+        [walk(20), walk(15, lat=47.01, t0=900)],
+        [walk(10, lat=47.02, t0=1500), walk(1, lat=47.03, t0=2000), walk(12, lat=47.04, t0=2100)],
+    ), chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_missing_elevation_and_times(chunk_size):
+    seg = walk(25)
+    for i in (0, 4, 5, 13, 24):
+        seg[i] = seg[i].replace("<ele>", "<!--").replace("</ele>", "-->")
+    for i in (7, 8):
+        seg[i] = seg[i].replace("<time>", "<!--").replace("</time>", "-->")
+    assert_stream_parity(gpx_doc([seg, walk(8, lat=47.02, t0=1200)]), chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_flat_and_duplicate_points(chunk_size):
+    seg = [point(47.0, 11.0, 500, "2024-06-01T08:00:00Z")] * 3 + [
+        point(47.0 + i * 1e-4, 11.0, 500, f"2024-06-01T08:0{i}:00Z") for i in range(1, 8)
+    ]
+    assert_stream_parity(gpx_doc([seg]), chunk_size)
+
+
+def test_upload_size_keeps_position():
+    stream = io.BytesIO(b"x" * 100)
+    stream.seek(10)
+    assert upload_size(stream) == 100
+    assert stream.tell() == 10
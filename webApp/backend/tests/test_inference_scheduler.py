@@ -0,0 +1,110 @@
+# backend/tests/test_inference_scheduler.py
+
+"""
+InferenceScheduler (inference_scheduler.py) with a stand-in score
+function: batching, per-row error isolation, and cancelled or timed-out
+requests.
+"""
+
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from inference_scheduler import InferenceScheduler
+
+WAIT_S = 5
+
+
+class GatedScorer:
+    """Records every batch; a row {"gate": True} blocks until release()."""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.gate    = threading.Event()
+
+    def __call__(self, rows):
+        self.batches.append([row["id"] for row in rows])
+        if any(row.get("gate") for row in rows):
+            self.entered.set()
+            assert self.gate.wait(WAIT_S)
+        if any(row.get("bad") for row in rows):
+            raise ValueError(f"bad row in {[row['id'] for row in rows]}")
+        return [{"id": row["id"], "batch": len(rows)} for row in rows]
+
+    def release(self):
+        self.gate.set()
+
+
+def blocked(scorer, scheduler):
+    """Submit a gating row and wait until the scheduler thread is stuck on it."""
+    future = scheduler.submit({"id": "gate", "gate": True})
+    assert scorer.entered.wait(WAIT_S)
+    return future
+
+
+def test_rows_queued_together_share_batches():
+    scorer = GatedScorer()
+    scheduler = InferenceScheduler(scorer, window_ms=50, max_batch=4)
+    gate = blocked(scorer, scheduler)
+    futures = [scheduler.submit({"id": i}) for i in range(10)]
+    scorer.release()
+
+    results = [f.result(WAIT_S) for f in futures]
+    assert [r["id"] for r in results] == list(range(10))
+    assert gate.result(WAIT_S)["id"] == "gate"
+    assert scorer.batches == [["gate"], [0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert all("queue" in f.stage_times for f in futures)
+
+    stats = scheduler.stats()
+    assert stats["batches"] == 4 and stats["rows"] == 11 and stats["batch_size_max"] == 4
+
+
+def test_bad_row_only_fails_its_own_request():
+    scorer = GatedScorer()
+    scheduler = InferenceScheduler(scorer, window_ms=50)
+    blocked(scorer, scheduler)
+    futures = [scheduler.submit({"id": i, "bad": i == 2}) for i in range(4)]
+    scorer.release()
+
+    for i, future in enumerate(futures):
+        if i == 2:
+            with pytest.raises(ValueError):
+                future.result(WAIT_S)
+        else:
+            assert future.result(WAIT_S) == {"id": i, "batch": 1}
+    # The failed batch, then every row on its own
+    assert scorer.batches[1:] == [[0, 1, 2, 3], [0], [1], [2], [3]]
+
+
+def test_cancelled_rows_are_dropped():
+    scorer = GatedScorer()
+    scheduler = InferenceScheduler(scorer, window_ms=50)
+    blocked(scorer, scheduler)
+    futures = [scheduler.submit({"id": i}) for i in range(3)]
+    assert futures[1].cancel()
+    scorer.release()
+
+    assert futures[0].result(WAIT_S)["id"] == 0
+    assert futures[2].result(WAIT_S)["id"] == 2
+    with pytest.raises(CancelledError):
+        futures[1].result(0)
+    assert scorer.batches[1:] == [[0, 2]]
+
+    # The scheduler thread survived and keeps serving
+    assert scheduler.submit({"id": 3}).result(WAIT_S)["id"] == 3
+
+
+def test_score_times_out_and_drops_the_row():
+    scorer = GatedScorer()
+    scheduler = InferenceScheduler(scorer, window_ms=1)
+    blocked(scorer, scheduler)
+    with pytest.raises(TimeoutError):
+        scheduler.score({"id": "late"}, timeout=0.05)
+    scorer.release()
+
+    timings = {}
+    assert scheduler.score({"id": "next"}, timeout=WAIT_S, timings=timings)["id"] == "next"
+    assert "queue" in timings
+    assert "late" not in sum(scorer.batches, [])
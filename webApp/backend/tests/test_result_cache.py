@@ -0,0 +1,94 @@
+# backend/tests/test_result_cache.py
+
+"""
+ResultCache (result_cache.py) over a throwaway artifact registry: results
+are invalidated when an artifact file changes, the model directory is
+checked at most every check_seconds, and the SQLite tier is shared and
+size-bounded.
+"""
+
+import os
+import tempfile
+
+import joblib
+import pytest
+
+# Importing result_cache opens its module-level cache: not under the cwd
+os.environ.setdefault("GPX_CACHE_DIR", tempfile.mkdtemp(prefix="gpx-cache-"))
+
+import result_cache  # noqa: E402
+from artifacts import ArtifactRegistry  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+STATS = {"length_3d_m": 1234.5, "predicted_difficulty": "Medium"}
+
+
+@pytest.fixture
+def artifact(tmp_path, monkeypatch):
+    """Path of the only artifact of a registry the cache is pointed at."""
+    path = tmp_path / "model" / "model.pkl"
+    path.parent.mkdir()
+    joblib.dump({"version": 1}, path)
+    monkeypatch.setattr(result_cache, "registry", ArtifactRegistry({"model": str(path)}))
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "cache" / "results.sqlite")
+
+
+def test_artifact_change_invalidates_results(artifact, db_path):
+    cache = ResultCache(db_path=db_path, check_seconds=0)
+    old_key = cache.key("abc")
+    cache.put(old_key, STATS)
+    assert cache.get(old_key) == (STATS, "memory")
+
+    # A retrained model: different bytes, so a different size and mtime
+    joblib.dump({"version": 2, "weights": list(range(100))}, artifact)
+    new_key = cache.key("abc")
+    assert new_key != old_key
+    assert cache.get(new_key) == (None, None)
+    # Both tiers were purged, not just keyed around
+    assert cache.get(old_key) == (None, None)
+    assert ResultCache(db_path=db_path, check_seconds=0).get(old_key) == (None, None)
+
+
+def test_fingerprint_checked_at_most_every_check_seconds(artifact, db_path, monkeypatch):
+    calls = []
+    refresh = result_cache.registry.refresh
+    monkeypatch.setattr(result_cache.registry, "refresh", lambda: calls.append(1) or refresh())
+
+    cache = ResultCache(db_path=db_path, check_seconds=3600)
+    key = cache.key("abc")
+    joblib.dump({"version": 2, "weights": list(range(100))}, artifact)
+    assert [cache.key("abc") for _ in range(5)] == [key] * 5
+    assert len(calls) == 1
+
+    cache._checked -= 3600
+    assert cache.key("abc") != key
+    assert len(calls) == 2
+
+
+def test_disk_tier_is_shared(artifact, db_path):
+    writer = ResultCache(db_path=db_path, check_seconds=0)
+    key = writer.key("abc")
+    writer.put(key, STATS)
+
+    reader = ResultCache(db_path=db_path, check_seconds=0)
+    assert reader.key("abc") == key
+    assert reader.get(key) == (STATS, "disk")
+    assert reader.get(key) == (STATS, "memory")
+
+
+def test_lru_bounds(artifact, db_path):
+    cache = ResultCache(db_path=db_path, memory_items=2, disk_bytes=300, check_seconds=0)
+    keys = [cache.key(f"hash{i}") for i in range(6)]
+    for key in keys:
+        cache.put(key, STATS)
+    assert list(cache._memory) == keys[-2:]
+
+    fresh = ResultCache(db_path=db_path, check_seconds=0)
+    fresh.key("hash0")
+    found = [key for key in keys if fresh.get(key)[0] is not None]
+    assert 0 < len(found) < len(keys) and found == keys[-len(found):]